@@ -73,3 +73,39 @@ product_detail_code_schema = openapi.Schema(
     },
     required=["product_id"],
 )
+
+facet_count_schema = openapi.Schema(
+    type=openapi.TYPE_OBJECT,
+    properties={
+        "id": openapi.Schema(type=openapi.TYPE_INTEGER),
+        "count": openapi.Schema(type=openapi.TYPE_INTEGER),
+    },
+)
+
+price_facet_schema = openapi.Schema(
+    type=openapi.TYPE_OBJECT,
+    properties={
+        "min_price": openapi.Schema(type=openapi.TYPE_STRING, x_nullable=True),
+        "max_price": openapi.Schema(type=openapi.TYPE_STRING, x_nullable=True),
+        "price_to": openapi.Schema(type=openapi.TYPE_STRING, x_nullable=True),
+        "count": openapi.Schema(type=openapi.TYPE_INTEGER),
+    },
+)
+
+product_facets_code_schema = openapi.Schema(
+    type=openapi.TYPE_OBJECT,
+    properties={
+        "shops": openapi.Schema(
+            type=openapi.TYPE_ARRAY, items=facet_count_schema
+        ),
+        "categories": openapi.Schema(
+            type=openapi.TYPE_ARRAY, items=facet_count_schema
+        ),
+        "manufacturers": openapi.Schema(
+            type=openapi.TYPE_ARRAY, items=facet_count_schema
+        ),
+        "prices": openapi.Schema(
+            type=openapi.TYPE_ARRAY, items=price_facet_schema
+        ),
+    },
+)
@@ -0,0 +1,33 @@
+from rest_framework import serializers
+
+
+class ReferenceRelatedField(serializers.SlugRelatedField):
+    """
+    Связанное поле для справочников из main.reference.
+    Представление и поиск записи выполняются по кэшу справочника,
+    поэтому для каждого объекта не нужен запрос к связанной таблице.
+    """
+
+    def __init__(self, reference, slug_field="pk", **kwargs):
+        self.reference = reference
+        if not kwargs.get("read_only"):
+            kwargs.setdefault("queryset", reference.model.objects.all())
+        super().__init__(slug_field=slug_field, **kwargs)
+
+    def use_pk_only_optimization(self):
+        # Достаточно id связанного объекта, сам объект берем из справочника
+        return True
+
+    def to_representation(self, obj):
+        related = self.reference.get(obj.pk)
+        if related is None:
+            return None
+        return getattr(related, self.slug_field)
+
+    def to_internal_value(self, data):
+        related = self.reference.get_by(self.slug_field, data)
+        if related is None:
+            self.fail(
+                "does_not_exist", slug_name=self.slug_field, value=str(data)
+            )
+        return related
@@ -0,0 +1,19 @@
+from rest_framework import filters
+
+
+class ProductSearchFilter(filters.SearchFilter):
+    """
+    Полнотекстовый поиск товаров по сохраненному поисковому вектору.
+    Результаты сортируются по релевантности, если не передан ordering.
+    """
+
+    def filter_queryset(self, request, queryset, view):
+        search_terms = self.get_search_terms(request)
+        if not search_terms:
+            return queryset
+        search_text = " ".join(search_terms)
+        return (
+            queryset.search(search_text)
+            .with_search_rank(search_text)
+            .order_by("-rank")
+        )
@@ -1,4 +1,9 @@
-from rest_framework.pagination import PageNumberPagination
+from django.core.paginator import InvalidPage
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import CursorPagination, PageNumberPagination
+from rest_framework.utils.urls import replace_query_param
+
+from main.pagination import KeysetPaginator
 
 
 class ProductsPagination(PageNumberPagination):
@@ -11,3 +16,41 @@ class ReviewsPagination(PageNumberPagination):
 
 class CategoryManufacturerPagination(PageNumberPagination):
     page_size = 5
+
+
+class KeysetPagination(CursorPagination):
+    """
+    Пагинация по ключу для списковых эндпоинтов API.
+    Сортировка берется из уже упорядоченного QuerySet (OrderingFilter,
+    get_queryset или Meta.ordering модели), к ней добавляется id.
+    Размер страницы задается параметром limit.
+    """
+
+    page_size_query_param = "limit"
+    max_page_size = 100
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.page_size = self.get_page_size(request)
+        self.base_url = request.build_absolute_uri()
+        paginator = KeysetPaginator(queryset, self.page_size)
+        try:
+            self.page = paginator.page(
+                request.query_params.get(self.cursor_query_param)
+            )
+        except InvalidPage:
+            raise NotFound(self.invalid_cursor_message)
+        return self.page.object_list
+
+    def get_next_link(self):
+        if not self.page.has_next():
+            return None
+        return replace_query_param(
+            self.base_url, self.cursor_query_param, self.page.next_cursor
+        )
+
+    def get_previous_link(self):
+        if not self.page.has_previous():
+            return None
+        return replace_query_param(
+            self.base_url, self.cursor_query_param, self.page.previous_cursor
+        )
@@ -1,8 +1,11 @@
+from django.conf import settings
 from django.contrib.auth import get_user_model
 from rest_framework import permissions
 
 User = get_user_model()
 
+partner_group = getattr(settings, "API_PARTNER_GROUP", "partners")
+
 
 class IsAdminStaffOwnerReadOnly(permissions.IsAuthenticatedOrReadOnly):
     """
@@ -27,3 +30,16 @@ class IsOwner(permissions.IsAuthenticated):
         return (
             obj.user == request.user
         )
+
+
+class IsPartner(permissions.IsAuthenticated):
+    """
+    Доступ разрешен только сотрудникам и пользователям
+    из группы партнеров (API_PARTNER_GROUP).
+    """
+
+    def has_permission(self, request, view):
+        return super().has_permission(request, view) and (
+            request.user.is_staff
+            or request.user.groups.filter(name=partner_group).exists()
+        )
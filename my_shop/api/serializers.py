@@ -1,24 +1,31 @@
-from collections import defaultdict
-
 from django.contrib.auth import authenticate, get_user_model
 from django.contrib.auth.hashers import make_password
 from django.contrib.auth.validators import UnicodeUsernameValidator
+from django.core.exceptions import ValidationError as DjangoValidationError
 from django.core.mail import send_mail
 from django.db import transaction
-from django.db.models import Sum
-from django.shortcuts import get_object_or_404
+from django.http import Http404
 from rest_framework import serializers
 
+from api.fields import ReferenceRelatedField
 from api.models import EmailCode
 from api.orders_utils import update_user_info
-from main.models import (Category, ColorProduct, ColorProductShop, Country,
-                         Manufacturer, Product, Review, Shop)
+from main.availability import load_availability
+from main.models import (Category, ColorProduct, Manufacturer, Product,
+                         ProductStats, Review)
+from main.page_cache import invalidate_product_pages
+from main.reference import (categories, countries, get_warehouse,
+                            manufacturers, shops)
+from orders.batch import create_orders
 from orders.models import Order, OrderProduct
-from orders.utils import get_available_products, prepare_order_products
+from orders.reservations import reserve_cart
+from orders.utils import (decrement_cart_stock, get_order_totals,
+                          get_shortage_message, prepare_order_products)
 from shopping_cart.models import ShoppingCart
 from users.constants import (CONFIRMATION_CODE_MAX_LENGTH, PASSWORD_MAX_LENGTH,
                              USERNAME_MAX_LENGTH)
 from users.user_auth_utils import create_confirmation_code
+from users.validators import validate_phone_number
 
 User = get_user_model()
 
@@ -112,9 +119,7 @@ class CategorySerializer(serializers.ModelSerializer):
 class ManufacturerSerializer(serializers.ModelSerializer):
     """Сериализатор для производителей."""
 
-    country = serializers.SlugRelatedField(
-        queryset=Country.objects.all(), slug_field="name"
-    )
+    country = ReferenceRelatedField(countries, slug_field="name")
 
     class Meta:
         model = Manufacturer
@@ -124,12 +129,9 @@ class ManufacturerSerializer(serializers.ModelSerializer):
 class ProductsListSerializer(serializers.ModelSerializer):
     """Сериализатор для списка товаров."""
 
-    category = serializers.SlugRelatedField(
-        queryset=Category.objects.all(), slug_field="name"
-    )
-    manufacturer = serializers.SlugRelatedField(
-        queryset=Manufacturer.objects.all(), slug_field="name"
-    )
+    # Названия категории и производителя берутся из кэша справочников
+    category = ReferenceRelatedField(categories, slug_field="name")
+    manufacturer = ReferenceRelatedField(manufacturers, slug_field="name")
     num_shop = serializers.IntegerField()
     num_products = serializers.IntegerField()
     rating = serializers.FloatField()
@@ -159,7 +161,8 @@ class ProductDetailSerializer(ProductsListSerializer):
     offline_shops_data = serializers.SerializerMethodField()
     internet_shop_data = serializers.SerializerMethodField()
     reviews_count = serializers.IntegerField(read_only=True)
-    average_rating = serializers.IntegerField(read_only=True)
+    # Рейтинг берется из ProductStats, а не из свойства модели
+    average_rating = serializers.IntegerField(source="rating", read_only=True)
 
     class Meta:
         model = Product
@@ -178,61 +181,29 @@ class ProductDetailSerializer(ProductsListSerializer):
             "reviews_count",
         )
 
+    def get_availability(self, obj):
+        """
+        Наличие товара из контекста сериализатора: представление загружает
+        его сразу для всех товаров (см. ProductsViewSet.get_availability).
+        """
+        availability = self.context.get("availability", {}).get(obj.id)
+        if availability is None:
+            availability = load_availability([obj.id])[obj.id]
+        return availability
+
     def get_offline_shops_data(self, obj):
         """
         Получаем данные о наличии товаров и их цвете
         в оффлайн магазинах.
         """
-        grouped_data = defaultdict(list)
-        for colorproductshop in (
-            ColorProductShop.objects.filter(
-                colorproduct__product=obj, quantity__gt=0
-            )
-            .exclude(shop__name__icontains="Склад")
-            .select_related("shop", "colorproduct", "colorproduct__color")
-        ):
-            grouped_data[colorproductshop.colorproduct].append(
-                {
-                    "shop": colorproductshop.shop.name,
-                    "shop_id": colorproductshop.shop.id,
-                    "quantity": colorproductshop.quantity,
-                }
-            )
-
-        offline_shops_data = [
-            {
-                "color": colorproduct.color.name,
-                "color_id": colorproduct.color.id,
-                "items": items,
-            }
-            for colorproduct, items in grouped_data.items()
-        ]
-
-        return offline_shops_data
+        return self.get_availability(obj).offline_shops_data()
 
     def get_internet_shop_data(self, obj):
         """
         Получаем данные о наличии товаров и их цвете
         на складе интернет магазина.
         """
-        get_data = (
-            ColorProduct.objects.filter(
-                product=obj,
-                colorproductshop__shop__name__icontains="Склад",
-                colorproductshop__quantity__gt=0,
-            )
-            .select_related("color")
-            .annotate(total=Sum("colorproductshop__quantity"))
-        )
-        internet_shop_data = [
-            {
-                "color": item.color.name,
-                "color_id": item.color.id,
-                "quantity": item.total,
-            }
-            for item in get_data
-        ]
-        return list(internet_shop_data)
+        return self.get_availability(obj).internet_shop_data()
 
 
 class ReviewSerializer(serializers.ModelSerializer):
@@ -263,26 +234,33 @@ class ShoppingCartCreateSerializer(serializers.ModelSerializer):
     """Сериализатор для добавления нового товара в корзину."""
 
     user = serializers.HiddenField(default=serializers.CurrentUserDefault())
+    quantity = serializers.IntegerField(max_value=32767, min_value=1)
 
     class Meta:
         model = ShoppingCart
         fields = ("id", "colorproduct", "quantity", "user")
         read_only_fields = ("id",)
+        # Повторное добавление товара увеличивает количество,
+        # поэтому проверка unique_together не нужна
+        validators = []
 
     def create(self, validated_data):
-        """Добавляем поле product при создании."""
-        colorproduct = validated_data.get("colorproduct")
-        quantity = validated_data.get("quantity")
-        user = validated_data.get("user")
-        product = colorproduct.product
-
-        cart = ShoppingCart.objects.create(
+        """
+        Добавляем товар одним запросом INSERT ... ON CONFLICT DO UPDATE:
+        если товар уже есть в корзине, увеличиваем количество.
+        """
+        colorproduct = validated_data["colorproduct"]
+        user = validated_data["user"]
+        cart_id, product_id, quantity = ShoppingCart.objects.add_item(
+            colorproduct.id, validated_data["quantity"], user=user
+        )
+        return ShoppingCart(
+            id=cart_id,
             colorproduct=colorproduct,
+            product_id=product_id,
             quantity=quantity,
             user=user,
-            product=product,
         )
-        return cart
 
 
 class ShoppingCartUpdateSerializer(serializers.ModelSerializer):
@@ -302,6 +280,9 @@ class ShoppingCartListSerializer(serializers.ModelSerializer):
     color = serializers.SerializerMethodField()
     product_name = serializers.SerializerMethodField()
     actual_price = serializers.SerializerMethodField()
+    line_price = serializers.DecimalField(
+        max_digits=12, decimal_places=2, read_only=True
+    )
 
     class Meta:
         model = ShoppingCart
@@ -313,6 +294,7 @@ class ShoppingCartListSerializer(serializers.ModelSerializer):
             "color",
             "actual_price",
             "quantity",
+            "line_price",
         )
 
     def get_color(self, obj):
@@ -328,6 +310,63 @@ class ShoppingCartListSerializer(serializers.ModelSerializer):
         return obj.product.actual_price
 
 
+class ShoppingCartBatchItemSerializer(serializers.Serializer):
+    """Сериализатор для одной операции пакетного изменения корзины."""
+
+    colorproduct = serializers.IntegerField(min_value=1)
+    quantity = serializers.IntegerField(min_value=0, max_value=32767)
+
+
+class ShoppingCartBatchSerializer(serializers.Serializer):
+    """
+    Сериализатор для пакетного изменения корзины: для каждого товара цвета
+    устанавливается указанное количество, при количестве 0 позиция удаляется.
+    """
+
+    items = ShoppingCartBatchItemSerializer(many=True, allow_empty=False)
+
+    def validate_items(self, items):
+        """Проверяем существование всех товаров цвета одним запросом."""
+        limit = self.context["batch_limit"]
+        if len(items) > limit:
+            raise serializers.ValidationError(
+                f"Не более {limit} операций за запрос."
+            )
+        quantities = {}
+        for item in items:
+            if item["colorproduct"] in quantities:
+                raise serializers.ValidationError(
+                    f"Товар цвета {item['colorproduct']} указан несколько раз."
+                )
+            quantities[item["colorproduct"]] = item["quantity"]
+        existing = set(
+            ColorProduct.objects.filter(id__in=quantities).values_list(
+                "id", flat=True
+            )
+        )
+        missing = sorted(set(quantities) - existing)
+        if missing:
+            raise serializers.ValidationError(
+                f"Товары цвета не найдены: {missing}."
+            )
+        return quantities
+
+    def create(self, validated_data):
+        """Применяем все операции одним INSERT ... ON CONFLICT и DELETE."""
+        user = self.context["request"].user
+        ShoppingCart.objects.set_items(validated_data["items"], user=user)
+        return validated_data
+
+
+class ShoppingCartTotalsSerializer(serializers.Serializer):
+    """Сериализатор для итогов корзины."""
+
+    lines = serializers.IntegerField()
+    total_quantity = serializers.IntegerField()
+    total_price = serializers.DecimalField(max_digits=12, decimal_places=2)
+    total_saving = serializers.DecimalField(max_digits=12, decimal_places=2)
+
+
 class UserSerializer(serializers.ModelSerializer):
     """Сериализатор для модели пользователя."""
 
@@ -345,9 +384,7 @@ class OrderCreateSerializer(serializers.ModelSerializer):
     delivery_adress = serializers.CharField(
         max_length=150, min_length=3, required=False
     )
-    shop = serializers.PrimaryKeyRelatedField(
-        queryset=Shop.objects.all(), required=False
-    )
+    shop = ReferenceRelatedField(shops, required=False)
     requires_delivery = serializers.BooleanField(required=True)
     user = UserSerializer()
 
@@ -368,8 +405,8 @@ class OrderCreateSerializer(serializers.ModelSerializer):
 
     def validate(self, data):
         """
-        Проверяем, что у пользователя добавлены товары в корзину,
-        и нужное количество каждого товара есть в выбранном магазине.
+        Проверяем, что у пользователя добавлены товары в корзину.
+        Наличие товаров проверяется при списании в create.
         """
         user = self.context.get("request").user
         carts = ShoppingCart.objects.filter(user=user)
@@ -382,27 +419,14 @@ class OrderCreateSerializer(serializers.ModelSerializer):
         requires_delivery = data["requires_delivery"]
 
         if requires_delivery:
-            shop = get_object_or_404(Shop, name__icontains="Склад")
+            shop = get_warehouse()
+            if shop is None:
+                raise Http404("Склад интернет-магазина не найден.")
         else:
             shop = data["shop"]
 
-        product_quantities = get_available_products(user=user, shop=shop)
-        for item in carts:
-            product_quantity = product_quantities.get(item.colorproduct_id)
-            # Проверяем доступен ли конкретный товар в выбранном магазине
-            if not product_quantity:
-                raise serializers.ValidationError(
-                    f"В выбранном магазине товар {item.product} \
-                    {item.colorproduct} отсутствует. Выберите другой магазин."
-                )
-            if product_quantity.total < item.quantity:
-                raise serializers.ValidationError(
-                    f"Недостаточное количество товаров: {item.product}: \
-                    {item.colorproduct}. В наличии: {product_quantity.total}"
-                )
         # Добаляем данные, чтобы не запрашивать их в методах create заново
         data["carts"] = carts
-        data["product_quantities"] = product_quantities
         data["shop"] = shop
         return data
 
@@ -411,8 +435,9 @@ class OrderCreateSerializer(serializers.ModelSerializer):
         user = self.context.get("request").user
         requires_delivery = validated_data["requires_delivery"]
         payment_on_get = validated_data["payment_on_get"]
-        carts = validated_data["carts"]
-        product_quantities = validated_data["product_quantities"]
+        carts = validated_data["carts"].select_related(
+            "product", "colorproduct"
+        )
         shop = validated_data["shop"]
 
         # Сохраняем данные в модель пользователя,
@@ -426,6 +451,7 @@ class OrderCreateSerializer(serializers.ModelSerializer):
             "requires_delivery": requires_delivery,
             "shop": shop,
             "payment_on_get": payment_on_get,
+            **get_order_totals(carts.totals()),
         }
         if requires_delivery:
             order_data["delivery_city"] = validated_data["delivery_city"]
@@ -433,13 +459,18 @@ class OrderCreateSerializer(serializers.ModelSerializer):
         order = Order.objects.create(**order_data)
 
         # Формируем список товаров для этого заказа
-        # и список нового наличия в магазинах
-        orderproduct, shop_quantity = prepare_order_products(
-            carts, product_quantities, order
-        )
-
-        # Обновляем наличие в магазинах для всех позиций в заказе
-        ColorProductShop.objects.bulk_update(shop_quantity, ["quantity"])
+        orderproduct = prepare_order_products(carts, order)
+
+        # Списываем все позиции в выбранном магазине одним условным UPDATE:
+        # при нехватке товара транзакция откатывается
+        try:
+            decrement_cart_stock(carts, shop, user)
+        except DjangoValidationError as error:
+            raise serializers.ValidationError(error.messages)
+        # UPDATE не вызывает сигналы,
+        # поэтому пересчитываем статистику товаров явно
+        ProductStats.objects.refresh(carts.values("product_id"))
+        invalidate_product_pages(carts.values("product_id"))
 
         # Создаем записи в БД для всех позиций в заказе
         OrderProduct.objects.bulk_create(orderproduct)
@@ -450,6 +481,196 @@ class OrderCreateSerializer(serializers.ModelSerializer):
         return order
 
 
+class OrderReserveSerializer(serializers.Serializer):
+    """
+    Сериализатор для резерва товаров корзины на время оформления заказа:
+    на складе интернет-магазина (при доставке) или в выбранном магазине.
+    """
+
+    requires_delivery = serializers.BooleanField(write_only=True)
+    shop = ReferenceRelatedField(shops, required=False, write_only=True)
+    expires_at = serializers.DateTimeField(read_only=True)
+    shortages = serializers.ListField(
+        child=serializers.CharField(), read_only=True
+    )
+
+    def validate(self, data):
+        if data["requires_delivery"]:
+            data["shop"] = get_warehouse()
+            if data["shop"] is None:
+                raise Http404("Склад интернет-магазина не найден.")
+        elif not data.get("shop"):
+            raise serializers.ValidationError({"shop": "Выберите магазин."})
+        return data
+
+    def create(self, validated_data):
+        user = self.context["request"].user
+        carts = ShoppingCart.objects.filter(user=user).select_related(
+            "product", "colorproduct__color"
+        )
+        expires_at, shortages = reserve_cart(
+            user, validated_data["shop"], carts
+        )
+        return {
+            "expires_at": expires_at,
+            "shortages": [
+                get_shortage_message(item, shortages[item.colorproduct_id])
+                for item in carts
+                if item.colorproduct_id in shortages
+            ],
+        }
+
+
+class OrderBatchLineSerializer(serializers.Serializer):
+    """Сериализатор для позиции заказа в пакетном создании заказов."""
+
+    colorproduct = serializers.IntegerField(min_value=1)
+    quantity = serializers.IntegerField(min_value=1, max_value=32767)
+
+
+class OrderBatchItemSerializer(serializers.Serializer):
+    """
+    Сериализатор для одного заказа в пакетном создании заказов:
+    состав заказа передается явно, корзина пользователя не используется.
+    """
+
+    reference = serializers.CharField(max_length=100, required=False)
+    phone = serializers.CharField(
+        max_length=20, required=False, validators=(validate_phone_number,)
+    )
+    requires_delivery = serializers.BooleanField()
+    delivery_city = serializers.CharField(
+        max_length=30, min_length=3, required=False
+    )
+    delivery_adress = serializers.CharField(
+        max_length=150, min_length=3, required=False
+    )
+    shop = ReferenceRelatedField(shops, required=False)
+    payment_on_get = serializers.BooleanField(default=False)
+    items = OrderBatchLineSerializer(many=True, allow_empty=False)
+
+    def validate_items(self, items):
+        quantities = {}
+        for item in items:
+            if item["colorproduct"] in quantities:
+                raise serializers.ValidationError(
+                    f"Товар цвета {item['colorproduct']} указан несколько раз."
+                )
+            quantities[item["colorproduct"]] = item["quantity"]
+        return quantities
+
+    def validate(self, data):
+        data.setdefault("phone", self.context["request"].user.phone)
+        if not data["phone"]:
+            raise serializers.ValidationError({"phone": "Укажите телефон."})
+        if data["requires_delivery"]:
+            for field in ("delivery_city", "delivery_adress"):
+                if not data.get(field):
+                    raise serializers.ValidationError(
+                        {field: "Обязательное поле при доставке."}
+                    )
+            data["shop"] = get_warehouse()
+            if data["shop"] is None:
+                raise Http404("Склад интернет-магазина не найден.")
+        elif not data.get("shop"):
+            raise serializers.ValidationError({"shop": "Выберите магазин."})
+        return data
+
+
+class OrderBatchSerializer(serializers.Serializer):
+    """
+    Сериализатор для пакетного создания заказов. Заказы проверяются
+    и создаются независимо: ошибка в одном заказе не мешает остальным,
+    результат возвращается по каждому заказу.
+    """
+
+    orders = serializers.ListField(
+        child=serializers.DictField(), allow_empty=False
+    )
+
+    def validate_orders(self, orders):
+        limit = self.context["batch_limit"]
+        if len(orders) > limit:
+            raise serializers.ValidationError(
+                f"Не более {limit} заказов за запрос."
+            )
+        return orders
+
+    def create(self, validated_data):
+        """
+        Проверяем каждый заказ, затем создаем все корректные заказы
+        одним пакетом (create_orders). Возвращает результаты в порядке
+        заказов в запросе.
+        """
+        results = []
+        valid = []
+        for index, data in enumerate(validated_data["orders"]):
+            serializer = OrderBatchItemSerializer(
+                data=data, context=self.context
+            )
+            result = {"index": index, "reference": data.get("reference")}
+            if serializer.is_valid():
+                valid.append((result, serializer.validated_data))
+            else:
+                result.update(status="failed", errors=serializer.errors)
+            results.append(result)
+
+        user = self.context["request"].user
+        created = create_orders(user, [data for _, data in valid])
+        for (result, _), outcome in zip(valid, created):
+            if "order" in outcome:
+                result.update(
+                    status="created",
+                    order=OrderListSerializer(outcome["order"]).data,
+                )
+            else:
+                result.update(status="failed", errors=outcome["errors"])
+        return {"results": results}
+
+    def to_representation(self, instance):
+        return instance
+
+
+class FulfilmentLineSerializer(serializers.Serializer):
+    """Сериализатор для позиции корзины в плане выполнения заказа."""
+
+    colorproduct = serializers.IntegerField(source="item.colorproduct_id")
+    product = serializers.CharField(source="item.product.name")
+    color = serializers.CharField(source="item.colorproduct.color.name")
+    quantity = serializers.IntegerField(source="item.quantity")
+    available = serializers.IntegerField()
+
+
+class ShopCoverageSerializer(serializers.Serializer):
+    """Сериализатор для покрытия корзины магазином."""
+
+    shop = serializers.IntegerField(source="shop.pk")
+    name = serializers.CharField(source="shop.name")
+    delivery = serializers.BooleanField()
+    full = serializers.BooleanField()
+    covered = serializers.IntegerField()
+    missing = FulfilmentLineSerializer(many=True)
+
+
+class FulfilmentSplitSerializer(serializers.Serializer):
+    """Сериализатор для части корзины при разбиении по магазинам."""
+
+    shop = serializers.IntegerField(source="shop.pk")
+    name = serializers.CharField(source="shop.name")
+    items = FulfilmentLineSerializer(many=True)
+
+
+class FulfilmentPlanSerializer(serializers.Serializer):
+    """
+    Сериализатор для плана выполнения корзины: магазины по покрытию
+    и разбиение по магазинам, если ни один не подходит целиком.
+    """
+
+    shops = ShopCoverageSerializer(many=True)
+    split = FulfilmentSplitSerializer(many=True)
+    unavailable = FulfilmentLineSerializer(many=True)
+
+
 class OrderProductSerializer(serializers.ModelSerializer):
     """Сериализатор для товаров в заказе"""
 
@@ -482,6 +703,9 @@ class OrderRetriveSerializer(serializers.ModelSerializer):
             "payment_on_get",
             "is_paid",
             "status",
+            "total_quantity",
+            "total_price",
+            "total_saving",
             "orderedproducts",
         ]
 
@@ -509,4 +733,7 @@ class OrderListSerializer(serializers.ModelSerializer):
             "payment_on_get",
             "is_paid",
             "status",
+            "total_quantity",
+            "total_price",
+            "total_saving",
         ]
@@ -1,36 +1,56 @@
+from django.conf import settings
 from django.contrib.auth import get_user_model
-from django.db.models import Avg, Count, OuterRef, Subquery, Sum
+from django.db import transaction
+from django.db.models import F
 from django.shortcuts import get_object_or_404
 from django.utils.decorators import method_decorator
 from django_filters.rest_framework import DjangoFilterBackend
+from django_filters.utils import translate_validation
 from drf_yasg import openapi
 from drf_yasg.utils import swagger_auto_schema
 from rest_framework import filters, status, viewsets
-from rest_framework.decorators import api_view, permission_classes
+from rest_framework.decorators import action, api_view, permission_classes
+from rest_framework.exceptions import ValidationError
 from rest_framework.pagination import LimitOffsetPagination
 from rest_framework.permissions import AllowAny, IsAuthenticated
 from rest_framework.response import Response
 
-from api.code_schemas import product_detail_code_schema
+from api.code_schemas import (product_detail_code_schema,
+                              product_facets_code_schema)
+from api.filters import ProductSearchFilter
 from api.mixins import ListRetrieveViewSet, ListViewSet
-from api.permissions import IsAdminStaffOwnerReadOnly, IsOwner
+from api.pagination import KeysetPagination
+from api.permissions import IsAdminStaffOwnerReadOnly, IsOwner, IsPartner
 from api.serializers import (CategorySerializer, EmailCodeSerializer,
-                             GetTokenSerializer, ManufacturerSerializer,
+                             FulfilmentPlanSerializer, GetTokenSerializer,
+                             ManufacturerSerializer, OrderBatchSerializer,
                              OrderCreateSerializer, OrderListSerializer,
-                             OrderRetriveSerializer, ProductDetailSerializer,
-                             ProductsListSerializer, ReviewSerializer,
+                             OrderReserveSerializer, OrderRetriveSerializer,
+                             ProductDetailSerializer, ProductsListSerializer,
+                             ReviewSerializer, ShoppingCartBatchSerializer,
                              ShoppingCartCreateSerializer,
                              ShoppingCartListSerializer,
+                             ShoppingCartTotalsSerializer,
                              ShoppingCartUpdateSerializer,
                              UserRegistrationSerializer)
 from api.user_auth_utils import get_tokens_for_user
+from main.availability import get_availability_many
+from main.facets import ProductFacets, facets_to_list
 from main.filters import ProductFilter
-from main.models import Category, ColorProductShop, Manufacturer, Product
-from orders.models import Order
+from main.models import Category, Manufacturer, Product
+from main.reference import get_retail_shops, get_warehouse
+from main.utils import get_query_cache_key, get_request_fingerprint
+from orders.models import IdempotencyKey, Order
+from orders.planner import plan_fulfilment
 from shopping_cart.models import ShoppingCart
+from shopping_cart.storage import merge_anonymous_cart
 
 User = get_user_model()
 
+products_batch_limit = getattr(settings, "API_PRODUCTS_BATCH_LIMIT", 100)
+cart_batch_limit = getattr(settings, "API_CART_BATCH_LIMIT", 100)
+order_batch_limit = getattr(settings, "API_ORDER_BATCH_LIMIT", 100)
+
 
 @swagger_auto_schema(
     method="post", request_body=EmailCodeSerializer, security=[]
@@ -73,6 +93,8 @@ def get_token(request):
     user = get_object_or_404(
         User, username=serializer.validated_data["username"]
     )
+    # Как и при входе на сайте, переносим корзину анонимной сессии
+    merge_anonymous_cart(request.session.session_key, user)
     token = get_tokens_for_user(user)
     return Response(token, status=status.HTTP_200_OK)
 
@@ -91,13 +113,12 @@ class ProductsViewSet(ListRetrieveViewSet):
 
     filter_backends = (
         DjangoFilterBackend,
-        filters.SearchFilter,
+        ProductSearchFilter,
         filters.OrderingFilter,
     )
     filterset_class = ProductFilter
-    search_fields = ("name", "description")
     ordering_fields = ("name", "actual_price", "rating")
-    pagination_class = LimitOffsetPagination
+    pagination_class = KeysetPagination
 
     def get_serializer_class(self):
         if self.action == "list":
@@ -109,43 +130,137 @@ class ProductsViewSet(ListRetrieveViewSet):
         queryset = Product.objects.filter(
             is_active=True,
             # Отдает только товары, которые есть в магазинах
-            colorproduct__colorproductshop__quantity__gt=0,
-        ).select_related(
-            "manufacturer",
-            "category",
+            stats__num_shop__gt=0,
         )
-        if self.action == "list":
+        if self.action in ("list", "facets"):
+            # Статистика товаров хранится в ProductStats, а названия
+            # категорий и производителей берутся из кэша справочников
             queryset = queryset.annotate(
-                # Добавляем количество магазинов, где есть товар
-                num_shop=Count(
-                    "colorproduct__colorproductshop__shop", distinct=True
-                ),
-                # Добавляем доступное количество товаров
-                num_products=Subquery(
-                    ColorProductShop.objects.filter(
-                        colorproduct__product=OuterRef("pk")
-                    )
-                    .values("colorproduct__product")
-                    .annotate(total=Sum("quantity"))
-                    .values("total")
-                ),
-                # Добавляем средний рейтинг
-                rating=Avg("reviews__rating"),
+                num_shop=F("stats__num_shop"),
+                num_products=F("stats__num_products"),
+                rating=F("stats__rating"),
             )
         else:
             queryset = queryset.annotate(
-                reviews_count=Count("reviews"),
-            ).select_related("manufacturer__country")
+                reviews_count=F("stats__reviews_count"),
+                rating=F("stats__rating"),
+                # Версия товара входит в ключ кэша наличия
+                version=F("stats__version"),
+            ).select_related("category", "manufacturer")
 
         return queryset
 
+    def get_availability(self, products):
+        """
+        Наличие всех товаров одним запросом (или из кэша по версиям)
+        для передачи в контекст ProductDetailSerializer.
+        """
+        return get_availability_many(
+            {product.id: product.version for product in products}
+        )
+
+    def get_detail_serializer(self, products, **kwargs):
+        context = self.get_serializer_context()
+        context["availability"] = self.get_availability(products)
+        return self.get_serializer(
+            products if kwargs.get("many") else products[0],
+            context=context,
+            **kwargs,
+        )
+
+    def retrieve(self, request, *args, **kwargs):
+        serializer = self.get_detail_serializer([self.get_object()])
+        return Response(serializer.data)
+
+    @swagger_auto_schema(
+        manual_parameters=[
+            openapi.Parameter(
+                "ids",
+                openapi.IN_QUERY,
+                description="id товаров через запятую",
+                type=openapi.TYPE_STRING,
+                required=True,
+            )
+        ],
+        responses={
+            200: openapi.Response(
+                "Products retrieved",
+                openapi.Schema(
+                    type=openapi.TYPE_ARRAY, items=product_detail_code_schema
+                ),
+            )
+        },
+    )
+    @action(
+        detail=False,
+        methods=["get"],
+        pagination_class=None,
+        filter_backends=(),
+    )
+    def details(self, request):
+        """
+        Данные нескольких товаров за один запрос: /products/details/?ids=1,2
+        Товары возвращаются в порядке переданных id, недоступные пропускаются.
+        """
+        try:
+            ids = list(
+                dict.fromkeys(
+                    int(pk) for pk in request.query_params["ids"].split(",")
+                )
+            )
+        except (KeyError, ValueError):
+            raise ValidationError(
+                {"ids": "Передайте id товаров через запятую."}
+            )
+        if len(ids) > products_batch_limit:
+            raise ValidationError(
+                {"ids": f"Не более {products_batch_limit} товаров за запрос."}
+            )
+        products = self.get_queryset().in_bulk(ids)
+        products = [products[pk] for pk in ids if pk in products]
+        serializer = self.get_detail_serializer(products, many=True)
+        return Response(serializer.data, status=status.HTTP_200_OK)
+
+    @swagger_auto_schema(
+        responses={
+            200: openapi.Response(
+                "Product facets", product_facets_code_schema
+            )
+        }
+    )
+    @action(detail=False, methods=["get"], pagination_class=None)
+    def facets(self, request):
+        """
+        Количество товаров по магазинам, категориям, производителям
+        и диапазонам цен для текущих фильтров списка товаров.
+        """
+        # Фильтры применяются в ProductFacets отдельно для каждого фасета
+        filterset = DjangoFilterBackend().get_filterset(
+            request,
+            ProductSearchFilter().filter_queryset(
+                request, self.get_queryset(), self
+            ),
+            self,
+        )
+        if not filterset.is_valid():
+            raise translate_validation(filterset.errors)
+        facets = ProductFacets(
+            filterset,
+            cache_key=get_query_cache_key(
+                "api_facets",
+                request,
+                exclude=("cursor", "limit", "ordering"),
+            ),
+        ).get()
+        return Response(facets_to_list(facets), status=status.HTTP_200_OK)
+
 
 class ReviewViewSet(viewsets.ModelViewSet):
     """Представление для отзывов."""
 
     serializer_class = ReviewSerializer
     http_method_names = ["get", "post", "patch", "delete"]
-    pagination_class = LimitOffsetPagination
+    pagination_class = KeysetPagination
     permission_classes = (IsAdminStaffOwnerReadOnly,)
     filter_backends = (filters.OrderingFilter, DjangoFilterBackend)
     ordering_fields = ("created_at", "rating")
@@ -192,17 +307,29 @@ class ShoppingCartViewSet(viewsets.ModelViewSet):
 
     permission_classes = (IsOwner,)
     http_method_names = ["get", "post", "patch", "delete"]
-    pagination_class = LimitOffsetPagination
+    pagination_class = KeysetPagination
 
     def get_queryset(self):
         """Возвращаем только корзину текущего пользователя."""
-        return ShoppingCart.objects.filter(user=self.request.user)
+        # Пагинация по ключу (-created_at, id)
+        queryset = ShoppingCart.objects.filter(
+            user=self.request.user
+        ).order_by("-created_at", "id")
+        if self.action in ("list", "retrieve", "batch"):
+            queryset = queryset.with_prices().select_related(
+                "product", "colorproduct__color"
+            )
+        return queryset
 
     def get_serializer_class(self):
         if self.action == "create":
             return ShoppingCartCreateSerializer
         elif self.action == "partial_update":
             return ShoppingCartUpdateSerializer
+        elif self.action == "totals":
+            return ShoppingCartTotalsSerializer
+        elif self.action == "batch":
+            return ShoppingCartBatchSerializer
         else:
             return ShoppingCartListSerializer
 
@@ -215,22 +342,182 @@ class ShoppingCartViewSet(viewsets.ModelViewSet):
             return (IsAuthenticated(),)
         return super().get_permissions()
 
+    def get_serializer_context(self):
+        context = super().get_serializer_context()
+        context["batch_limit"] = cart_batch_limit
+        return context
+
+    @action(detail=False, pagination_class=None)
+    def totals(self, request):
+        """Итоги корзины: количество товаров, стоимость и экономия."""
+        serializer = self.get_serializer(self.get_queryset().totals())
+        return Response(serializer.data)
+
+    @swagger_auto_schema(
+        responses={
+            200: openapi.Response(
+                "Shopping cart", ShoppingCartListSerializer(many=True)
+            )
+        }
+    )
+    @action(detail=False, methods=["post"], pagination_class=None)
+    def batch(self, request):
+        """
+        Пакетное изменение корзины (например, синхронизация корзины
+        мобильного клиента): все операции проверяются и применяются
+        в одной транзакции. Возвращает корзину после изменения.
+        """
+        serializer = self.get_serializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        with transaction.atomic():
+            serializer.save()
+        return Response(
+            ShoppingCartListSerializer(self.get_queryset(), many=True).data,
+            status=status.HTTP_200_OK,
+        )
+
 
 class OrderViewSet(viewsets.ModelViewSet):
     """Представление для заказов."""
 
     permission_classes = (IsOwner,)
     http_method_names = ["get", "post"]
-    pagination_class = LimitOffsetPagination
+    pagination_class = KeysetPagination
 
     def get_queryset(self):
         """Возвращаем только заказы текущего пользователя."""
-        return Order.objects.filter(user=self.request.user)
+        # Пагинация по ключу (-created_at, id)
+        queryset = Order.objects.filter(user=self.request.user).order_by(
+            "-created_at", "id"
+        )
+        if self.action == "retrieve":
+            # Итоги хранятся в заказе, а состав заказа подгружается
+            # одним запросом
+            queryset = queryset.select_related("user").with_products()
+        return queryset
 
     def get_serializer_class(self):
         if self.action == "create":
             return OrderCreateSerializer
         elif self.action == "retrieve":
             return OrderRetriveSerializer
+        elif self.action == "reserve":
+            return OrderReserveSerializer
+        elif self.action == "batch":
+            return OrderBatchSerializer
+        elif self.action == "plan":
+            return FulfilmentPlanSerializer
         else:
             return OrderListSerializer
+
+    def get_serializer_context(self):
+        context = super().get_serializer_context()
+        context["batch_limit"] = order_batch_limit
+        return context
+
+    @swagger_auto_schema(
+        manual_parameters=[
+            openapi.Parameter(
+                "Idempotency-Key",
+                openapi.IN_HEADER,
+                description=(
+                    "Уникальный ключ запроса: повтор с тем же ключом "
+                    "возвращает сохраненный ответ и не создает новый заказ"
+                ),
+                type=openapi.TYPE_STRING,
+                required=False,
+            )
+        ]
+    )
+    def create(self, request, *args, **kwargs):
+        """
+        Создание заказа. Если передан заголовок Idempotency-Key,
+        ответ сохраняется на время ORDER_IDEMPOTENCY_KEY_TTL, и повтор
+        запроса (например, после таймаута) возвращает его, не оформляя
+        заказ еще раз.
+        """
+        key = request.headers.get("Idempotency-Key")
+        if not key:
+            return super().create(request, *args, **kwargs)
+        if len(key) > IdempotencyKey._meta.get_field("key").max_length:
+            raise ValidationError(
+                {"Idempotency-Key": "Слишком длинный ключ идемпотентности."}
+            )
+        fingerprint = get_request_fingerprint(request.data)
+        # Ключ занимается в одной транзакции с созданием заказа:
+        # одновременный повтор ждет ее завершения, а при ошибке
+        # ключ освобождается
+        with transaction.atomic():
+            record, created = IdempotencyKey.objects.claim(
+                request.user, key, fingerprint
+            )
+            if not created:
+                return self.replay(record, fingerprint)
+            response = super().create(request, *args, **kwargs)
+            record.order_id = response.data["id"]
+            record.status_code = response.status_code
+            record.response = response.data
+            record.save(update_fields=("order", "status_code", "response"))
+        return response
+
+    def replay(self, record, fingerprint):
+        """Ответ на повторный запрос с тем же ключом идемпотентности."""
+        if record.response is None or record.fingerprint != fingerprint:
+            return Response(
+                {
+                    "detail": "Ключ идемпотентности уже использован "
+                    "с другими параметрами запроса."
+                },
+                status=status.HTTP_422_UNPROCESSABLE_ENTITY,
+            )
+        return Response(
+            record.response,
+            status=record.status_code,
+            headers={"Idempotent-Replayed": "true"},
+        )
+
+    @action(
+        detail=False,
+        methods=["post"],
+        pagination_class=None,
+        permission_classes=(IsPartner,),
+    )
+    def batch(self, request):
+        """
+        Пакетное создание заказов с явным составом (для интеграций
+        партнеров): наличие во всех магазинах проверяется одним запросом,
+        остатки списываются одним UPDATE, заказы создаются пакетно.
+        Доступно только сотрудникам и партнерам.
+        В ответе - результат по каждому заказу.
+        """
+        serializer = self.get_serializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        serializer.save()
+        return Response(serializer.data, status=status.HTTP_200_OK)
+
+    @action(detail=False, pagination_class=None)
+    def plan(self, request):
+        """
+        Магазины, отсортированные по наличию товаров корзины
+        (сначала те, где можно забрать весь заказ), и предложение
+        разбить заказ, если ни один магазин не подходит целиком.
+        """
+        carts = ShoppingCart.objects.filter(user=request.user).select_related(
+            "product", "colorproduct__color"
+        )
+        plan = plan_fulfilment(
+            carts, [*get_retail_shops(), get_warehouse()], request.user
+        )
+        serializer = self.get_serializer(plan)
+        return Response(serializer.data, status=status.HTTP_200_OK)
+
+    @action(detail=False, methods=["post"], pagination_class=None)
+    def reserve(self, request):
+        """
+        Резерв товаров корзины в выбранном магазине на время оформления
+        заказа. Повторный вызов заменяет прежний резерв пользователя.
+        """
+        serializer = self.get_serializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        serializer.save()
+        return Response(serializer.data, status=status.HTTP_200_OK)
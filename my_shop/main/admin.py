@@ -3,6 +3,14 @@ from django.contrib import admin
 
 from main.models import (Category, Color, ColorProduct, ColorProductShop,
                          Country, Manufacturer, Product, Shop)
+from main.reference import get_reference
+
+
+class ReferenceListFilter(admin.RelatedFieldListFilter):
+    """Фильтр по связанному справочнику с вариантами из его кэша."""
+
+    def field_choices(self, field, request, model_admin):
+        return get_reference(field.related_model).choices()
 
 
 class ColorProductShopInline(nested_admin.NestedStackedInline):
@@ -27,7 +35,10 @@ class ProductAdmin(nested_admin.NestedModelAdmin):
         "manufacturer",
     )
     search_fields = ("name",)
-    list_filter = ("category", "manufacturer")
+    list_filter = (
+        ("category", ReferenceListFilter),
+        ("manufacturer", ReferenceListFilter),
+    )
     readonly_fields = ("actual_price", "average_rating")
     fields = (
         "name",
@@ -47,12 +58,17 @@ class ProductAdmin(nested_admin.NestedModelAdmin):
 class ManufacturerAdmin(nested_admin.NestedModelAdmin):
     list_display = ("name", "country")
     search_fields = ("name",)
-    list_filter = ("country",)
+    list_filter = (("country", ReferenceListFilter),)
+
+
+class ShopAdmin(admin.ModelAdmin):
+    list_display = ("name", "address", "kind")
+    list_filter = ("kind",)
 
 
 admin.site.register(Product, ProductAdmin)
 admin.site.register(Color)
 admin.site.register(Manufacturer, ManufacturerAdmin)
 admin.site.register(Country)
-admin.site.register(Shop)
+admin.site.register(Shop, ShopAdmin)
 admin.site.register(Category)
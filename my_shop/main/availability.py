@@ -0,0 +1,183 @@
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import F
+
+from main.models import ColorProductShop
+from main.reference import colors, get_warehouse_id, shops
+
+availability_cache_timeout = getattr(
+    settings, "PRODUCT_AVAILABILITY_CACHE_TIMEOUT", 60 * 60
+)
+
+
+class ColorAvailability:
+    """Наличие одного цвета товара: на складе и в офлайн магазинах."""
+
+    def __init__(self, colorproduct_id, color_id):
+        self.id = colorproduct_id
+        self.color_id = color_id
+        self.warehouse = 0
+        # [(shop_id, количество), ...] в порядке названий магазинов
+        self.shop_quantities = []
+
+    def __str__(self):
+        return self.name
+
+    @property
+    def name(self):
+        color = colors.get(self.color_id)
+        return color.name if color is not None else ""
+
+    @property
+    def shops(self):
+        """Магазины с количеством товара: [{"shop": Shop, "quantity"}]."""
+        return [
+            {"shop": shops.get(shop_id), "quantity": quantity}
+            for shop_id, quantity in self.shop_quantities
+        ]
+
+
+class ProductAvailability:
+    """
+    Матрица наличия товара: цвет × магазин.
+    Строится одним запросом к ColorProductShop, названия цветов и магазинов
+    берутся из кэша справочников. Объект хранится в кэше по версии товара
+    (ProductStats.version меняется при любом изменении наличия).
+    """
+
+    def __init__(self, product_id):
+        self.product_id = product_id
+        self.colors = {}
+
+    def add(self, colorproduct_id, color_id, shop_id, quantity, warehouse_id):
+        color = self.colors.get(colorproduct_id)
+        if color is None:
+            color = ColorAvailability(colorproduct_id, color_id)
+            self.colors[colorproduct_id] = color
+        if shop_id == warehouse_id:
+            color.warehouse += quantity
+        else:
+            color.shop_quantities.append((shop_id, quantity))
+
+    def sort(self):
+        """Упорядочиваем цвета и магазины по названию."""
+        for color in self.colors.values():
+            color.shop_quantities.sort(
+                key=lambda item: str(shops.get(item[0]) or "")
+            )
+
+    @property
+    def available_colors(self):
+        """Все цвета, которые есть хотя бы в одном магазине."""
+        return sorted(self.colors.values(), key=lambda color: color.name)
+
+    @property
+    def warehouse_colors(self):
+        """Цвета, доступные для заказа в интернет магазине."""
+        return [color for color in self.available_colors if color.warehouse]
+
+    @property
+    def shop_colors(self):
+        """Цвета, которые есть в офлайн магазинах."""
+        return [
+            color for color in self.available_colors if color.shop_quantities
+        ]
+
+    def offline_shops_data(self):
+        """Наличие в офлайн магазинах в формате API."""
+        return [
+            {
+                "color": color.name,
+                "color_id": color.color_id,
+                "items": [
+                    {
+                        "shop": item["shop"].name,
+                        "shop_id": item["shop"].id,
+                        "quantity": item["quantity"],
+                    }
+                    for item in color.shops
+                ],
+            }
+            for color in self.shop_colors
+        ]
+
+    def internet_shop_data(self):
+        """Наличие на складе интернет магазина в формате API."""
+        return [
+            {
+                "color": color.name,
+                "color_id": color.color_id,
+                "quantity": color.warehouse,
+            }
+            for color in self.warehouse_colors
+        ]
+
+
+def load_availability(product_ids):
+    """Строим матрицы наличия для нескольких товаров одним запросом."""
+    result = {
+        product_id: ProductAvailability(product_id)
+        for product_id in product_ids
+    }
+    warehouse_id = get_warehouse_id()
+    # Полностью зарезервированные товары не выводятся, а количество
+    # показывается без учета резервов: матрица кэшируется по версии
+    # товара, которая меняется только когда товар резервируют целиком
+    rows = (
+        ColorProductShop.objects.filter(
+            colorproduct__product_id__in=result, quantity__gt=F("reserved")
+        )
+        .order_by()
+        .values_list(
+            "colorproduct__product_id",
+            "colorproduct_id",
+            "colorproduct__color_id",
+            "shop_id",
+            "quantity",
+        )
+    )
+    for product_id, colorproduct_id, color_id, shop_id, quantity in rows:
+        result[product_id].add(
+            colorproduct_id, color_id, shop_id, quantity, warehouse_id
+        )
+    for availability in result.values():
+        availability.sort()
+    return result
+
+
+def get_cache_key(product_id, version, warehouse_id):
+    # id склада входит в ключ: от него зависит разделение на склад и магазины
+    return f"product_availability:{product_id}:{version}:{warehouse_id}"
+
+
+def get_availability_many(versions):
+    """
+    Получаем матрицы наличия товаров.
+    Принимает словарь {id товара: версия товара}; отсутствующие в кэше
+    матрицы строятся одним запросом и сохраняются в кэш.
+    """
+    warehouse_id = get_warehouse_id()
+    keys = {
+        product_id: get_cache_key(product_id, version, warehouse_id)
+        for product_id, version in versions.items()
+    }
+    cached = cache.get_many(keys.values())
+    result = {
+        product_id: cached[key]
+        for product_id, key in keys.items()
+        if key in cached
+    }
+    missing = [product_id for product_id in keys if product_id not in result]
+    if missing:
+        loaded = load_availability(missing)
+        cache.set_many(
+            {keys[product_id]: loaded[product_id] for product_id in missing},
+            availability_cache_timeout,
+        )
+        result.update(loaded)
+    return result
+
+
+def get_availability(product_id, version):
+    """Матрица наличия одного товара."""
+    return get_availability_many({product_id: version})[product_id]
@@ -5,3 +5,12 @@ RATING_CHOICES = (
     (2, "2 - Плохо"),
     (1, "1 - Очень плохо"),
 )
+
+# Типы магазинов
+SHOP_KIND_RETAIL = "retail"
+SHOP_KIND_WAREHOUSE = "warehouse"
+
+SHOP_KIND_CHOICES = (
+    (SHOP_KIND_RETAIL, "Офлайн магазин"),
+    (SHOP_KIND_WAREHOUSE, "Склад интернет-магазина"),
+)
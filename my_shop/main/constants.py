@@ -0,0 +1,2 @@
+# Конфигурация полнотекстового поиска PostgreSQL
+SEARCH_CONFIG = "russian"
@@ -1,9 +1,9 @@
-from main.models import Category, Manufacturer
+from main import reference
 
 
 def categories(request):
-    return {"categories": Category.objects.filter(is_active=True)}
+    return {"categories": reference.categories.active()}
 
 
 def manufacturers(request):
-    return {"manufacturers": Manufacturer.objects.filter(is_active=True)}
+    return {"manufacturers": reference.manufacturers.active()}
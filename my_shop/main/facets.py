@@ -0,0 +1,175 @@
+from decimal import Decimal
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.exceptions import EmptyResultSet
+from django.db import connections
+
+from main.models import ColorProduct, ColorProductShop, Product
+
+facets_cache_timeout = getattr(settings, "CATALOG_FACETS_CACHE_TIMEOUT", 60)
+price_facet_edges = getattr(
+    settings, "CATALOG_PRICE_FACETS", (1000, 5000, 10000, 50000)
+)
+
+
+# Параметры фильтра каждого фасета: счетчики фасета считаются
+# без его собственного фильтра, чтобы были видны другие варианты
+FACET_FILTERS = {
+    "shops": ("shop_id",),
+    "categories": ("category",),
+    "manufacturers": ("manufacturer",),
+    "prices": ("min_price", "max_price"),
+}
+
+
+class ProductFacets:
+    """
+    Счетчики фасетов каталога для текущего набора фильтров:
+    количество товаров по магазинам, категориям, производителям
+    и диапазонам цен. Каждый фасет считается по товарам, отобранным
+    всеми фильтрами, кроме его собственного. Все счетчики считаются
+    одним запросом (UNION ALL) и кэшируются по ключу набора фильтров.
+    """
+
+    def __init__(self, filterset, cache_key=None):
+        self.filterset = filterset
+        self.cache_key = cache_key
+        self.price_edges = [Decimal(edge) for edge in price_facet_edges]
+        # Шаг цены: верхняя граница диапазона width_bucket не входит
+        # в диапазон, а фильтр max_price включает границу
+        self.price_step = Decimal(10) ** -Product._meta.get_field(
+            "actual_price"
+        ).decimal_places
+
+    def get_price_ranges(self):
+        """Границы диапазонов цен: [(None, e1), (e1, e2), ..., (en, None)]."""
+        bounds = [None, *self.price_edges, None]
+        return list(zip(bounds, bounds[1:]))
+
+    def get_facet_queryset(self, name):
+        """Товары, отобранные всеми фильтрами, кроме фильтров фасета."""
+        data = self.filterset.data.copy()
+        for param in FACET_FILTERS[name]:
+            data.pop(param, None)
+        filterset = type(self.filterset)(
+            data,
+            queryset=self.filterset.queryset,
+            request=self.filterset.request,
+        )
+        return filterset.qs
+
+    def get_products_sql(self, name):
+        try:
+            return (
+                self.get_facet_queryset(name)
+                .order_by()
+                .values("pk")
+                .query.sql_with_params()
+            )
+        except EmptyResultSet:
+            # Пустая выборка - у фасета не будет счетчиков
+            return "SELECT NULL::bigint WHERE FALSE", ()
+
+    def get_sql(self):
+        """SQL запрос со счетчиками всех фасетов."""
+        product = Product._meta.db_table
+        categories_sql, categories_params = self.get_products_sql(
+            "categories"
+        )
+        manufacturers_sql, manufacturers_params = self.get_products_sql(
+            "manufacturers"
+        )
+        shops_sql, shops_params = self.get_products_sql("shops")
+        prices_sql, prices_params = self.get_products_sql("prices")
+        sql = f"""
+            SELECT 'categories', p.category_id, COUNT(*)
+            FROM {product} p
+            WHERE p.id IN ({categories_sql})
+            GROUP BY p.category_id
+            UNION ALL
+            SELECT 'manufacturers', p.manufacturer_id, COUNT(*)
+            FROM {product} p
+            WHERE p.id IN ({manufacturers_sql})
+            GROUP BY p.manufacturer_id
+            UNION ALL
+            SELECT 'shops', cps.shop_id, COUNT(DISTINCT p.id)
+            FROM {product} p
+            JOIN {ColorProduct._meta.db_table} cp ON cp.product_id = p.id
+            JOIN {ColorProductShop._meta.db_table} cps
+                ON cps.colorproduct_id = cp.id AND cps.quantity > cps.reserved
+            WHERE p.id IN ({shops_sql})
+            GROUP BY cps.shop_id
+            UNION ALL
+            SELECT
+                'prices',
+                width_bucket(p.actual_price, %s::numeric[]),
+                COUNT(*)
+            FROM {product} p
+            WHERE p.id IN ({prices_sql})
+            GROUP BY 2
+        """
+        return sql, [
+            *categories_params,
+            *manufacturers_params,
+            *shops_params,
+            self.price_edges,
+            *prices_params,
+        ]
+
+    def compute(self):
+        """Выполняем запрос и раскладываем строки по фасетам."""
+        facets = {
+            "shops": {},
+            "categories": {},
+            "manufacturers": {},
+            "prices": [
+                {
+                    "min_price": low,
+                    # Фильтр max_price включает границу, поэтому ссылка
+                    # ведет на последнюю цену перед верхней границей
+                    "max_price": high - self.price_step if high else None,
+                    "price_to": high,
+                    "count": 0,
+                }
+                for low, high in self.get_price_ranges()
+            ],
+        }
+        if self.filterset.is_bound and not self.filterset.is_valid():
+            # Некорректные фильтры - пустой список товаров
+            return facets
+        sql, params = self.get_sql()
+        with connections[self.filterset.queryset.db].cursor() as cursor:
+            cursor.execute(sql, params)
+            rows = cursor.fetchall()
+
+        for name, key, count in rows:
+            if name == "prices":
+                facets["prices"][key]["count"] = count
+            else:
+                facets[name][key] = count
+        return facets
+
+    def get(self):
+        """Получаем фасеты из кэша или считаем заново."""
+        if self.cache_key:
+            facets = cache.get(self.cache_key)
+            if facets is not None:
+                return facets
+        facets = self.compute()
+        if self.cache_key:
+            cache.set(self.cache_key, facets, facets_cache_timeout)
+        return facets
+
+
+def facets_to_list(facets):
+    """Представление фасетов для API: списки вместо словарей по id."""
+    result = {
+        name: [
+            {"id": pk, "count": count}
+            for pk, count in facets[name].items()
+        ]
+        for name in ("shops", "categories", "manufacturers")
+    }
+    result["prices"] = facets["prices"]
+    return result
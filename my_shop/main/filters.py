@@ -1,6 +1,7 @@
 import django_filters
 
-from main.models import Product, Shop
+from main.models import Product
+from main.reference import ReferenceChoices, shops
 
 
 class ProductFilter(django_filters.FilterSet):
@@ -10,10 +11,11 @@ class ProductFilter(django_filters.FilterSet):
     max_price = django_filters.NumberFilter(
         field_name="actual_price", lookup_expr="lte"
     )
-    product_name = django_filters.CharFilter(field_name="name")
-    shop_id = django_filters.ModelMultipleChoiceFilter(
+    product_name = django_filters.CharFilter(method="filter_product_name")
+    # Варианты берутся из кэша справочника, без запроса магазинов к БД
+    shop_id = django_filters.MultipleChoiceFilter(
         field_name="colorproduct__colorproductshop__shop_id",
-        queryset=Shop.objects.all(),
+        choices=ReferenceChoices(shops),
     )
     category = django_filters.CharFilter(field_name="category__slug")
     manufacturer = django_filters.CharFilter(field_name="manufacturer__slug")
@@ -28,3 +30,7 @@ class ProductFilter(django_filters.FilterSet):
             "category",
             "manufacturer",
         ]
+
+    def filter_product_name(self, queryset, name, value):
+        """Полнотекстовый поиск по названию и описанию товара."""
+        return queryset.search(value)
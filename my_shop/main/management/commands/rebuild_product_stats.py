@@ -0,0 +1,27 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from main.models import Product, ProductStats
+
+BATCH_SIZE = 1000
+
+
+class Command(BaseCommand):
+    help = """
+        Полный пересчет статистики товаров (ProductStats).
+        Пример команды: python manage.py rebuild_product_stats
+        """
+
+    def handle(self, *args, **options):
+        product_ids = list(Product.objects.values_list("id", flat=True))
+        for start in range(0, len(product_ids), BATCH_SIZE):
+            batch = product_ids[start:start + BATCH_SIZE]
+            with transaction.atomic():
+                # Недостающие записи статистики refresh создает сам
+                ProductStats.objects.refresh(batch)
+
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Successfully rebuilt stats for {len(product_ids)} products"
+            )
+        )
@@ -0,0 +1,18 @@
+from django.core.management.base import BaseCommand
+
+from main.models import Product
+
+
+class Command(BaseCommand):
+    help = """
+        Пересчет поисковых векторов всех товаров.
+        Пример команды: python manage.py rebuild_search_vectors
+        """
+
+    def handle(self, *args, **options):
+        updated = Product.objects.all().update_search_vector()
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Successfully rebuilt search vectors for {updated} products"
+            )
+        )
@@ -0,0 +1,165 @@
+# Generated by Django 3.2.16 on 2026-10-18 15:10
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('main', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Color',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=30, unique=True, verbose_name='Название цвета')),
+            ],
+            options={
+                'verbose_name': 'цвет',
+                'verbose_name_plural': 'Цвета',
+                'ordering': ('name',),
+            },
+        ),
+        migrations.CreateModel(
+            name='ColorProduct',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('color', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='colorproduct', to='main.color', verbose_name='Цвет')),
+            ],
+            options={
+                'verbose_name': 'цвет товара',
+                'verbose_name_plural': 'Цвета товара',
+                'default_related_name': 'colorproduct',
+            },
+        ),
+        migrations.CreateModel(
+            name='ColorProductShop',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('quantity', models.IntegerField(verbose_name='Количество')),
+                ('colorproduct', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='colorproductshop', to='main.colorproduct', verbose_name='Цвет товара')),
+            ],
+            options={
+                'verbose_name': 'товар в магазине',
+                'verbose_name_plural': 'Товары в магазине',
+                'default_related_name': 'colorproductshop',
+            },
+        ),
+        migrations.DeleteModel(
+            name='Colour',
+        ),
+        migrations.DeleteModel(
+            name='ColourProduct',
+        ),
+        migrations.DeleteModel(
+            name='ColourProductShop',
+        ),
+        migrations.AlterModelOptions(
+            name='category',
+            options={'default_related_name': 'category', 'ordering': ('name',), 'verbose_name': 'категория', 'verbose_name_plural': 'Категории'},
+        ),
+        migrations.AlterModelOptions(
+            name='country',
+            options={'default_related_name': 'country', 'ordering': ('name',), 'verbose_name': 'страна', 'verbose_name_plural': 'Страны'},
+        ),
+        migrations.AlterModelOptions(
+            name='manufacturer',
+            options={'default_related_name': 'manufacturer', 'ordering': ('name',), 'verbose_name': 'производитель', 'verbose_name_plural': 'Производители'},
+        ),
+        migrations.AlterModelOptions(
+            name='shop',
+            options={'default_related_name': 'shop', 'ordering': ('name',), 'verbose_name': 'магазин', 'verbose_name_plural': 'Магазины'},
+        ),
+        migrations.AddField(
+            model_name='manufacturer',
+            name='country',
+            field=models.ForeignKey(default=None, on_delete=django.db.models.deletion.CASCADE, related_name='manufacturer', to='main.country', verbose_name='Страна производителя'),
+            preserve_default=False,
+        ),
+        migrations.AddField(
+            model_name='product',
+            name='category',
+            field=models.ForeignKey(default=None, on_delete=django.db.models.deletion.CASCADE, related_name='product', to='main.category', verbose_name='Категрия'),
+            preserve_default=False,
+        ),
+        migrations.AddField(
+            model_name='product',
+            name='manufacturer',
+            field=models.ForeignKey(default=None, on_delete=django.db.models.deletion.CASCADE, related_name='product', to='main.manufacturer', verbose_name='Производитель'),
+            preserve_default=False,
+        ),
+        migrations.AddField(
+            model_name='review',
+            name='product',
+            field=models.ForeignKey(default=None, on_delete=django.db.models.deletion.CASCADE, related_name='reviews', to='main.product', verbose_name='Товар'),
+            preserve_default=False,
+        ),
+        migrations.AddField(
+            model_name='review',
+            name='user',
+            field=models.ForeignKey(default=None, on_delete=django.db.models.deletion.CASCADE, related_name='reviews', to='users.myuser', verbose_name='Автор'),
+            preserve_default=False,
+        ),
+        migrations.AlterField(
+            model_name='category',
+            name='name',
+            field=models.CharField(max_length=50, unique=True, verbose_name='Название категории'),
+        ),
+        migrations.AlterField(
+            model_name='country',
+            name='name',
+            field=models.CharField(max_length=50, unique=True, verbose_name='Название страны'),
+        ),
+        migrations.AlterField(
+            model_name='manufacturer',
+            name='name',
+            field=models.CharField(max_length=50, unique=True, verbose_name='Название производителя'),
+        ),
+        migrations.AlterField(
+            model_name='product',
+            name='name',
+            field=models.CharField(max_length=50, unique=True, verbose_name='Название товара'),
+        ),
+        migrations.AlterField(
+            model_name='shop',
+            name='address',
+            field=models.TextField(max_length=300, unique=True, verbose_name='Адрес магазина'),
+        ),
+        migrations.AlterField(
+            model_name='shop',
+            name='name',
+            field=models.CharField(max_length=150, unique=True, verbose_name='Название магазина'),
+        ),
+        migrations.AlterUniqueTogether(
+            name='shop',
+            unique_together={('name', 'address')},
+        ),
+        migrations.AddField(
+            model_name='colorproductshop',
+            name='shop',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='colorproductshop', to='main.shop', verbose_name='Магазин'),
+        ),
+        migrations.AddField(
+            model_name='colorproduct',
+            name='product',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='colorproduct', to='main.product', verbose_name='Товар'),
+        ),
+        migrations.AddField(
+            model_name='product',
+            name='color',
+            field=models.ManyToManyField(related_name='product', through='main.ColorProduct', to='main.Color', verbose_name='Цвета товара'),
+        ),
+        migrations.AlterUniqueTogether(
+            name='colorproductshop',
+            unique_together={('colorproduct', 'shop')},
+        ),
+        migrations.AlterUniqueTogether(
+            name='colorproduct',
+            unique_together={('color', 'product')},
+        ),
+    ]
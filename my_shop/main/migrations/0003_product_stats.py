@@ -0,0 +1,76 @@
+# Generated by Django 3.2.16 on 2026-10-18 15:10
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+# Статистика для уже существующих товаров: без нее товары пропадают
+# из каталога, который соединяется с ProductStats
+BACKFILL_SQL = """
+    INSERT INTO main_productstats (
+        product_id, num_shop, num_products, warehouse_quantity,
+        reviews_count, rating_sum, rating
+    )
+    SELECT
+        product.id,
+        COALESCE(stock.num_shop, 0),
+        COALESCE(stock.num_products, 0),
+        COALESCE(stock.warehouse_quantity, 0),
+        COALESCE(reviews.reviews_count, 0),
+        COALESCE(reviews.rating_sum, 0),
+        COALESCE(reviews.rating, 0)
+    FROM main_product product
+    LEFT JOIN (
+        SELECT
+            cp.product_id,
+            COUNT(DISTINCT cps.shop_id) FILTER (WHERE cps.quantity > 0)
+                AS num_shop,
+            SUM(cps.quantity) AS num_products,
+            SUM(cps.quantity) FILTER (WHERE shop.name ILIKE '%склад%')
+                AS warehouse_quantity
+        FROM main_colorproductshop cps
+        JOIN main_colorproduct cp ON cp.id = cps.colorproduct_id
+        JOIN main_shop shop ON shop.id = cps.shop_id
+        GROUP BY cp.product_id
+    ) stock ON stock.product_id = product.id
+    LEFT JOIN (
+        SELECT
+            product_id,
+            COUNT(*) AS reviews_count,
+            SUM(rating) AS rating_sum,
+            AVG(rating) AS rating
+        FROM main_review
+        GROUP BY product_id
+    ) reviews ON reviews.product_id = product.id
+    ON CONFLICT (product_id) DO NOTHING
+"""
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main', '0002_sync_models'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ProductStats',
+            fields=[
+                ('product', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='stats', serialize=False, to='main.product', verbose_name='Товар')),
+                ('num_shop', models.PositiveIntegerField(default=0, verbose_name='Количество магазинов с товаром')),
+                ('num_products', models.IntegerField(default=0, verbose_name='Общее количество товара')),
+                ('warehouse_quantity', models.IntegerField(default=0, verbose_name='Количество на складе')),
+                ('reviews_count', models.PositiveIntegerField(default=0, verbose_name='Количество отзывов')),
+                ('rating_sum', models.PositiveIntegerField(default=0, verbose_name='Сумма оценок')),
+                ('rating', models.FloatField(default=0, verbose_name='Рейтинг')),
+            ],
+            options={
+                'verbose_name': 'статистика товара',
+                'verbose_name_plural': 'Статистика товаров',
+            },
+        ),
+        migrations.AddIndex(
+            model_name='productstats',
+            index=models.Index(condition=models.Q(('num_shop__gt', 0)), fields=['rating'], name='productstats_rating_idx'),
+        ),
+        migrations.RunSQL(BACKFILL_SQL, migrations.RunSQL.noop),
+    ]
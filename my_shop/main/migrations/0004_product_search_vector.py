@@ -0,0 +1,34 @@
+# Generated by Django 3.2.16 on 2026-10-18 15:10
+
+import django.contrib.postgres.indexes
+import django.contrib.postgres.search
+from django.db import migrations
+
+# Поисковый вектор для уже существующих товаров
+# (то же выражение, что и в ProductQuerySet.update_search_vector)
+BACKFILL_SQL = """
+    UPDATE main_product SET search_vector = (
+        setweight(to_tsvector('russian', COALESCE(name, '')), 'A')
+        || setweight(to_tsvector('russian', COALESCE(description, '')), 'B')
+    )
+"""
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main', '0003_product_stats'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='product',
+            name='search_vector',
+            field=django.contrib.postgres.search.SearchVectorField(editable=False, null=True),
+        ),
+        migrations.AddIndex(
+            model_name='product',
+            index=django.contrib.postgres.indexes.GinIndex(fields=['search_vector'], name='product_search_idx'),
+        ),
+        migrations.RunSQL(BACKFILL_SQL, migrations.RunSQL.noop),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 3.2.16 on 2026-10-18 15:11
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main', '0004_product_search_vector'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='productstats',
+            name='version',
+            field=models.PositiveIntegerField(default=1, verbose_name='Версия карточки товара'),
+        ),
+    ]
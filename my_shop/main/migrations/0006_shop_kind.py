@@ -0,0 +1,32 @@
+# Generated by Django 3.2.16 on 2026-10-18 15:11
+
+from django.db import migrations, models
+
+
+def mark_warehouses(apps, schema_editor):
+    """
+    До появления типа магазина склад определялся по названию,
+    поэтому существующим складам проставляем тип явно.
+    """
+    Shop = apps.get_model('main', 'Shop')
+    Shop.objects.filter(name__icontains='склад').update(kind='warehouse')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main', '0005_product_stats_version'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='shop',
+            name='kind',
+            field=models.CharField(choices=[('retail', 'Офлайн магазин'), ('warehouse', 'Склад интернет-магазина')], default='retail', max_length=10, verbose_name='Тип магазина'),
+        ),
+        migrations.AddIndex(
+            model_name='colorproductshop',
+            index=models.Index(condition=models.Q(('quantity__gt', 0)), fields=['shop', 'colorproduct'], name='colorproductshop_in_stock_idx'),
+        ),
+        migrations.RunPython(mark_warehouses, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 3.2.16 on 2026-10-18 15:11
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main', '0006_shop_kind'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='review',
+            index=models.Index(fields=['product', '-created_at', '-id'], name='review_product_created_idx'),
+        ),
+    ]
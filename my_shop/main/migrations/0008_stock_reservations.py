@@ -0,0 +1,18 @@
+# Generated by Django 3.2.16 on 2026-10-18 15:11
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main', '0007_review_product_index'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='colorproductshop',
+            name='reserved',
+            field=models.IntegerField(default=0, verbose_name='Зарезервировано'),
+        ),
+    ]
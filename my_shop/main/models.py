@@ -1,11 +1,18 @@
 from decimal import ROUND_UP, Decimal
 
 from django.contrib.auth import get_user_model
+from django.contrib.postgres.indexes import GinIndex
+from django.contrib.postgres.search import (SearchQuery, SearchRank,
+                                            SearchVector, SearchVectorField)
 from django.core.validators import MinValueValidator
-from django.db import models
+from django.db import connections, models
+from django.db.models import Avg, Count, F, OuterRef, Q, Subquery, Sum
+from django.db.models.functions import Coalesce
 from django.urls import reverse
 
-from main.choices import RATING_CHOICES
+from main.choices import (RATING_CHOICES, SHOP_KIND_CHOICES, SHOP_KIND_RETAIL,
+                          SHOP_KIND_WAREHOUSE)
+from main.constants import SEARCH_CONFIG
 
 User = get_user_model()
 
@@ -19,6 +26,12 @@ class Shop(models.Model):
     address = models.TextField(
         max_length=300, verbose_name="Адрес магазина", unique=True
     )
+    kind = models.CharField(
+        max_length=10,
+        choices=SHOP_KIND_CHOICES,
+        default=SHOP_KIND_RETAIL,
+        verbose_name="Тип магазина",
+    )
 
     class Meta:
         verbose_name = "магазин"
@@ -108,6 +121,67 @@ class Manufacturer(models.Model):
         return self.name
 
 
+class ProductQuerySet(models.QuerySet):
+    """Переопределяем QuerySet для Product."""
+
+    # Поля, из которых строится поисковый вектор
+    SEARCH_FIELDS = {"name", "description"}
+    # Поля, которые выводятся в закэшированных карточке и странице товара
+    CARD_FIELDS = SEARCH_FIELDS | {
+        "price",
+        "sale",
+        "actual_price",
+        "image",
+        "is_active",
+        "category",
+        "manufacturer",
+    }
+
+    def update(self, **kwargs):
+        """
+        Обновляем поисковый вектор, если при массовом обновлении
+        (в том числе через bulk_update) изменились название или описание,
+        и версию карточек измененных товаров. Если поля карточки
+        не меняются, выполняется только UPDATE.
+        """
+        fields = {self.model._meta.get_field(name).name for name in kwargs}
+        if not fields & self.CARD_FIELDS:
+            return super().update(**kwargs)
+        product_ids = list(self.values_list("pk", flat=True))
+        rows = super().update(**kwargs)
+        if rows and fields & self.SEARCH_FIELDS:
+            # Фильтр self может не совпасть с измененными строками
+            self.model.objects.filter(
+                pk__in=product_ids
+            ).update_search_vector()
+        # Сбрасываем закэшированные карточки измененных товаров
+        ProductStats.objects.filter(product_id__in=product_ids).bump_version()
+        return rows
+
+    def update_search_vector(self):
+        """Пересчитываем сохраненный поисковый вектор товаров."""
+        return super().update(
+            search_vector=(
+                SearchVector("name", weight="A", config=SEARCH_CONFIG)
+                + SearchVector("description", weight="B", config=SEARCH_CONFIG)
+            )
+        )
+
+    def search(self, text):
+        """Полнотекстовый поиск по сохраненному поисковому вектору."""
+        return self.filter(
+            search_vector=SearchQuery(text, config=SEARCH_CONFIG)
+        )
+
+    def with_search_rank(self, text):
+        """Добавляем релевантность товара поисковому запросу."""
+        return self.annotate(
+            rank=SearchRank(
+                F("search_vector"), SearchQuery(text, config=SEARCH_CONFIG)
+            )
+        )
+
+
 class Product(models.Model):
     """Модель товара."""
 
@@ -145,12 +219,19 @@ class Product(models.Model):
         verbose_name="Цвета товара",
         through="ColorProduct",
     )
+    # Взвешенный вектор по названию (A) и описанию (B) для поиска
+    search_vector = SearchVectorField(null=True, editable=False)
+
+    objects = ProductQuerySet.as_manager()
 
     class Meta:
         verbose_name = "товар"
         verbose_name_plural = "Товары"
         default_related_name = "product"
         ordering = ("created",)
+        indexes = (
+            GinIndex(fields=("search_vector",), name="product_search_idx"),
+        )
 
     def __str__(self) -> str:
         return self.name
@@ -175,6 +256,7 @@ class Product(models.Model):
         else:
             self.actual_price = self.price
         super().save(*args, **kwargs)
+        Product.objects.filter(pk=self.pk).update_search_vector()
 
 
 class ColorProduct(models.Model):
@@ -210,12 +292,23 @@ class ColorProductShop(models.Model):
         Shop, verbose_name="Магазин", on_delete=models.CASCADE
     )
     quantity = models.IntegerField(verbose_name="Количество")
+    # Сумма активных резервов (orders.StockReservation): доступно для
+    # продажи quantity - reserved. Счетчик меняется вместе с резервами
+    reserved = models.IntegerField(default=0, verbose_name="Зарезервировано")
 
     class Meta:
         verbose_name = "товар в магазине"
         verbose_name_plural = "Товары в магазине"
         default_related_name = "colorproductshop"
         unique_together = ("colorproduct", "shop")
+        indexes = (
+            # Наличие в конкретном магазине (в том числе на складе)
+            models.Index(
+                fields=("shop", "colorproduct"),
+                condition=Q(quantity__gt=0),
+                name="colorproductshop_in_stock_idx",
+            ),
+        )
 
 
 class Review(models.Model):
@@ -239,3 +332,164 @@ class Review(models.Model):
         verbose_name_plural = "Отзывы"
         default_related_name = "reviews"
         ordering = ("-created_at",)
+        indexes = (
+            # Постраничный вывод отзывов товара от новых к старым
+            models.Index(
+                fields=("product", "-created_at", "-id"),
+                name="review_product_created_idx",
+            ),
+        )
+
+
+class ProductStatsQuerySet(models.QuerySet):
+    """Переопределяем QuerySet для ProductStats."""
+
+    def create_missing(self, product_ids):
+        """
+        Создаем пустую статистику для товаров, у которых ее нет
+        (например, созданных через bulk_create в обход сигналов),
+        одним INSERT ... SELECT ... ON CONFLICT DO NOTHING.
+        """
+        fields = [
+            field
+            for field in self.model._meta.concrete_fields
+            if not field.primary_key
+        ]
+        sql, params = (
+            Product.objects.filter(pk__in=product_ids)
+            .values("pk")
+            .query.sql_with_params()
+        )
+        with connections[self.db].cursor() as cursor:
+            cursor.execute(
+                f"""
+                INSERT INTO {self.model._meta.db_table} (
+                    product_id, {", ".join(field.column for field in fields)}
+                )
+                SELECT product.id, {", ".join(["%s"] * len(fields))}
+                FROM ({sql}) AS product
+                ON CONFLICT (product_id) DO NOTHING
+                """,
+                [field.get_default() for field in fields] + list(params),
+            )
+
+    def refresh(self, product_ids):
+        """
+        Пересчитываем статистику для указанных товаров.
+        Принимает список id товаров или QuerySet с product_id.
+        Недостающие записи статистики создаются, затем все значения
+        считаются одним UPDATE с подзапросами по индексам конкретных
+        товаров, без обхода всего каталога.
+        """
+        self.create_missing(product_ids)
+        stock = (
+            ColorProductShop.objects.filter(
+                colorproduct__product=OuterRef("product_id")
+            )
+            .order_by()
+            .values("colorproduct__product")
+        )
+        reviews = (
+            Review.objects.filter(product=OuterRef("product_id"))
+            .order_by()
+            .values("product")
+        )
+        return self.filter(product_id__in=product_ids).update(
+            num_shop=Coalesce(
+                Subquery(
+                    stock.filter(quantity__gt=F("reserved"))
+                    .annotate(total=Count("shop", distinct=True))
+                    .values("total")
+                ),
+                0,
+            ),
+            # Резервы влияют на статистику только когда товар резервируют
+            # целиком (num_shop), поэтому количество - без учета резервов:
+            # иначе каждый резерв сбрасывал бы кэш карточек и страниц
+            num_products=Coalesce(
+                Subquery(
+                    stock.annotate(total=Sum("quantity")).values("total")
+                ),
+                0,
+            ),
+            warehouse_quantity=Coalesce(
+                Subquery(
+                    stock.filter(shop__kind=SHOP_KIND_WAREHOUSE)
+                    .annotate(total=Sum("quantity"))
+                    .values("total")
+                ),
+                0,
+            ),
+            reviews_count=Coalesce(
+                Subquery(reviews.annotate(total=Count("id")).values("total")),
+                0,
+            ),
+            rating_sum=Coalesce(
+                Subquery(
+                    reviews.annotate(total=Sum("rating")).values("total")
+                ),
+                0,
+            ),
+            rating=Coalesce(
+                Subquery(reviews.annotate(avg=Avg("rating")).values("avg")),
+                0.0,
+            ),
+            version=F("version") + 1,
+        )
+
+    def bump_version(self):
+        """
+        Увеличиваем версию карточек товаров. Версия входит в ключ
+        кэша карточки, поэтому старые фрагменты перестают использоваться.
+        """
+        return self.update(version=F("version") + 1)
+
+
+class ProductStats(models.Model):
+    """
+    Денормализованная статистика товара для каталога.
+    Обновляется при изменении наличия, отзывов и оформлении заказов.
+    """
+
+    product = models.OneToOneField(
+        Product,
+        verbose_name="Товар",
+        on_delete=models.CASCADE,
+        primary_key=True,
+        related_name="stats",
+    )
+    num_shop = models.PositiveIntegerField(
+        default=0, verbose_name="Количество магазинов с товаром"
+    )
+    num_products = models.IntegerField(
+        default=0, verbose_name="Общее количество товара"
+    )
+    warehouse_quantity = models.IntegerField(
+        default=0, verbose_name="Количество на складе"
+    )
+    reviews_count = models.PositiveIntegerField(
+        default=0, verbose_name="Количество отзывов"
+    )
+    rating_sum = models.PositiveIntegerField(
+        default=0, verbose_name="Сумма оценок"
+    )
+    rating = models.FloatField(default=0, verbose_name="Рейтинг")
+    version = models.PositiveIntegerField(
+        default=1, verbose_name="Версия карточки товара"
+    )
+
+    objects = ProductStatsQuerySet.as_manager()
+
+    class Meta:
+        verbose_name = "статистика товара"
+        verbose_name_plural = "Статистика товаров"
+        indexes = (
+            models.Index(
+                fields=("rating",),
+                condition=Q(num_shop__gt=0),
+                name="productstats_rating_idx",
+            ),
+        )
+
+    def __str__(self) -> str:
+        return f"Статистика {self.product_id}"
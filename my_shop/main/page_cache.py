@@ -0,0 +1,76 @@
+from django.conf import settings
+from django.db import transaction
+
+from main.models import Product
+from main.utils import (bump_cache_version, get_cache_versions,
+                        get_query_cache_key)
+
+page_cache_timeout = getattr(settings, "CATALOG_PAGE_CACHE_TIMEOUT", 300)
+
+# Общее поколение страниц каталога: меняется вместе с навигацией
+# (категории и производители выводятся на каждой странице)
+GLOBAL_SCOPE = "global"
+# Поколение главной страницы каталога (все товары)
+INDEX_SCOPE = "index"
+
+
+def get_version_key(scope):
+    return f"catalog_page_version:{scope}"
+
+
+def get_page_cache_key(request, scope):
+    """
+    Ключ страницы: путь и нормализованные query параметры,
+    а также поколения общей области и области страницы.
+    """
+    versions = get_cache_versions(
+        [get_version_key(GLOBAL_SCOPE), get_version_key(scope)]
+    )
+    prefix = "catalog_page:{}:{}".format(*versions)
+    return get_query_cache_key(prefix, request)
+
+
+def bump_versions(scopes):
+    """Меняем поколения областей: их страницы перестают использоваться."""
+    for scope in set(scopes):
+        bump_cache_version(get_version_key(scope))
+
+
+def invalidate_scopes(scopes):
+    """Сбрасываем страницы областей после фиксации транзакции."""
+    scopes = list(scopes)
+    transaction.on_commit(lambda: bump_versions(scopes))
+
+
+def get_product_scopes(product_ids):
+    """
+    Области страниц, на которых выводятся указанные товары:
+    главная, страница категории и страница производителя.
+    Принимает список id товаров или QuerySet с product_id.
+    """
+    scopes = {INDEX_SCOPE}
+    for category_slug, manufacturer_slug in Product.objects.filter(
+        id__in=product_ids
+    ).values_list("category__slug", "manufacturer__slug"):
+        scopes.add(f"category:{category_slug}")
+        scopes.add(f"manufacturer:{manufacturer_slug}")
+    return scopes
+
+
+def get_instance_scopes(product):
+    """Области страниц для объекта товара (в том числе удаленного)."""
+    return {
+        INDEX_SCOPE,
+        f"category:{product.category.slug}",
+        f"manufacturer:{product.manufacturer.slug}",
+    }
+
+
+def invalidate_product_pages(product_ids):
+    """Сбрасываем закэшированные страницы каталога с указанными товарами."""
+    invalidate_scopes(get_product_scopes(product_ids))
+
+
+def invalidate_all_pages():
+    """Сбрасываем все закэшированные страницы каталога."""
+    invalidate_scopes((GLOBAL_SCOPE,))
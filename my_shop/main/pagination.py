@@ -0,0 +1,197 @@
+import base64
+import binascii
+import datetime
+import json
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.paginator import InvalidPage, Paginator
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import connections
+from django.db.models import Q
+from django.utils.functional import cached_property
+
+count_cache_timeout = getattr(settings, "CATALOG_COUNT_CACHE_TIMEOUT", 60)
+exact_count_limit = getattr(settings, "CATALOG_EXACT_COUNT_LIMIT", 10000)
+
+
+class InvalidCursor(InvalidPage):
+    """Некорректное значение курсора."""
+
+
+class CursorJSONEncoder(DjangoJSONEncoder):
+    """
+    В отличие от DjangoJSONEncoder сохраняет микросекунды,
+    иначе сравнение по дате в курсоре будет неточным.
+    """
+
+    def default(self, o):
+        if isinstance(o, datetime.datetime):
+            return o.isoformat()
+        return super().default(o)
+
+
+def encode_cursor(values, reverse=False):
+    """Кодируем значения сортировки элемента в строку курсора."""
+    data = json.dumps({"v": values, "r": reverse}, cls=CursorJSONEncoder)
+    return base64.urlsafe_b64encode(data.encode()).decode()
+
+
+def decode_cursor(cursor):
+    """Декодируем строку курсора в (значения, направление)."""
+    try:
+        data = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+        values, reverse = data["v"], bool(data["r"])
+    except (binascii.Error, ValueError, TypeError, KeyError):
+        raise InvalidCursor("Некорректный курсор")
+    if values is not None and not isinstance(values, list):
+        raise InvalidCursor("Некорректный курсор")
+    return values, reverse
+
+
+def estimate_count(queryset):
+    """Оценка количества строк по плану запроса PostgreSQL (без COUNT)."""
+    sql, params = queryset.order_by().query.sql_with_params()
+    with connections[queryset.db].cursor() as cursor:
+        cursor.execute(f"EXPLAIN (FORMAT JSON) {sql}", params)
+        plan = cursor.fetchone()[0]
+    return int(plan[0]["Plan"]["Plan Rows"])
+
+
+class CachedCountPaginator(Paginator):
+    """
+    Paginator, который не выполняет тяжелый COUNT(*) на каждый запрос.
+    Количество кэшируется по ключу набора фильтров, а для больших выборок
+    (по оценке планировщика) вместо точного значения используется оценка.
+    """
+
+    def __init__(self, *args, cache_key=None, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.cache_key = cache_key
+        self.is_approximate = False
+
+    @cached_property
+    def count(self):
+        if self.cache_key:
+            cached = cache.get(self.cache_key)
+            if cached is not None:
+                count, self.is_approximate = cached
+                return count
+
+        estimate = estimate_count(self.object_list)
+        if estimate > exact_count_limit:
+            count, self.is_approximate = estimate, True
+        else:
+            count = super().count
+
+        if self.cache_key:
+            cache.set(
+                self.cache_key,
+                (count, self.is_approximate),
+                count_cache_timeout,
+            )
+        return count
+
+
+class KeysetPage:
+    """Страница результатов при пагинации по ключу."""
+
+    is_keyset = True
+
+    def __init__(self, object_list, next_cursor, previous_cursor):
+        self.object_list = object_list
+        self.next_cursor = next_cursor
+        self.previous_cursor = previous_cursor
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def __len__(self):
+        return len(self.object_list)
+
+    def has_next(self):
+        return self.next_cursor is not None
+
+    def has_previous(self):
+        return self.previous_cursor is not None
+
+    def has_other_pages(self):
+        return self.has_next() or self.has_previous()
+
+    @property
+    def last_cursor(self):
+        """Курсор последней страницы: обход с конца без условия."""
+        return encode_cursor(None, reverse=True)
+
+
+class KeysetPaginator:
+    """
+    Пагинация по ключу (keyset/cursor).
+    Следующая страница выбирается условием по значениям сортировки
+    последнего элемента (с id для однозначности), а не через OFFSET,
+    поэтому любая страница стоит столько же, сколько первая.
+    Поля сортировки должны быть NOT NULL.
+    """
+
+    def __init__(self, queryset, per_page, ordering=None):
+        self.queryset = queryset
+        self.per_page = per_page
+        ordering = list(
+            ordering
+            or queryset.query.order_by
+            or queryset.model._meta.ordering
+        )
+        # Добавляем id для стабильного порядка при одинаковых значениях
+        if not {"id", "-id", "pk", "-pk"} & set(ordering):
+            ordering.append("id")
+        self.fields = [
+            (field.lstrip("-"), field.startswith("-")) for field in ordering
+        ]
+
+    def _order_by(self, reverse):
+        return [
+            f"-{name}" if descending != reverse else name
+            for name, descending in self.fields
+        ]
+
+    def _after(self, values, reverse):
+        """Условие "после указанной позиции" для текущей сортировки."""
+        if len(values) != len(self.fields):
+            raise InvalidCursor("Некорректный курсор")
+        condition = Q()
+        for index, (name, descending) in enumerate(self.fields):
+            lookup = "lt" if descending != reverse else "gt"
+            # Все предыдущие поля равны, текущее - строго после позиции
+            step = Q(**{f"{name}__{lookup}": values[index]})
+            for prev_index in range(index):
+                step &= Q(**{self.fields[prev_index][0]: values[prev_index]})
+            condition |= step
+        return condition
+
+    def _position(self, obj):
+        return [getattr(obj, name) for name, _ in self.fields]
+
+    def page(self, cursor=None):
+        """Получаем страницу, начинающуюся после позиции из курсора."""
+        values, reverse = decode_cursor(cursor) if cursor else (None, False)
+        queryset = self.queryset.order_by(*self._order_by(reverse))
+        if values is not None:
+            queryset = queryset.filter(self._after(values, reverse))
+
+        object_list = list(queryset[:self.per_page + 1])
+        has_more = len(object_list) > self.per_page
+        object_list = object_list[:self.per_page]
+        if reverse:
+            object_list.reverse()
+            has_next, has_previous = values is not None, has_more
+        else:
+            has_next, has_previous = has_more, values is not None
+
+        next_cursor = previous_cursor = None
+        if object_list and has_next:
+            next_cursor = encode_cursor(self._position(object_list[-1]))
+        if object_list and has_previous:
+            previous_cursor = encode_cursor(
+                self._position(object_list[0]), reverse=True
+            )
+        return KeysetPage(object_list, next_cursor, previous_cursor)
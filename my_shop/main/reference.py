@@ -0,0 +1,110 @@
+from main.choices import SHOP_KIND_RETAIL, SHOP_KIND_WAREHOUSE
+from main.models import Category, Color, Country, Manufacturer, Shop
+from main.utils import bump_cache_version, get_cache_versions
+
+
+class ReferenceData:
+    """
+    Кэш небольшого справочника (категории, производители, магазины...).
+    Записи хранятся в памяти процесса, а в общем кэше хранится только
+    номер версии справочника. При сохранении или удалении записи версия
+    увеличивается, и все процессы перечитывают справочник из БД.
+    """
+
+    def __init__(self, model, select_related=()):
+        self.model = model
+        self.select_related = select_related
+        self.version_key = f"reference_version:{model._meta.label_lower}"
+        self._version = None
+        self._objects = ()
+        self._by_pk = {}
+
+    def load(self):
+        """Загружаем справочник из БД."""
+        objects = tuple(
+            self.model.objects.select_related(*self.select_related)
+        )
+        return objects, {obj.pk: obj for obj in objects}
+
+    def all(self):
+        """Все записи справочника в порядке сортировки модели."""
+        (version,) = get_cache_versions([self.version_key])
+        if version != self._version:
+            self._objects, self._by_pk = self.load()
+            self._version = version
+        return self._objects
+
+    def active(self):
+        """Только опубликованные записи (для моделей с is_active)."""
+        return [obj for obj in self.all() if obj.is_active]
+
+    def get(self, pk):
+        """Запись по первичному ключу или None."""
+        self.all()
+        return self._by_pk.get(pk)
+
+    def get_by(self, field, value):
+        """Первая запись с указанным значением поля или None."""
+        value = str(value)
+        for obj in self.all():
+            if str(getattr(obj, field)) == value:
+                return obj
+        return None
+
+    def choices(self):
+        """Варианты выбора (pk, название) для форм и фильтров."""
+        return [(obj.pk, str(obj)) for obj in self.all()]
+
+    def invalidate(self):
+        """Увеличиваем версию справочника во всех процессах."""
+        bump_cache_version(self.version_key)
+
+
+class ReferenceChoices:
+    """
+    Варианты выбора из справочника, которые читаются при каждом обходе.
+    В отличие от функции, такой объект можно обойти и при генерации
+    схемы API (django-filter перебирает choices фильтра напрямую).
+    """
+
+    def __init__(self, reference):
+        self.reference = reference
+
+    def __iter__(self):
+        return iter(self.reference.choices())
+
+
+categories = ReferenceData(Category)
+manufacturers = ReferenceData(Manufacturer, select_related=("country",))
+shops = ReferenceData(Shop)
+colors = ReferenceData(Color)
+countries = ReferenceData(Country)
+
+REFERENCES = {
+    reference.model: reference
+    for reference in (categories, manufacturers, shops, colors, countries)
+}
+
+
+def get_reference(model):
+    """Кэш справочника для модели."""
+    return REFERENCES[model]
+
+
+def get_retail_shops():
+    """Офлайн магазины (без склада интернет магазина)."""
+    return [shop for shop in shops.all() if shop.kind == SHOP_KIND_RETAIL]
+
+
+def get_warehouse():
+    """Склад интернет магазина или None, если он не заведен."""
+    return shops.get_by("kind", SHOP_KIND_WAREHOUSE)
+
+
+def get_warehouse_id():
+    """
+    id склада интернет магазина. Используется в запросах вместо поиска
+    склада по названию, поэтому условие сводится к равенству shop_id.
+    """
+    warehouse = get_warehouse()
+    return warehouse.pk if warehouse is not None else None
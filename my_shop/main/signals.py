@@ -0,0 +1,81 @@
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from main.models import (Category, Color, ColorProduct, ColorProductShop,
+                         Country, Manufacturer, Product, ProductStats, Review,
+                         Shop)
+from main.page_cache import (get_instance_scopes, invalidate_all_pages,
+                             invalidate_product_pages, invalidate_scopes)
+from main.reference import get_reference, manufacturers
+
+
+@receiver(post_save, sender=Product)
+def create_product_stats(sender, instance, created, **kwargs):
+    """
+    Создаем пустую статистику для нового товара,
+    для измененного - обновляем версию карточки.
+    """
+    if created:
+        ProductStats.objects.get_or_create(product=instance)
+    else:
+        ProductStats.objects.filter(product=instance).bump_version()
+
+
+@receiver(post_save, sender=Category)
+@receiver(post_save, sender=Manufacturer)
+def bump_related_products_version(sender, instance, **kwargs):
+    """
+    Название и slug категории и производителя выводятся в карточке,
+    поэтому при их изменении обновляем версию карточек товаров.
+    """
+    field = "category" if sender is Category else "manufacturer"
+    ProductStats.objects.filter(
+        **{f"product__{field}": instance}
+    ).bump_version()
+
+
+@receiver((post_save, post_delete), sender=ColorProductShop)
+def refresh_stock_stats(sender, instance, **kwargs):
+    """Пересчитываем статистику товара при изменении наличия."""
+    product_ids = ColorProduct.objects.filter(
+        pk=instance.colorproduct_id
+    ).values("product_id")
+    ProductStats.objects.refresh(product_ids)
+    invalidate_product_pages(product_ids)
+
+
+@receiver((post_save, post_delete), sender=Review)
+def refresh_review_stats(sender, instance, **kwargs):
+    """Пересчитываем статистику товара при изменении отзывов."""
+    ProductStats.objects.refresh([instance.product_id])
+    invalidate_product_pages([instance.product_id])
+
+
+@receiver((post_save, post_delete), sender=Product)
+def invalidate_product_pages_cache(sender, instance, **kwargs):
+    """Сбрасываем кэш страниц каталога, на которых выводится товар."""
+    invalidate_scopes(get_instance_scopes(instance))
+
+
+@receiver((post_save, post_delete), sender=Category)
+@receiver((post_save, post_delete), sender=Manufacturer)
+def invalidate_all_pages_cache(sender, instance, **kwargs):
+    """
+    Категории и производители выводятся в навигации каждой страницы,
+    поэтому при их изменении сбрасываем весь кэш страниц каталога.
+    """
+    invalidate_all_pages()
+
+
+@receiver((post_save, post_delete), sender=Category)
+@receiver((post_save, post_delete), sender=Manufacturer)
+@receiver((post_save, post_delete), sender=Shop)
+@receiver((post_save, post_delete), sender=Color)
+@receiver((post_save, post_delete), sender=Country)
+def invalidate_reference_data(sender, instance, **kwargs):
+    """Сбрасываем кэш справочника после фиксации транзакции."""
+    transaction.on_commit(get_reference(sender).invalidate)
+    if sender is Country:
+        # Страна выводится вместе с производителем
+        transaction.on_commit(manufacturers.invalidate)
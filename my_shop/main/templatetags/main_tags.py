@@ -11,3 +11,9 @@ def change_params(context, **kwargs):
     query.update(kwargs)
 
     return urlencode(query)
+
+
+@register.filter
+def get_item(dictionary, key):
+    """Получаем значение словаря по ключу в шаблоне."""
+    return dictionary.get(key)
@@ -11,6 +11,11 @@ urlpatterns = [
         views.product_detail_view,
         name="product_detail",
     ),
+    path(
+        "product/<int:product_id>/reviews/",
+        views.product_reviews_view,
+        name="product_reviews",
+    ),
     path(
         "product/<int:product_id>/edit_review/<int:review_id>/",
         views.product_detail_view,
@@ -0,0 +1,76 @@
+import functools
+import hashlib
+import json
+import time
+
+import redis
+from django.conf import settings
+from django.core.cache import cache
+
+# Время жизни счетчиков версий (None - без ограничения, для общего кэша)
+cache_version_timeout = getattr(settings, "CACHE_VERSION_TIMEOUT", None)
+
+
+def get_query_cache_key(prefix, request, exclude=()):
+    """
+    Формируем ключ кэша по пути и нормализованным query параметрам:
+    параметры сортируются, пустые значения и параметры из exclude
+    отбрасываются, поэтому одинаковые наборы фильтров дают один ключ.
+    """
+    params = sorted(
+        (key, value)
+        for key, values in request.GET.lists()
+        if key not in exclude
+        for value in values
+        if value != ""
+    )
+    raw = f"{request.path}?{params}"
+    return f"{prefix}:{hashlib.md5(raw.encode()).hexdigest()}"
+
+
+def get_request_fingerprint(data):
+    """
+    Хэш параметров запроса (для сравнения повторных запросов):
+    ключи сортируются, поэтому порядок полей не влияет на результат.
+    """
+    raw = json.dumps(data, sort_keys=True, default=str)
+    return hashlib.sha256(raw.encode()).hexdigest()
+
+
+def get_cache_versions(keys):
+    """
+    Получаем значения счетчиков версий из кэша одним запросом.
+    Если счетчик отсутствует в кэше (например, был вытеснен или истек),
+    начинаем его с текущего времени, чтобы не совпасть с ранее
+    использованными версиями.
+    """
+    versions = cache.get_many(keys)
+    for key in keys:
+        if key not in versions:
+            version = int(time.time())
+            if not cache.add(key, version, cache_version_timeout):
+                version = cache.get(key, version)
+            versions[key] = version
+    return [versions[key] for key in keys]
+
+
+def bump_cache_version(key):
+    """Увеличиваем счетчик версии в кэше."""
+    try:
+        cache.incr(key)
+    except ValueError:
+        cache.set(key, int(time.time()), cache_version_timeout)
+
+
+@functools.lru_cache(maxsize=None)
+def get_redis(url):
+    """
+    Клиент Redis для указанного адреса (один на процесс).
+    Адрес fakeredis:// подключает Redis в памяти процесса
+    (для тестов и локальной разработки, нужен пакет fakeredis).
+    """
+    if url.startswith("fakeredis://"):
+        import fakeredis
+
+        return fakeredis.FakeRedis(decode_responses=True)
+    return redis.Redis.from_url(url, decode_responses=True)
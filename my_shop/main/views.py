@@ -1,72 +1,59 @@
-from collections import defaultdict
-
 from django.conf import settings
-from django.db.models import Avg, Count, Sum
+from django.core.paginator import InvalidPage
+from django.db.models import F
+from django.http import Http404
 from django.shortcuts import get_object_or_404, redirect, render
 
+from main.availability import get_availability
 from main.forms import ReviewForm
-from main.models import (Category, ColorProduct, ColorProductShop,
-                         Manufacturer, Product, Review)
+from main.models import Category, Manufacturer, Product, Review
+from main.pagination import KeysetPaginator
 from main.views_mixins import BaseObjectListViewMixin, ObjectListViewMixin
 
 paginate_by = getattr(settings, "PAGINATE_BY", 10)
+reviews_paginate_by = getattr(settings, "REVIEWS_PAGINATE_BY", 5)
 
 
 class ProductListView(BaseObjectListViewMixin):
     """Отображение списка товаров"""
 
 
+def get_reviews_page(product, cursor=None):
+    """
+    Страница отзывов товара от новых к старым.
+    Используется пагинация по ключу (created_at, id), поэтому стоимость
+    страницы не зависит от количества отзывов у товара.
+    """
+    paginator = KeysetPaginator(
+        product.reviews.select_related("user"),
+        reviews_paginate_by,
+        ordering=("-created_at", "-id"),
+    )
+    try:
+        return paginator.page(cursor)
+    except InvalidPage as e:
+        raise Http404(str(e))
+
+
 def product_detail_view(request, product_id, review_id=None):
     """Отображение страницы товара"""
     queryset = Product.objects.annotate(
-        rating=Avg("reviews__rating"),
-        reviews_count=Count("reviews"),
+        # Рейтинг, количество отзывов и версия хранятся в ProductStats
+        rating=F("stats__rating"),
+        reviews_count=F("stats__reviews_count"),
+        version=F("stats__version"),
     ).select_related("category", "manufacturer", "manufacturer__country")
     product = get_object_or_404(queryset, id=product_id, is_active=True)
 
-    # Добавляем в контекст данные о товаре в оффлайн магазинах
-    grouped_data = defaultdict(list)
-    for colorproductshop in (
-        ColorProductShop.objects.filter(
-            colorproduct__product=product, quantity__gt=0
-        )
-        .exclude(shop__name__icontains="Склад")
-        .select_related("shop", "colorproduct", "colorproduct__color")
-    ):
-        grouped_data[colorproductshop.colorproduct].append(
-            {
-                "shop": colorproductshop.shop,
-                "quantity": colorproductshop.quantity,
-            }
-        )
-
-    shops_data = [
-        {"colorproduct": color, "items": items}
-        for color, items in grouped_data.items()
-    ]
-
-    # Добавляем в контекст данные о товаре в интернет магазине
-    storage_data = (
-        ColorProduct.objects.filter(
-            product=product,
-            colorproductshop__shop__name__icontains="Склад",
-            colorproductshop__quantity__gt=0,
-        )
-        .select_related("color")
-        .annotate(total=Sum("colorproductshop__quantity"))
-    )
-
-    # Добавляем список доступных цветов
-    available_colors = list(set(
-        list(storage_data)
-        + [item["colorproduct"] for item in shops_data]
-    ))
+    # Наличие товара по цветам на складе и в оффлайн магазинах
+    # (одним запросом или из кэша по версии товара)
+    availability = get_availability(product.id, product.version)
 
     # Добавляем выбранные пользователем цвета
     selected_colorproduct = request.GET.getlist("color")
 
-    # Получаем все комментарии и их авторов
-    reviews = product.reviews.select_related("user")
+    # Первая страница отзывов, остальные подгружаются отдельно
+    reviews = get_reviews_page(product)
 
     # Проверяем, хочет ли пользователь отредактировать свой отзыв
     if review_id is not None:
@@ -90,9 +77,9 @@ def product_detail_view(request, product_id, review_id=None):
     # Сохраняем все полученные данные в контекст
     context = {
         "product": product,
-        "shops_data": shops_data,
-        "storage_data": storage_data,
-        "available_colors": available_colors,
+        "shops_data": availability.shop_colors,
+        "storage_data": availability.warehouse_colors,
+        "available_colors": availability.available_colors,
         "selected_colorproduct": selected_colorproduct,
         "form": form,
         "reviews": reviews,
@@ -100,6 +87,16 @@ def product_detail_view(request, product_id, review_id=None):
     return render(request, "main/product_detail.html", context)
 
 
+def product_reviews_view(request, product_id):
+    """Фрагмент со следующей страницей отзывов товара."""
+    product = get_object_or_404(Product, id=product_id, is_active=True)
+    context = {
+        "product": product,
+        "reviews": get_reviews_page(product, request.GET.get("cursor")),
+    }
+    return render(request, "includes/review_list.html", context)
+
+
 def add_review(request, product_id):
     product = get_object_or_404(Product, id=product_id, is_active=True)
     form = ReviewForm(request.POST, files=request.FILES or None)
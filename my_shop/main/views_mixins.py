@@ -1,13 +1,33 @@
 from django.conf import settings
-from django.contrib.postgres.search import SearchQuery, SearchVector
-from django.db.models import Avg, Count, OuterRef, Subquery, Sum
-from django.shortcuts import get_object_or_404
+from django.core.cache import cache
+from django.core.paginator import InvalidPage
+from django.db.models import F
+from django.http import Http404
 from django_filters.views import FilterView
 
+from main.facets import ProductFacets
 from main.filters import ProductFilter
-from main.models import Category, ColorProductShop, Manufacturer, Product, Shop
+from main.models import Category, Manufacturer, Product
+from main.page_cache import INDEX_SCOPE, get_page_cache_key, page_cache_timeout
+from main.pagination import CachedCountPaginator, KeysetPaginator
+from main.reference import get_reference, get_retail_shops
+from main.utils import get_query_cache_key
 
 paginate_by = getattr(settings, "PAGINATE_BY", 10)
+pagination_mode = getattr(settings, "CATALOG_PAGINATION", "offset")
+card_cache_timeout = getattr(settings, "PRODUCT_CARD_CACHE_TIMEOUT", 86400)
+
+# Допустимые варианты сортировки каталога
+PRODUCT_SORT_FIELDS = (
+    "rating",
+    "-rating",
+    "actual_price",
+    "-actual_price",
+    "name",
+    "-name",
+    "created",
+    "-created",
+)
 
 
 class BaseObjectListViewMixin(FilterView):
@@ -15,7 +35,43 @@ class BaseObjectListViewMixin(FilterView):
     template_name = "main/product_list.html"
     model = Product
     paginate_by = paginate_by
+    paginator_class = CachedCountPaginator
     filterset_class = ProductFilter
+    page_cache_scope = INDEX_SCOPE
+
+    def is_page_cacheable(self, request):
+        """Кэшируем страницы только для GET запросов анонимов."""
+        return (
+            bool(page_cache_timeout)
+            and request.method == "GET"
+            and not request.user.is_authenticated
+        )
+
+    def get_page_cache_scope(self):
+        """Область страницы для сброса кэша при изменении товаров."""
+        return self.page_cache_scope
+
+    def dispatch(self, request, *args, **kwargs):
+        """
+        Анонимные посетители с одинаковыми параметрами получают одну и ту же
+        страницу, поэтому отдаем ее из кэша. Данные корзины в такой странице
+        не выводятся, они подгружаются отдельным запросом.
+        """
+        self.page_cached = self.is_page_cacheable(request)
+        if not self.page_cached:
+            return super().dispatch(request, *args, **kwargs)
+
+        cache_key = get_page_cache_key(request, self.get_page_cache_scope())
+        response = cache.get(cache_key)
+        if response is not None:
+            return response
+
+        response = super().dispatch(request, *args, **kwargs)
+        if response.status_code == 200 and not response.cookies:
+            response.add_post_render_callback(
+                lambda r: cache.set(cache_key, r, page_cache_timeout)
+            )
+        return response
 
     def get_queryset(self):
         """Получаем все товары"""
@@ -23,51 +79,81 @@ class BaseObjectListViewMixin(FilterView):
             Product.objects.filter(
                 is_active=True,
                 # отдает только товары, которые есть в магазинах
-                colorproduct__colorproductshop__quantity__gt=0,
+                stats__num_shop__gt=0,
             )
             .select_related(
                 "manufacturer",
                 "category",
             )
             .annotate(
-                # Добавляем количество магазинов, где есть товар
-                num_shop=Count(
-                    "colorproduct__colorproductshop__shop", distinct=True
-                ),
-                # Добавляем доступное количество товаров
-                num_products=Subquery(
-                    ColorProductShop.objects.filter(
-                        colorproduct__product=OuterRef("pk")
-                    )
-                    .values("colorproduct__product")
-                    .annotate(total=Sum("quantity"))
-                    .values("total")
-                ),
-                rating=Avg("reviews__rating"),
+                # Статистика хранится в ProductStats и обновляется при
+                # изменении наличия и отзывов, поэтому здесь только читаем
+                num_shop=F("stats__num_shop"),
+                num_products=F("stats__num_products"),
+                rating=F("stats__rating"),
+                # Версия входит в ключ кэша карточки товара
+                version=F("stats__version"),
             )
             .order_by("-rating")
         )
 
+        # Полнотекстовый поиск: фильтрация выполняется в ProductFilter
+        # по сохраненному поисковому вектору, здесь добавляем релевантность
+        product_name = self.request.GET.get("product_name")
+        if product_name:
+            queryset = queryset.with_search_rank(product_name).order_by(
+                "-rank", "-rating"
+            )
+
         # Обработка сортировки (по цене и по рейтингу)
         product_sort = self.request.GET.get("product_sort")
-        if product_sort:
+        if product_sort in PRODUCT_SORT_FIELDS:
             queryset = queryset.order_by(product_sort)
 
-        # Полнотекстовый поиск: только для PostgreSQL
-        product_name = self.request.GET.get("product_name")
-        if product_name:
-            search_query = SearchQuery(product_name)
-            queryset = queryset.annotate(
-                search=SearchVector("name", "description"),
-            ).filter(search=search_query)
-
         return queryset
 
+    def get_paginator(self, queryset, per_page, **kwargs):
+        """Количество товаров кэшируется по набору фильтров запроса."""
+        cache_key = get_query_cache_key(
+            "catalog_count",
+            self.request,
+            exclude=("page", "cursor", "product_sort"),
+        )
+        return super().get_paginator(
+            queryset, per_page, cache_key=cache_key, **kwargs
+        )
+
+    def paginate_queryset(self, queryset, page_size):
+        """
+        В режиме "cursor" используем пагинацию по ключу текущей сортировки
+        вместо OFFSET и COUNT(*) по всему отфильтрованному каталогу.
+        """
+        if pagination_mode != "cursor":
+            return super().paginate_queryset(queryset, page_size)
+        paginator = KeysetPaginator(queryset, page_size)
+        try:
+            page = paginator.page(self.request.GET.get("cursor"))
+        except InvalidPage as e:
+            raise Http404(str(e))
+        return (paginator, page, page.object_list, page.has_other_pages())
+
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
-        context["shops"] = Shop.objects.exclude(name__icontains="Склад")
+        context["shops"] = get_retail_shops()
         # Передаем в контекст все shop_id из url (для фильтра по магазинам)
         context["selected_shop_ids"] = self.request.GET.getlist("shop_id")
+        context["card_cache_timeout"] = card_cache_timeout
+        # В кэшируемой странице данные корзины подгружаются через JS
+        context["hydrate_cart"] = self.page_cached
+        # Счетчики товаров для фильтров боковой панели
+        context["facets"] = ProductFacets(
+            self.filterset,
+            cache_key=get_query_cache_key(
+                "catalog_facets",
+                self.request,
+                exclude=("page", "cursor", "product_sort"),
+            ),
+        ).get()
 
         return context
 
@@ -82,14 +168,23 @@ class ObjectListViewMixin(BaseObjectListViewMixin):
     related_model = Category
 
     def get_related_object(self):
-        """Получаем нужный связанный объект."""
-        related_object = get_object_or_404(
-            self.related_model,
-            slug=self.kwargs.get(self.slug_url_kwarg),
-            is_active=True,
+        """Получаем нужный связанный объект из кэша справочника."""
+        related_object = get_reference(self.related_model).get_by(
+            "slug", self.kwargs.get(self.slug_url_kwarg)
         )
+        if related_object is None or not related_object.is_active:
+            raise Http404("Объект не найден")
         return related_object
 
+    def get_page_cache_scope(self):
+        """Область страницы: category:<slug> или manufacturer:<slug>."""
+        if self.related_model is None:
+            return super().get_page_cache_scope()
+        return "{}:{}".format(
+            self.related_model._meta.model_name,
+            self.kwargs.get(self.slug_url_kwarg),
+        )
+
     def get_queryset(self):
         """Получаем все товары связанные с указанной моделью"""
         queryset = super().get_queryset()
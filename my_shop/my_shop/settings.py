@@ -79,6 +79,7 @@ TEMPLATES = [
                 "django.contrib.messages.context_processors.messages",
                 "main.context_processors.categories",
                 "main.context_processors.manufacturers",
+                "shopping_cart.context_processors.cart_summary",
             ],
         },
     },
@@ -111,6 +112,42 @@ DATABASES = {
 }
 
 
+# Cache
+# По умолчанию кэш общий для всех процессов и хранится в Redis: в нем
+# лежат версии справочников и кэша страниц, которые должны увидеть все
+# воркеры. Если CACHE_LOCATION задан пустым, используется локальный кэш
+# процесса, и тогда версии живут не дольше CACHE_VERSION_TIMEOUT секунд,
+# чтобы изменения из других процессов были видны хотя бы с задержкой
+
+CACHE_LOCATION = os.getenv("CACHE_LOCATION", "redis://redis:6379/1")
+
+if CACHE_LOCATION:
+    CACHES = {
+        "default": {
+            "BACKEND": "django_redis.cache.RedisCache",
+            "LOCATION": CACHE_LOCATION,
+        }
+    }
+    CACHE_VERSION_TIMEOUT = None
+else:
+    CACHE_VERSION_TIMEOUT = 5
+
+# Если задан CART_REDIS_URL (например, redis://redis:6379/2), корзины
+# анонимных пользователей хранятся в Redis, иначе - в таблице корзин
+CART_REDIS_URL = os.getenv("CART_REDIS_URL")
+# Время хранения корзины анонимного пользователя в Redis (в секундах),
+# продлевается при каждом изменении корзины
+ANONYMOUS_CART_TTL = 60 * 60 * 24 * 14
+# Если задан FLASH_SALE_REDIS_URL (например, redis://redis:6379/3),
+# доступен режим распродажи: остатки выбранных товаров списываются
+# в счетчиках Redis и периодически записываются в БД.
+# Для тестов можно указать fakeredis://
+FLASH_SALE_REDIS_URL = os.getenv("FLASH_SALE_REDIS_URL")
+# Через сколько секунд списание товаров распродажи, транзакция заказа
+# которого так и не зафиксировалась, возвращается в счетчики
+FLASH_SALE_HOLD_TIMEOUT = 60
+
+
 # Password validation
 # https://docs.djangoproject.com/en/4.2/ref/settings/#auth-password-validators
 
@@ -209,6 +246,46 @@ DEFAULT_FROM_EMAIL = EMAIL_HOST_USER
 EMAIL_ADMIN = EMAIL_HOST_USER
 
 PAGINATE_BY = 9
+# Количество отзывов на странице товара
+REVIEWS_PAGINATE_BY = 5
+
+# Режим пагинации каталога: "cursor" (по ключу сортировки) или "offset"
+CATALOG_PAGINATION = "cursor"
+# Время кэширования количества найденных товаров (в секундах)
+CATALOG_COUNT_CACHE_TIMEOUT = 60
+# Начиная с этой оценки планировщика точный COUNT(*) не выполняется
+CATALOG_EXACT_COUNT_LIMIT = 10000
+# Время кэширования счетчиков фасетов каталога (в секундах)
+CATALOG_FACETS_CACHE_TIMEOUT = 60
+# Границы диапазонов цен для фасета по цене
+CATALOG_PRICE_FACETS = (1000, 5000, 10000, 50000)
+# Время кэширования карточки товара (в секундах). Ключ кэша включает
+# версию товара, поэтому устаревшие карточки не отображаются
+PRODUCT_CARD_CACHE_TIMEOUT = 60 * 60 * 24
+# Время кэширования страниц каталога для анонимных посетителей
+# (в секундах). Страницы сбрасываются сигналами при изменении товаров
+CATALOG_PAGE_CACHE_TIMEOUT = 60 * 5
+# Время кэширования наличия товара (в секундах). Ключ кэша включает
+# версию товара, которая меняется при любом изменении наличия
+PRODUCT_AVAILABILITY_CACHE_TIMEOUT = 60 * 60
+# Максимальное количество товаров в запросе /api/products/details/?ids=
+API_PRODUCTS_BATCH_LIMIT = 100
+# Максимальное количество операций в запросе /api/cart/batch/
+API_CART_BATCH_LIMIT = 100
+# Максимальное количество заказов в запросе /api/order/batch/
+API_ORDER_BATCH_LIMIT = 100
+# Группа пользователей-партнеров, которым (кроме сотрудников) доступно
+# пакетное создание заказов /api/order/batch/
+API_PARTNER_GROUP = "partners"
+# Время резерва товаров при оформлении заказа (в секундах).
+# Просроченные резервы снимает периодическая задача
+STOCK_RESERVATION_TTL = 60 * 15
+# Время хранения ответа на запрос создания заказа с ключом идемпотентности
+# (в секундах): повтор запроса с тем же ключом возвращает сохраненный ответ
+ORDER_IDEMPOTENCY_KEY_TTL = 60 * 60 * 24
+# Время хранения сводки корзины в сессии (в секундах), 0 - не хранить.
+# Сводка сбрасывается при изменении корзины через сайт
+CART_SUMMARY_SESSION_TIMEOUT = 0
 
 # Настройки Celery
 CELERY_BROKER_URL = os.getenv("CELERY_BROKER_URL")
@@ -217,3 +294,18 @@ CELERY_ACCEPT_CONTENT = ['json']
 CELERY_TASK_SERIALIZER = 'json'
 CELERY_RESULT_SERIALIZER = 'json'
 CELERY_TIMEZONE = 'UTC'
+# Периодические задачи (запускаются celery beat)
+CELERY_BEAT_SCHEDULE = {
+    "expire-stock-reservations": {
+        "task": "orders.tasks.expire_reservations_task",
+        "schedule": 60,
+    },
+    "flush-flash-sales": {
+        "task": "orders.tasks.flush_flash_sales_task",
+        "schedule": 10,
+    },
+    "expire-order-idempotency-keys": {
+        "task": "orders.tasks.expire_idempotency_keys_task",
+        "schedule": 60 * 60,
+    },
+}
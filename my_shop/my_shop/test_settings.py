@@ -0,0 +1,9 @@
+from my_shop.settings import *  # noqa: F401, F403
+
+# Тестам не нужен Redis: кэш хранится в памяти процесса
+CACHES = {
+    "default": {
+        "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
+    }
+}
+CACHE_VERSION_TIMEOUT = 5
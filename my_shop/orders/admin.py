@@ -1,6 +1,8 @@
 from django.contrib import admin
 
-from orders.models import Order, OrderProduct
+from orders.models import IdempotencyKey, Order, OrderProduct, StockReservation
 
 admin.site.register(Order)
 admin.site.register(OrderProduct)
+admin.site.register(StockReservation)
+admin.site.register(IdempotencyKey)
@@ -0,0 +1,176 @@
+from collections import Counter, defaultdict
+from decimal import Decimal
+
+from django.db import transaction
+from django.db.models import F
+
+from main.models import ColorProduct, ColorProductShop
+from orders.flash_sale import (decrement_flash_sale_stock,
+                               get_flash_sale_items, release_holds_on_error)
+from orders.models import Order, OrderProduct
+from orders.reservations import refresh_stock
+from orders.stock import InsufficientStock, subtract_stock
+from orders.utils import get_shortage_message
+
+
+def load_stock(orders):
+    """
+    Доступные остатки (без учета резервов) всех запрошенных товаров
+    во всех магазинах пакета одним запросом. Строки блокируются
+    в порядке id до конца транзакции, как и при оформлении заказа.
+    Возвращает {(id магазина, id товара цвета): (id строки, остаток)}.
+    """
+    shop_ids = {order["shop"].pk for order in orders}
+    colorproduct_ids = {pk for order in orders for pk in order["items"]}
+    rows = (
+        ColorProductShop.objects.filter(
+            shop_id__in=shop_ids, colorproduct_id__in=colorproduct_ids
+        )
+        .select_for_update()
+        .order_by("id")
+        .values_list(
+            "id", "shop_id", "colorproduct_id", F("quantity") - F("reserved")
+        )
+    )
+    return {
+        (shop_id, colorproduct_id): (row_id, available)
+        for row_id, shop_id, colorproduct_id, available in rows
+    }
+
+
+def get_flash_sale_lines(orders):
+    """Товары в режиме распродажи по магазинам: {id магазина: {id}}."""
+    colorproduct_ids = defaultdict(set)
+    for order in orders:
+        colorproduct_ids[order["shop"].pk].update(order["items"])
+    return {
+        shop_id: get_flash_sale_items(shop_id, ids)
+        for shop_id, ids in colorproduct_ids.items()
+    }
+
+
+def build_order(user, data, lines):
+    """Несохраненный заказ с итогами по позициям."""
+    order = Order(
+        user=user,
+        phone=data["phone"],
+        requires_delivery=data["requires_delivery"],
+        shop=data["shop"],
+        payment_on_get=data["payment_on_get"],
+        total_quantity=sum(line.quantity for line in lines),
+        total_price=sum(
+            (line.price * line.quantity for line in lines), Decimal(0)
+        ),
+        total_saving=sum(
+            (
+                (line.product.price - line.price) * line.quantity
+                for line in lines
+            ),
+            Decimal(0),
+        ),
+    )
+    if data["requires_delivery"]:
+        order.delivery_city = data["delivery_city"]
+        order.delivery_adress = data["delivery_adress"]
+    return order
+
+
+@transaction.atomic
+def create_orders(user, orders):
+    """
+    Пакетное создание заказов с явным составом (без корзины).
+    Каждый заказ в orders - словарь с данными заказа, магазином списания
+    и items {id товара цвета: количество}.
+    Остатки всех магазинов проверяются одним запросом, затем заказы
+    по порядку получают товары из оставшегося наличия: заказ создается
+    целиком или не создается вовсе. Остатки уменьшаются одним UPDATE,
+    заказы и их позиции создаются через bulk_create.
+    Возвращает список в порядке orders: {"order": заказ}
+    или {"errors": [сообщения]}.
+    """
+    results = [None] * len(orders)
+    colorproducts = ColorProduct.objects.select_related(
+        "product", "color"
+    ).in_bulk({pk for order in orders for pk in order["items"]})
+
+    accepted = []
+    for index, data in enumerate(orders):
+        missing = sorted(set(data["items"]) - set(colorproducts))
+        if missing:
+            results[index] = {
+                "errors": [f"Товары цвета не найдены: {missing}."]
+            }
+        else:
+            accepted.append(index)
+
+    # Если пакет не удался, списания распродажи возвращаются в счетчики
+    with release_holds_on_error() as holds:
+        stock = load_stock([orders[index] for index in accepted])
+        flash_sale = get_flash_sale_lines(
+            [orders[index] for index in accepted]
+        )
+        sold = Counter()
+        created = []
+        for index in accepted:
+            data = orders[index]
+            shop_id = data["shop"].pk
+            lines = [
+                OrderProduct(
+                    product=colorproducts[pk].product,
+                    colorproduct=colorproducts[pk],
+                    price=colorproducts[pk].product.actual_price,
+                    quantity=quantity,
+                )
+                for pk, quantity in data["items"].items()
+            ]
+            # Позиции распродажи списываются в Redis, остальные - в БД
+            flash_sale_items = {
+                pk: quantity
+                for pk, quantity in data["items"].items()
+                if pk in flash_sale[shop_id]
+            }
+            shortages = {}
+            for pk, quantity in data["items"].items():
+                if pk in flash_sale_items:
+                    continue
+                row_id, available = stock.get((shop_id, pk), (None, 0))
+                available -= sold[row_id]
+                if available < quantity:
+                    shortages[pk] = max(available, 0)
+            if not shortages:
+                try:
+                    holds.append(
+                        decrement_flash_sale_stock(shop_id, flash_sale_items)
+                    )
+                except InsufficientStock as error:
+                    shortages = error.shortages
+            if shortages:
+                results[index] = {
+                    "errors": [
+                        get_shortage_message(
+                            line, shortages[line.colorproduct_id]
+                        )
+                        for line in lines
+                        if line.colorproduct_id in shortages
+                    ]
+                }
+                continue
+
+            for pk, quantity in data["items"].items():
+                if pk not in flash_sale_items:
+                    sold[stock[(shop_id, pk)][0]] += quantity
+            created.append((index, build_order(user, data, lines), lines))
+
+        subtract_stock(sold)
+        Order.objects.bulk_create([order for _, order, _ in created])
+        order_products = []
+        for index, order, lines in created:
+            for line in lines:
+                line.order = order
+            order_products.extend(lines)
+            results[index] = {"order": order}
+        OrderProduct.objects.bulk_create(order_products)
+
+        # UPDATE не вызывает сигналы, поэтому пересчитываем статистику явно
+        refresh_stock({line.product_id for line in order_products})
+    return results
@@ -0,0 +1,475 @@
+import time
+import uuid
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.db import connections, transaction
+
+from main.models import ColorProduct, ColorProductShop
+from main.utils import get_redis
+from orders.stock import InsufficientStock
+
+flash_sale_redis_url = getattr(settings, "FLASH_SALE_REDIS_URL", None)
+flash_sale_hold_timeout = getattr(settings, "FLASH_SALE_HOLD_TIMEOUT", 60)
+
+# Хэш остатков товаров распродажи {"id магазина:id товара цвета": остаток}
+STOCK_KEY = "flash_sale:stock"
+# Хэш проданных, но еще не записанных в БД товаров (в том же формате)
+SOLD_KEY = "flash_sale:sold"
+# Незавершенные списания {токен: срок}: списанное количество хранится
+# в хэше HOLD_KEY до фиксации транзакции заказа
+HOLDS_KEY = "flash_sale:holds"
+HOLD_KEY = "flash_sale:hold:{}"
+# Запуски flush_flash_sales {ключ запуска: время}: очередь проданных
+# переименовывается в ключ запуска и удаляется после записи в БД
+FLUSHES_KEY = "flash_sale:flushes"
+FLUSH_KEY = "flash_sale:sold:{}"
+# Проданное сверх остатка {"id магазина:id товара цвета": количество}:
+# списания, которые зафиксировались после возврата по сроку, когда
+# в счетчике уже не хватало товара
+OVERSOLD_KEY = "flash_sale:oversold"
+
+# Переводим в распродажу товары, которые еще не в ней и по которым нет
+# незавершенных списаний и незаписанных продаж (иначе остаток из БД
+# их не учитывает).
+# KEYS: остатки, проданные, незавершенные списания.
+# ARGV: префикс ключа списания, затем пары поле - остаток.
+# Возвращает переведенные поля.
+START_SCRIPT = """
+local busy = {}
+for _, token in ipairs(redis.call("ZRANGE", KEYS[3], 0, -1)) do
+    for _, field in ipairs(redis.call("HKEYS", ARGV[1] .. token)) do
+        busy[field] = true
+    end
+end
+local started = {}
+for i = 2, #ARGV, 2 do
+    if not busy[ARGV[i]]
+            and redis.call("HEXISTS", KEYS[1], ARGV[i]) == 0
+            and redis.call("HEXISTS", KEYS[2], ARGV[i]) == 0 then
+        redis.call("HSET", KEYS[1], ARGV[i], ARGV[i + 1])
+        table.insert(started, ARGV[i])
+    end
+end
+return started
+"""
+
+# Проверяем все счетчики и списываем все позиции или ни одной.
+# KEYS: остатки, незавершенные списания, хэш списания.
+# ARGV: токен, срок, затем пары поле - количество.
+# Возвращает пары поле - остаток для позиций, которых не хватает.
+DECREMENT_SCRIPT = """
+local shortages = {}
+for i = 3, #ARGV, 2 do
+    local stock = tonumber(redis.call("HGET", KEYS[1], ARGV[i]) or "0")
+    if stock < tonumber(ARGV[i + 1]) then
+        table.insert(shortages, ARGV[i])
+        table.insert(shortages, math.max(stock, 0))
+    end
+end
+if #shortages > 0 then
+    return shortages
+end
+for i = 3, #ARGV, 2 do
+    redis.call("HINCRBY", KEYS[1], ARGV[i], -tonumber(ARGV[i + 1]))
+    redis.call("HSET", KEYS[3], ARGV[i], ARGV[i + 1])
+end
+redis.call("ZADD", KEYS[2], ARGV[2], ARGV[1])
+return shortages
+"""
+
+# Переносим списание в очередь проданных. Если списание уже вернули
+# по сроку, остатки списываются повторно, но не ниже нуля: нехватка
+# записывается в хэш проданного сверх остатка.
+# KEYS: остатки, проданные, незавершенные списания, хэш списания,
+# проданное сверх остатка.
+# ARGV: токен, затем пары поле - количество.
+# Возвращает пары поле - количество, проданное сверх остатка.
+COMMIT_SCRIPT = """
+local oversold = {}
+if redis.call("ZREM", KEYS[3], ARGV[1]) == 0 then
+    for i = 2, #ARGV, 2 do
+        local stock = redis.call("HGET", KEYS[1], ARGV[i])
+        if stock then
+            local quantity = tonumber(ARGV[i + 1])
+            local taken = math.min(math.max(tonumber(stock), 0), quantity)
+            redis.call("HINCRBY", KEYS[1], ARGV[i], -taken)
+            if taken < quantity then
+                redis.call("HINCRBY", KEYS[5], ARGV[i], quantity - taken)
+                table.insert(oversold, ARGV[i])
+                table.insert(oversold, quantity - taken)
+            end
+        end
+    end
+end
+for i = 2, #ARGV, 2 do
+    redis.call("HINCRBY", KEYS[2], ARGV[i], ARGV[i + 1])
+end
+redis.call("DEL", KEYS[4])
+return oversold
+"""
+
+# Возвращаем списания в счетчики (кроме снятых с распродажи товаров).
+# KEYS: остатки, незавершенные списания, затем хэши списаний.
+# ARGV: токены в том же порядке. Возвращает число возвращенных.
+RELEASE_SCRIPT = """
+local released = 0
+for i = 1, #ARGV do
+    if redis.call("ZREM", KEYS[2], ARGV[i]) == 1 then
+        local lines = redis.call("HGETALL", KEYS[i + 2])
+        for j = 1, #lines, 2 do
+            if redis.call("HEXISTS", KEYS[1], lines[j]) == 1 then
+                redis.call("HINCRBY", KEYS[1], lines[j], lines[j + 1])
+            end
+        end
+        released = released + 1
+    end
+    redis.call("DEL", KEYS[i + 2])
+end
+return released
+"""
+
+# Переименовываем очередь проданных в ключ запуска.
+# KEYS: проданные, ключ запуска, запуски. ARGV: время запуска.
+BEGIN_FLUSH_SCRIPT = """
+if redis.call("EXISTS", KEYS[1]) == 0 then
+    return {}
+end
+redis.call("RENAME", KEYS[1], KEYS[2])
+redis.call("ZADD", KEYS[3], ARGV[1], KEYS[2])
+return redis.call("HGETALL", KEYS[2])
+"""
+
+# Возвращаем незаписанные запуски в очередь проданных.
+# KEYS: проданные, запуски, затем ключи запусков.
+RETURN_FLUSH_SCRIPT = """
+for i = 3, #KEYS do
+    if redis.call("ZREM", KEYS[2], KEYS[i]) == 1 then
+        local lines = redis.call("HGETALL", KEYS[i])
+        for j = 1, #lines, 2 do
+            redis.call("HINCRBY", KEYS[1], lines[j], lines[j + 1])
+        end
+    end
+    redis.call("DEL", KEYS[i])
+end
+"""
+
+
+def flash_sale_enabled():
+    """Настроен ли Redis для режима распродажи."""
+    return bool(flash_sale_redis_url)
+
+
+def get_flash_sale_redis():
+    return get_redis(flash_sale_redis_url)
+
+
+def get_field(shop_id, colorproduct_id):
+    return f"{shop_id}:{colorproduct_id}"
+
+
+def parse_field(field):
+    shop_id, colorproduct_id = field.split(":")
+    return int(shop_id), int(colorproduct_id)
+
+
+def run_script(script, keys, args=()):
+    redis = get_flash_sale_redis()
+    return redis.register_script(script)(keys=keys, args=args, client=redis)
+
+
+def flatten(mapping):
+    return [item for pair in mapping.items() for item in pair]
+
+
+def get_flash_sale_items(shop_id, colorproduct_ids):
+    """
+    Id товаров цвета, которые продаются в магазине в режиме распродажи
+    (одним запросом к Redis).
+    """
+    if not flash_sale_enabled() or not colorproduct_ids:
+        return set()
+    colorproduct_ids = list(colorproduct_ids)
+    values = get_flash_sale_redis().hmget(
+        STOCK_KEY, [get_field(shop_id, pk) for pk in colorproduct_ids]
+    )
+    return {
+        pk
+        for pk, value in zip(colorproduct_ids, values)
+        if value is not None
+    }
+
+
+def get_flash_sale_stock(pairs):
+    """
+    Остатки товаров распродажи для пар (id магазина, id товара цвета)
+    одним запросом к Redis: {пара: остаток} только для товаров,
+    которые продаются в режиме распродажи.
+    """
+    if not flash_sale_enabled() or not pairs:
+        return {}
+    pairs = list(pairs)
+    values = get_flash_sale_redis().hmget(
+        STOCK_KEY, [get_field(*pair) for pair in pairs]
+    )
+    return {
+        pair: max(int(value), 0)
+        for pair, value in zip(pairs, values)
+        if value is not None
+    }
+
+
+def start_flash_sale(shop_id, colorproduct_ids):
+    """
+    Переводим товары магазина в режим распродажи: остатки (без учета
+    резервов) копируются в счетчики Redis, и дальше товары списываются
+    только в Redis. Товары, которые уже в распродаже или по которым
+    есть незавершенные списания и незаписанные в БД продажи,
+    пропускаются: остаток в БД их еще не учитывает. Такие товары можно
+    перевести после stop_flash_sale или flush_flash_sales.
+    Возвращает количество переведенных товаров.
+    """
+    rows = ColorProductShop.objects.filter(
+        shop_id=shop_id, colorproduct_id__in=colorproduct_ids
+    ).values_list("colorproduct_id", "quantity", "reserved")
+    mapping = {
+        get_field(shop_id, colorproduct_id): max(quantity - reserved, 0)
+        for colorproduct_id, quantity, reserved in rows
+    }
+    if not mapping:
+        return 0
+    started = run_script(
+        START_SCRIPT,
+        [STOCK_KEY, SOLD_KEY, HOLDS_KEY],
+        [HOLD_KEY.format(""), *flatten(mapping)],
+    )
+    return len(started)
+
+
+def stop_flash_sale(shop_id, colorproduct_ids):
+    """
+    Возвращаем товары магазина к списанию в БД: счетчики удаляются,
+    а проданное количество записывается в БД.
+    Заказы, транзакции которых еще не завершились, запишутся следующим
+    запуском flush_flash_sales, а списания откатившихся заказов
+    в снятые счетчики не возвращаются.
+    """
+    fields = [get_field(shop_id, pk) for pk in colorproduct_ids]
+    if fields:
+        get_flash_sale_redis().hdel(STOCK_KEY, *fields)
+    return flush_flash_sales()
+
+
+class FlashSaleHold:
+    """
+    Списание товаров распродажи, ожидающее фиксации транзакции заказа.
+    После фиксации количество переходит в очередь записи в БД (commit),
+    при ошибке заказа его возвращают в счетчики (release). Если
+    транзакция откатилась без вызова release, списание вернет
+    release_expired_holds через FLASH_SALE_HOLD_TIMEOUT секунд.
+    """
+
+    def __init__(self, shop_id, quantities):
+        self.token = uuid.uuid4().hex
+        self.lines = {
+            get_field(shop_id, colorproduct_id): quantity
+            for colorproduct_id, quantity in quantities.items()
+        }
+        self.released = False
+
+    @property
+    def key(self):
+        return HOLD_KEY.format(self.token)
+
+    def acquire(self):
+        """
+        Списываем все позиции одним скриптом Lua: если какого-то
+        товара не хватает, ни один счетчик не меняется (пол - 0),
+        и вызывается InsufficientStock.
+        """
+        shortages = run_script(
+            DECREMENT_SCRIPT,
+            [STOCK_KEY, HOLDS_KEY, self.key],
+            [
+                self.token,
+                time.time() + flash_sale_hold_timeout,
+                *flatten(self.lines),
+            ],
+        )
+        if shortages:
+            raise InsufficientStock(
+                {
+                    parse_field(field)[1]: int(available)
+                    for field, available in zip(
+                        shortages[::2], shortages[1::2]
+                    )
+                }
+            )
+
+    def commit(self):
+        if self.released:
+            return
+        run_script(
+            COMMIT_SCRIPT,
+            [STOCK_KEY, SOLD_KEY, HOLDS_KEY, self.key, OVERSOLD_KEY],
+            [self.token, *flatten(self.lines)],
+        )
+
+    def release(self):
+        if self.released:
+            return
+        self.released = True
+        release_holds([self.token])
+
+
+def get_oversold():
+    """
+    Проданное сверх остатка: {(id магазина, id товара цвета): количество}.
+    """
+    if not flash_sale_enabled():
+        return {}
+    return {
+        parse_field(field): int(quantity)
+        for field, quantity in get_flash_sale_redis()
+        .hgetall(OVERSOLD_KEY)
+        .items()
+    }
+
+
+def release_holds(tokens):
+    """Возвращаем незавершенные списания в счетчики одним скриптом."""
+    if not tokens:
+        return 0
+    return run_script(
+        RELEASE_SCRIPT,
+        [STOCK_KEY, HOLDS_KEY, *(HOLD_KEY.format(token) for token in tokens)],
+        tokens,
+    )
+
+
+def release_expired_holds():
+    """
+    Возвращаем в счетчики списания, транзакции заказов которых
+    не зафиксировались за FLASH_SALE_HOLD_TIMEOUT секунд
+    (откатились или процесс завершился до фиксации).
+    Возвращает число возвращенных списаний.
+    """
+    if not flash_sale_enabled():
+        return 0
+    return release_holds(
+        get_flash_sale_redis().zrangebyscore(HOLDS_KEY, "-inf", time.time())
+    )
+
+
+def decrement_flash_sale_stock(shop_id, quantities):
+    """
+    Списываем товары распродажи в Redis без блокировок: все позиции
+    или ни одной (см. FlashSaleHold.acquire).
+    Принимает словарь {id товара цвета: количество}, при нехватке
+    вызывает InsufficientStock.
+    Проданное количество попадает в очередь записи в БД только после
+    фиксации транзакции заказа. Если заказ после списания не удался,
+    товары возвращают через release() возвращенного списания, а если
+    транзакция откатилась позже - их вернет release_expired_holds.
+    """
+    if not quantities:
+        return None
+    hold = FlashSaleHold(shop_id, quantities)
+    hold.acquire()
+    transaction.on_commit(hold.commit)
+    return hold
+
+
+@contextmanager
+def release_holds_on_error():
+    """
+    Собираем списания распродажи в блоке (список holds) и возвращаем
+    их в счетчики, если блок завершился ошибкой.
+    """
+    holds = []
+    try:
+        yield holds
+    except Exception:
+        for hold in holds:
+            if hold:
+                hold.release()
+        raise
+
+
+def return_flushes(keys):
+    """Возвращаем незаписанные в БД запуски в очередь проданных."""
+    if keys:
+        run_script(RETURN_FLUSH_SCRIPT, [SOLD_KEY, FLUSHES_KEY, *keys])
+
+
+def finish_flush(key):
+    pipe = get_flash_sale_redis().pipeline(transaction=True)
+    pipe.zrem(FLUSHES_KEY, key)
+    pipe.delete(key)
+    pipe.execute()
+
+
+def flush_flash_sales(using="default"):
+    """
+    Записываем проданные в распродаже товары в ColorProductShop.
+    Сначала возвращаются просроченные списания и зависшие запуски,
+    затем очередь переименовывается в ключ запуска, и остатки
+    уменьшаются одним UPDATE для всех позиций. Ключ запуска удаляется
+    только после фиксации транзакции, а если запись не удалась,
+    количество возвращается в очередь.
+    Возвращает id товаров, наличие которых изменилось.
+    """
+    if not flash_sale_enabled():
+        return set()
+    release_expired_holds()
+    redis = get_flash_sale_redis()
+    now = time.time()
+    # Запуски, которые не завершились за срок (процесс упал до записи)
+    return_flushes(
+        redis.zrangebyscore(
+            FLUSHES_KEY, "-inf", now - flash_sale_hold_timeout
+        )
+    )
+    key = FLUSH_KEY.format(uuid.uuid4().hex)
+    sold = run_script(BEGIN_FLUSH_SCRIPT, [SOLD_KEY, key, FLUSHES_KEY], [now])
+    if not sold:
+        return set()
+
+    lines = [
+        (*parse_field(field), int(n))
+        for field, n in zip(sold[::2], sold[1::2])
+    ]
+    shop_ids, colorproduct_ids, deltas = map(list, zip(*lines))
+    table = ColorProductShop._meta.db_table
+    sql = f"""
+        WITH line AS (
+            SELECT * FROM unnest(
+                %s::bigint[], %s::bigint[], %s::integer[]
+            ) AS line (shop_id, colorproduct_id, quantity)
+        ),
+        locked AS (
+            SELECT cps.id FROM {table} cps
+            JOIN line ON line.shop_id = cps.shop_id
+                AND line.colorproduct_id = cps.colorproduct_id
+            ORDER BY cps.id
+            FOR UPDATE OF cps
+        )
+        UPDATE {table} AS cps
+        SET quantity = GREATEST(cps.quantity - line.quantity, 0)
+        FROM line, {ColorProduct._meta.db_table} cp
+        WHERE cps.id IN (SELECT id FROM locked)
+            AND cps.shop_id = line.shop_id
+            AND cps.colorproduct_id = line.colorproduct_id
+            AND cp.id = cps.colorproduct_id
+        RETURNING cp.product_id
+    """
+    try:
+        with transaction.atomic(using=using):
+            with connections[using].cursor() as cursor:
+                cursor.execute(sql, [shop_ids, colorproduct_ids, deltas])
+                product_ids = {row[0] for row in cursor.fetchall()}
+            transaction.on_commit(lambda: finish_flush(key), using=using)
+            return product_ids
+    except Exception:
+        return_flushes([key])
+        raise
@@ -25,6 +25,8 @@ class CreateOrderForm(forms.Form):
             ("false", "Оплата картой"),
         ]
     )
+    # Ключ формы: повторная отправка той же формы не создает новый заказ
+    idempotency_key = forms.UUIDField(required=False)
 
     def clean(self):
         cleaned_data = super().clean()
@@ -43,3 +45,22 @@ class CreateOrderForm(forms.Form):
                 self.add_error("shop", "Выберите магазин.")
 
         return cleaned_data
+
+
+class ReserveOrderForm(forms.Form):
+    """Форма резерва товаров корзины в выбранном магазине."""
+
+    requires_delivery = forms.ChoiceField(
+        choices=[
+            ("true", "Требуется доставка"),
+            ("false", "Получение в магазине"),
+        ]
+    )
+    shop = forms.ModelChoiceField(queryset=Shop.objects.all(), required=False)
+
+    def clean(self):
+        cleaned_data = super().clean()
+        requires_delivery = cleaned_data.get("requires_delivery") == "true"
+        if not requires_delivery and not cleaned_data.get("shop"):
+            self.add_error("shop", "Выберите магазин.")
+        return cleaned_data
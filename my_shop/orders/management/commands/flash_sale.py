@@ -0,0 +1,59 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from orders.flash_sale import (flash_sale_enabled, flush_flash_sales,
+                               get_oversold, start_flash_sale, stop_flash_sale)
+from orders.reservations import refresh_stock
+
+
+class Command(BaseCommand):
+    help = """
+        Управление режимом распродажи (нужен FLASH_SALE_REDIS_URL).
+        Пример команды: python manage.py flash_sale start --shop 1 1 2 3
+        python manage.py flash_sale stop --shop 1 1 2 3
+        python manage.py flash_sale flush
+        """
+
+    def add_arguments(self, parser):
+        parser.add_argument("action", choices=("start", "stop", "flush"))
+        parser.add_argument("colorproducts", nargs="*", type=int)
+        parser.add_argument("--shop", type=int)
+
+    def handle(self, *args, **options):
+        if not flash_sale_enabled():
+            raise CommandError("FLASH_SALE_REDIS_URL не задан.")
+        action = options["action"]
+        if action == "flush":
+            refresh_stock(flush_flash_sales())
+            self.stdout.write(self.style.SUCCESS("Successfully flushed"))
+            self.write_oversold()
+            return
+
+        if options["shop"] is None or not options["colorproducts"]:
+            raise CommandError("Укажите магазин и id товаров цвета.")
+        if action == "start":
+            count = start_flash_sale(options["shop"], options["colorproducts"])
+            self.stdout.write(
+                self.style.SUCCESS(f"Successfully started for {count} items")
+            )
+            if count < len(set(options["colorproducts"])):
+                self.stdout.write(
+                    self.style.WARNING(
+                        "Остальные товары уже в распродаже, ожидают записи "
+                        "в БД (flush) или отсутствуют в магазине."
+                    )
+                )
+        else:
+            refresh_stock(
+                stop_flash_sale(options["shop"], options["colorproducts"])
+            )
+            self.stdout.write(self.style.SUCCESS("Successfully stopped"))
+            self.write_oversold()
+
+    def write_oversold(self):
+        for (shop_id, colorproduct_id), quantity in get_oversold().items():
+            self.stdout.write(
+                self.style.WARNING(
+                    f"Продано сверх остатка: магазин {shop_id}, "
+                    f"товар цвета {colorproduct_id} - {quantity} шт."
+                )
+            )
@@ -0,0 +1,56 @@
+# Generated by Django 3.2.16 on 2026-10-18 15:10
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    initial = True
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('main', '0002_sync_models'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Order',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('created_at', models.DateTimeField(auto_now_add=True, verbose_name='Дата создания заказа')),
+                ('phone', models.CharField(max_length=20, verbose_name='Номер телефона')),
+                ('requires_delivery', models.BooleanField(default=False, verbose_name='Требуется доставка')),
+                ('delivery_city', models.CharField(blank=True, max_length=30, null=True, verbose_name='Город доставки')),
+                ('delivery_adress', models.CharField(blank=True, max_length=150, null=True, verbose_name='Адрес доставки')),
+                ('payment_on_get', models.BooleanField(default=False, verbose_name='Оплата при получении')),
+                ('is_paid', models.BooleanField(default=False, verbose_name='Заказ оплачен')),
+                ('status', models.CharField(default='В обработке', max_length=50, verbose_name='Статус заказа')),
+                ('shop', models.ForeignKey(blank=True, default=None, null=True, on_delete=django.db.models.deletion.SET_DEFAULT, related_name='orders', to='main.shop', verbose_name='Забор из магазина')),
+                ('user', models.ForeignKey(blank=True, default=None, null=True, on_delete=django.db.models.deletion.SET_DEFAULT, related_name='orders', to=settings.AUTH_USER_MODEL, verbose_name='Пользователь')),
+            ],
+            options={
+                'verbose_name': 'заказ',
+                'verbose_name_plural': 'Заказы',
+                'default_related_name': 'orders',
+            },
+        ),
+        migrations.CreateModel(
+            name='OrderProduct',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('price', models.DecimalField(decimal_places=2, max_digits=7, verbose_name='Цена продажи')),
+                ('quantity', models.PositiveIntegerField(default=0, verbose_name='Количество')),
+                ('created_at', models.DateTimeField(auto_now_add=True, verbose_name='Дата продажи')),
+                ('colorproduct', models.ForeignKey(blank=True, default=None, null=True, on_delete=django.db.models.deletion.SET_DEFAULT, related_name='orderedproducts', to='main.colorproduct', verbose_name='Цвет товара')),
+                ('order', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='orderedproducts', to='orders.order', verbose_name='Заказ')),
+                ('product', models.ForeignKey(blank=True, default=None, null=True, on_delete=django.db.models.deletion.SET_DEFAULT, related_name='orderedproducts', to='main.product', verbose_name='Товар')),
+            ],
+            options={
+                'verbose_name': 'заказанный товар',
+                'verbose_name_plural': 'Заказанные товары',
+                'default_related_name': 'orderedproducts',
+            },
+        ),
+    ]
@@ -0,0 +1,32 @@
+# Generated by Django 3.2.16 on 2026-10-18 15:11
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('main', '0008_stock_reservations'),
+        ('orders', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='StockReservation',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('quantity', models.PositiveIntegerField(verbose_name='Количество')),
+                ('expires_at', models.DateTimeField(db_index=True, verbose_name='Действует до')),
+                ('colorproductshop', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='reservations', to='main.colorproductshop', verbose_name='Товар в магазине')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='reservations', to=settings.AUTH_USER_MODEL, verbose_name='Пользователь')),
+            ],
+            options={
+                'verbose_name': 'резерв товара',
+                'verbose_name_plural': 'Резервы товаров',
+                'default_related_name': 'reservations',
+            },
+        ),
+    ]
@@ -0,0 +1,50 @@
+# Generated by Django 3.2.16 on 2026-10-18 15:11
+
+from decimal import Decimal
+from django.db import migrations, models
+
+# Итоги уже оформленных заказов по их позициям (скидка - от текущей
+# цены товара, как при оформлении). Позиции удаленных товаров
+# (product_id = NULL) входят в количество и сумму, но не в скидку
+BACKFILL_SQL = """
+    UPDATE orders_order AS o
+    SET total_quantity = line.quantity,
+        total_price = line.price,
+        total_saving = line.saving
+    FROM (
+        SELECT op.order_id,
+            SUM(op.quantity) AS quantity,
+            SUM(op.price * op.quantity) AS price,
+            SUM(COALESCE(p.price - op.price, 0) * op.quantity) AS saving
+        FROM orders_orderproduct op
+        LEFT JOIN main_product p ON p.id = op.product_id
+        GROUP BY op.order_id
+    ) AS line
+    WHERE o.id = line.order_id
+"""
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('orders', '0003_idempotency_keys'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='order',
+            name='total_price',
+            field=models.DecimalField(decimal_places=2, default=Decimal('0'), max_digits=12, verbose_name='Сумма заказа'),
+        ),
+        migrations.AddField(
+            model_name='order',
+            name='total_quantity',
+            field=models.PositiveIntegerField(default=0, verbose_name='Количество товаров'),
+        ),
+        migrations.AddField(
+            model_name='order',
+            name='total_saving',
+            field=models.DecimalField(decimal_places=2, default=Decimal('0'), max_digits=12, verbose_name='Сумма скидки'),
+        ),
+        migrations.RunSQL(BACKFILL_SQL, migrations.RunSQL.noop),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 3.2.16 on 2026-10-18 15:35
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('orders', '0004_order_totals'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='order',
+            index=models.Index(fields=['user', '-created_at', 'id'], name='order_user_created_idx'),
+        ),
+    ]
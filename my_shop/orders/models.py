@@ -1,20 +1,80 @@
+from datetime import timedelta
+from decimal import Decimal
+
+from django.conf import settings
 from django.contrib.auth import get_user_model
-from django.db import models
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import connections, models
+from django.db.models import Count, ExpressionWrapper, F, Sum
+from django.db.models.functions import Coalesce
+from django.utils import timezone
 
-from main.models import ColorProduct, Product, Shop
+from main.models import ColorProduct, ColorProductShop, Product, Shop
 
 User = get_user_model()
 
+idempotency_key_ttl = getattr(
+    settings, "ORDER_IDEMPOTENCY_KEY_TTL", 60 * 60 * 24
+)
+
+
+# Тип результата для сумм по заказам
+MONEY_FIELD = models.DecimalField(max_digits=12, decimal_places=2)
+
 
 class OrderProductQuerySet(models.QuerySet):
+    """Переопределяем QuerySet для OrderProduct."""
+
+    def with_prices(self):
+        """
+        Добавляем стоимость позиции по цене продажи (line_price),
+        посчитанную в БД.
+        """
+        return self.annotate(
+            line_price=ExpressionWrapper(
+                F("quantity") * F("price"), output_field=MONEY_FIELD
+            )
+        )
+
+    def totals(self):
+        """
+        Итоги заказанных товаров одним запросом: количество позиций,
+        количество товаров и сумма по ценам продажи.
+        """
+        return (
+            self.order_by()
+            .with_prices()
+            .aggregate(
+                lines=Count("id"),
+                total_quantity=Coalesce(Sum("quantity"), 0),
+                total_price=Coalesce(Sum("line_price"), Decimal(0)),
+            )
+        )
 
     def total_price(self):
-        return sum(cart.products_price() for cart in self)
+        return self.totals()["total_price"]
 
     def total_quantity(self):
-        if self:
-            return sum(cart.quantity for cart in self)
-        return 0
+        return self.totals()["total_quantity"]
+
+
+class OrderQuerySet(models.QuerySet):
+    """Переопределяем QuerySet для Order."""
+
+    def with_products(self):
+        """
+        Подгружаем товары заказов одним запросом вместе с названиями
+        товаров и цветов, чтобы вывод состава заказа не делал запросов
+        на каждую позицию.
+        """
+        return self.prefetch_related(
+            models.Prefetch(
+                "orderedproducts",
+                queryset=OrderProduct.objects.select_related(
+                    "product", "colorproduct__color"
+                ),
+            )
+        )
 
 
 class Order(models.Model):
@@ -56,11 +116,36 @@ class Order(models.Model):
     status = models.CharField(
         verbose_name="Статус заказа", max_length=50, default="В обработке"
     )
+    # Итоги заказа сохраняются при оформлении
+    total_quantity = models.PositiveIntegerField(
+        verbose_name="Количество товаров", default=0
+    )
+    total_price = models.DecimalField(
+        verbose_name="Сумма заказа",
+        max_digits=12,
+        decimal_places=2,
+        default=Decimal(0),
+    )
+    total_saving = models.DecimalField(
+        verbose_name="Сумма скидки",
+        max_digits=12,
+        decimal_places=2,
+        default=Decimal(0),
+    )
+
+    objects = OrderQuerySet.as_manager()
 
     class Meta:
         verbose_name = "заказ"
         verbose_name_plural = "Заказы"
         default_related_name = "orders"
+        indexes = (
+            # Постраничный вывод заказов пользователя от новых к старым
+            models.Index(
+                fields=("user", "-created_at", "id"),
+                name="order_user_created_idx",
+            ),
+        )
 
     def __str__(self) -> str:
         return f"Заказ № {self.id} | Покупатель: {self.user.username}"
@@ -107,4 +192,139 @@ class OrderProduct(models.Model):
         return f"Товар № {self.product.name} | Заказ: {self.order.id}"
 
     def total_price(self):
-        return round(self.product.actual_price * self.quantity, 2)
+        """Стоимость позиции по цене продажи."""
+        return round(self.price * self.quantity, 2)
+
+
+class StockReservation(models.Model):
+    """
+    Резерв товара в магазине на время оформления заказа.
+    Количество резерва учитывается в ColorProductShop.reserved,
+    просроченные резервы снимаются периодической задачей.
+    """
+
+    user = models.ForeignKey(
+        to=User, verbose_name="Пользователь", on_delete=models.CASCADE
+    )
+    colorproductshop = models.ForeignKey(
+        to=ColorProductShop,
+        verbose_name="Товар в магазине",
+        on_delete=models.CASCADE,
+    )
+    quantity = models.PositiveIntegerField(verbose_name="Количество")
+    expires_at = models.DateTimeField(
+        verbose_name="Действует до", db_index=True
+    )
+
+    class Meta:
+        verbose_name = "резерв товара"
+        verbose_name_plural = "Резервы товаров"
+        default_related_name = "reservations"
+
+    def __str__(self) -> str:
+        return f"Резерв {self.user} | {self.colorproductshop_id}"
+
+
+class IdempotencyKeyQuerySet(models.QuerySet):
+    """Переопределяем QuerySet для IdempotencyKey."""
+
+    def claim(self, user, key, fingerprint=""):
+        """
+        Занимаем ключ идемпотентности пользователя одним запросом
+        INSERT ... ON CONFLICT: ключ, срок хранения которого истек,
+        занимается заново.
+        Одновременный запрос с тем же ключом ждет завершения транзакции,
+        которая его заняла, поэтому вызывать нужно в той же транзакции,
+        что и создание заказа: при ошибке ключ освобождается вместе
+        с откатом.
+        Возвращает (ключ, True), если ключ занят этим вызовом,
+        или (сохраненный ключ, False) для повторного запроса.
+        """
+        now = timezone.now()
+        table = self.model._meta.db_table
+        sql = f"""
+            INSERT INTO {table} (user_id, key, fingerprint, created_at)
+            VALUES (%s, %s, %s, %s)
+            ON CONFLICT (user_id, key) DO UPDATE
+            SET fingerprint = EXCLUDED.fingerprint,
+                created_at = EXCLUDED.created_at,
+                order_id = NULL,
+                status_code = NULL,
+                response = NULL
+            WHERE {table}.created_at <= %s
+            RETURNING id
+        """
+        params = [
+            user.pk,
+            key,
+            fingerprint,
+            now,
+            now - timedelta(seconds=idempotency_key_ttl),
+        ]
+        with connections[self.db].cursor() as cursor:
+            cursor.execute(sql, params)
+            row = cursor.fetchone()
+        if row is None:
+            return self.get(user=user, key=key), False
+        record = self.model(
+            id=row[0],
+            user=user,
+            key=key,
+            fingerprint=fingerprint,
+            created_at=now,
+        )
+        return record, True
+
+    def expired(self):
+        """Ключи, срок хранения которых истек."""
+        return self.filter(
+            created_at__lte=timezone.now()
+            - timedelta(seconds=idempotency_key_ttl)
+        )
+
+
+class IdempotencyKey(models.Model):
+    """
+    Ключ идемпотентности запроса на создание заказа.
+    Повторный запрос с тем же ключом (например, после обрыва связи)
+    не создает новый заказ, а получает сохраненный ответ.
+    """
+
+    user = models.ForeignKey(
+        to=User, verbose_name="Пользователь", on_delete=models.CASCADE
+    )
+    key = models.CharField(verbose_name="Ключ", max_length=255)
+    fingerprint = models.CharField(
+        verbose_name="Хэш параметров запроса", max_length=64, blank=True
+    )
+    order = models.ForeignKey(
+        to=Order,
+        verbose_name="Заказ",
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+    )
+    status_code = models.PositiveSmallIntegerField(
+        verbose_name="Код ответа", null=True, blank=True
+    )
+    response = models.JSONField(
+        verbose_name="Ответ", encoder=DjangoJSONEncoder, null=True, blank=True
+    )
+    created_at = models.DateTimeField(
+        verbose_name="Дата создания", db_index=True
+    )
+
+    objects = IdempotencyKeyQuerySet.as_manager()
+
+    class Meta:
+        verbose_name = "ключ идемпотентности"
+        verbose_name_plural = "Ключи идемпотентности"
+        default_related_name = "idempotency_keys"
+        constraints = (
+            models.UniqueConstraint(
+                fields=("user", "key"), name="idempotencykey_user_key_uniq"
+            ),
+        )
+
+    def __str__(self) -> str:
+        return f"Ключ {self.key} | {self.user}"
@@ -0,0 +1,146 @@
+from django.db.models import F, OuterRef, Subquery, Sum
+from django.db.models.functions import Coalesce
+
+from main.choices import SHOP_KIND_WAREHOUSE
+from main.models import ColorProductShop
+from orders.flash_sale import get_flash_sale_stock
+from orders.models import StockReservation
+
+
+def load_stock_matrix(carts, shops, user=None):
+    """
+    Матрица наличия товаров корзины по магазинам одним запросом:
+    {id магазина: {id товара цвета: доступное количество}}.
+    Товары, зарезервированные другими покупателями, в наличие не входят
+    (резервы самого пользователя входят), а для товаров распродажи
+    берутся остатки из счетчиков Redis.
+    """
+    matrix = {shop.pk: {} for shop in shops}
+    own_reserved = (
+        StockReservation.objects.filter(
+            user=user, colorproductshop=OuterRef("pk")
+        )
+        .order_by()
+        .values("colorproductshop")
+        .annotate(total=Sum("quantity"))
+        .values("total")
+    )
+    rows = ColorProductShop.objects.filter(
+        shop_id__in=matrix,
+        colorproduct_id__in={item.colorproduct_id for item in carts},
+    ).values_list(
+        "shop_id",
+        "colorproduct_id",
+        F("quantity")
+        - F("reserved")
+        + Coalesce(Subquery(own_reserved), 0),
+    )
+    for shop_id, colorproduct_id, available in rows:
+        matrix[shop_id][colorproduct_id] = max(available, 0)
+    flash_sale = get_flash_sale_stock(
+        (shop_id, colorproduct_id)
+        for shop_id, available in matrix.items()
+        for colorproduct_id in available
+    )
+    for (shop_id, colorproduct_id), available in flash_sale.items():
+        matrix[shop_id][colorproduct_id] = available
+    return matrix
+
+
+def get_shop_coverage(shop, carts, available):
+    """
+    Покрытие корзины магазином: можно ли забрать все товары (full),
+    сколько позиций есть в нужном количестве (covered) и каких
+    не хватает (missing - [{"item": позиция, "available": в наличии}]).
+    """
+    missing = [
+        {"item": item, "available": available.get(item.colorproduct_id, 0)}
+        for item in carts
+        if available.get(item.colorproduct_id, 0) < item.quantity
+    ]
+    return {
+        "shop": shop,
+        "delivery": shop.kind == SHOP_KIND_WAREHOUSE,
+        "full": not missing,
+        "covered": len(carts) - len(missing),
+        "missing": missing,
+    }
+
+
+def suggest_split(carts, coverage, matrix):
+    """
+    Разбиение корзины по магазинам, если ни один магазин не может
+    выполнить ее целиком: жадно выбираем магазин, в котором есть
+    больше всего оставшихся позиций, пока такие магазины находятся.
+    Возвращает (части [{"shop": магазин, "items": [...]}],
+    позиции, которых нет в нужном количестве ни в одном магазине).
+    """
+    remaining = list(carts)
+    parts = []
+    while remaining:
+        best, items = None, []
+        for shop_coverage in coverage:
+            shop = shop_coverage["shop"]
+            available = matrix[shop.pk]
+            fits = [
+                {"item": item, "available": available[item.colorproduct_id]}
+                for item in remaining
+                if available.get(item.colorproduct_id, 0) >= item.quantity
+            ]
+            if len(fits) > len(items):
+                best, items = shop, fits
+        if best is None:
+            break
+        parts.append({"shop": best, "items": items})
+        taken = {line["item"].colorproduct_id for line in items}
+        remaining = [
+            item for item in remaining if item.colorproduct_id not in taken
+        ]
+    unavailable = [
+        {
+            "item": item,
+            "available": max(
+                (
+                    available.get(item.colorproduct_id, 0)
+                    for available in matrix.values()
+                ),
+                default=0,
+            ),
+        }
+        for item in remaining
+    ]
+    return parts, unavailable
+
+
+def plan_fulfilment(carts, shops, user=None):
+    """
+    План выполнения корзины: магазины, отсортированные по покрытию
+    (сначала те, где есть все товары, затем по количеству доступных
+    позиций и недостающему количеству), а если ни один магазин
+    не подходит целиком - предложение разбить заказ по магазинам.
+    Наличие всех товаров во всех магазинах загружается одним запросом.
+    """
+    carts = list(carts)
+    shops = [shop for shop in shops if shop is not None]
+    matrix = load_stock_matrix(carts, shops, user)
+    coverage = sorted(
+        (
+            get_shop_coverage(shop, carts, matrix[shop.pk])
+            for shop in shops
+        ),
+        key=lambda shop_coverage: (
+            not shop_coverage["full"],
+            -shop_coverage["covered"],
+            sum(
+                line["item"].quantity - line["available"]
+                for line in shop_coverage["missing"]
+            ),
+            shop_coverage["shop"].name,
+        ),
+    )
+    split, unavailable = [], []
+    if carts and not any(
+        shop_coverage["full"] for shop_coverage in coverage
+    ):
+        split, unavailable = suggest_split(carts, coverage, matrix)
+    return {"shops": coverage, "split": split, "unavailable": unavailable}
@@ -0,0 +1,167 @@
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import connections, transaction
+from django.db.models import F
+from django.utils import timezone
+
+from main.models import ColorProduct, ColorProductShop, ProductStats
+from main.page_cache import invalidate_product_pages
+from orders.flash_sale import get_flash_sale_items
+from orders.models import StockReservation
+
+reservation_ttl = getattr(settings, "STOCK_RESERVATION_TTL", 15 * 60)
+
+
+def release_reservations(user_id=None, expired=False, using="default"):
+    """
+    Снимаем резервы пользователя (или все просроченные) одним запросом:
+    резервы удаляются, а счетчики ColorProductShop.reserved уменьшаются
+    на их суммы. Строки наличия блокируются в порядке id, как и при
+    списании товаров, поэтому запрос не взаимоблокируется с заказами.
+    Возвращает id товаров, которые снова появились в наличии
+    (доступное количество было 0, а стало больше 0).
+    """
+    if user_id is not None:
+        condition, params = "user_id = %s", [user_id]
+    elif expired:
+        condition, params = "expires_at <= %s", [timezone.now()]
+    else:
+        return set()
+    table = ColorProductShop._meta.db_table
+    sql = f"""
+        WITH released AS (
+            DELETE FROM {StockReservation._meta.db_table}
+            WHERE {condition}
+            RETURNING colorproductshop_id, quantity
+        ),
+        totals AS (
+            SELECT colorproductshop_id AS id, SUM(quantity) AS quantity
+            FROM released
+            GROUP BY colorproductshop_id
+        ),
+        locked AS (
+            SELECT id FROM {table}
+            WHERE id IN (SELECT id FROM totals)
+            ORDER BY id
+            FOR UPDATE
+        )
+        UPDATE {table} AS cps
+        SET reserved = GREATEST(cps.reserved - totals.quantity, 0)
+        FROM totals, {ColorProduct._meta.db_table} cp
+        WHERE cps.id = totals.id
+            AND cps.id IN (SELECT id FROM locked)
+            AND cp.id = cps.colorproduct_id
+        RETURNING
+            cp.product_id,
+            cps.quantity - cps.reserved > 0
+                AND cps.quantity - cps.reserved - totals.quantity <= 0
+    """
+    with connections[using].cursor() as cursor:
+        cursor.execute(sql, params)
+        return {product_id for product_id, restocked in cursor if restocked}
+
+
+def reserve_stock(user_id, shop_id, quantities, expires_at, using="default"):
+    """
+    Резервируем товары в магазине до expires_at.
+    Принимает словарь {id товара цвета: количество}. Резервируются
+    только позиции, которых хватает с учетом чужих резервов; одним
+    запросом увеличиваются счетчики reserved и создаются резервы.
+    Возвращает (id товаров, которые зарезервированы целиком
+    (доступное количество стало 0), {id товара цвета: доступное
+    количество} для незарезервированных позиций).
+    """
+    if not quantities:
+        return set(), {}
+    table = ColorProductShop._meta.db_table
+    sql = f"""
+        WITH locked AS (
+            SELECT id FROM {table}
+            WHERE shop_id = %s AND colorproduct_id = ANY(%s)
+            ORDER BY id
+            FOR UPDATE
+        ),
+        updated AS (
+            UPDATE {table} AS cps
+            SET reserved = cps.reserved + line.quantity
+            FROM unnest(%s::bigint[], %s::integer[])
+                AS line (colorproduct_id, quantity)
+            WHERE cps.id IN (SELECT id FROM locked)
+                AND cps.colorproduct_id = line.colorproduct_id
+                AND cps.quantity - cps.reserved >= line.quantity
+            RETURNING
+                cps.id,
+                cps.colorproduct_id,
+                line.quantity,
+                cps.quantity - cps.reserved <= 0 AS sold_out
+        ),
+        inserted AS (
+            INSERT INTO {StockReservation._meta.db_table}
+                (user_id, colorproductshop_id, quantity, expires_at)
+            SELECT %s, id, quantity, %s FROM updated
+        )
+        SELECT updated.colorproduct_id, cp.product_id, updated.sold_out
+        FROM updated
+        JOIN {ColorProduct._meta.db_table} cp
+            ON cp.id = updated.colorproduct_id
+    """
+    colorproduct_ids = list(quantities)
+    params = [
+        shop_id,
+        colorproduct_ids,
+        colorproduct_ids,
+        list(quantities.values()),
+        user_id,
+        expires_at,
+    ]
+    with connections[using].cursor() as cursor:
+        cursor.execute(sql, params)
+        rows = cursor.fetchall()
+
+    reserved = {colorproduct_id for colorproduct_id, _, _ in rows}
+    missing = set(quantities) - reserved
+    shortages = {}
+    if missing:
+        available = dict(
+            ColorProductShop.objects.using(using)
+            .filter(shop_id=shop_id, colorproduct_id__in=missing)
+            .values_list("colorproduct_id", F("quantity") - F("reserved"))
+        )
+        shortages = {pk: available.get(pk, 0) for pk in missing}
+    sold_out = {product_id for _, product_id, empty in rows if empty}
+    return sold_out, shortages
+
+
+def refresh_stock(product_ids):
+    """
+    Обновляем статистику и страницы каталога после изменения наличия.
+    Резервы передают сюда только товары, доступность которых перешла
+    через 0, поэтому обычный резерв не сбрасывает кэш карточек и страниц.
+    """
+    if product_ids:
+        ProductStats.objects.refresh(product_ids)
+        invalidate_product_pages(product_ids)
+
+
+@transaction.atomic
+def reserve_cart(user, shop, carts):
+    """
+    Резервируем корзину пользователя в выбранном магазине.
+    Прежние резервы пользователя снимаются, поэтому при смене магазина
+    товар не остается заблокированным в двух местах.
+    Возвращает (время окончания резерва, {id товара цвета: доступно}
+    для позиций, которые зарезервировать не удалось).
+    """
+    expires_at = timezone.now() + timedelta(seconds=reservation_ttl)
+    restocked = release_reservations(user_id=user.pk)
+    quantities = {item.colorproduct_id: item.quantity for item in carts}
+    # Товары распродажи не резервируются: их остатки в Redis
+    # списываются в порядке оформления заказов
+    for colorproduct_id in get_flash_sale_items(shop.pk, quantities):
+        del quantities[colorproduct_id]
+    sold_out, shortages = reserve_stock(
+        user.pk, shop.pk, quantities, expires_at
+    )
+    refresh_stock(restocked | sold_out)
+    return expires_at, shortages
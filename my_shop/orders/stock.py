@@ -0,0 +1,95 @@
+from django.db import connections
+from django.db.models import F
+from django.forms import ValidationError
+
+from main.models import ColorProductShop
+
+
+class InsufficientStock(ValidationError):
+    """
+    Недостаточно товаров в магазине.
+    shortages - {id товара цвета: доступное количество}.
+    """
+
+    def __init__(self, shortages):
+        super().__init__("Недостаточное количество товаров в магазине.")
+        self.shortages = shortages
+
+
+def decrement_stock(shop_id, quantities, using="default"):
+    """
+    Списываем товары в магазине одним запросом без чтения и записи
+    абсолютных значений: UPDATE ... SET quantity = quantity - n
+    WHERE quantity - reserved >= n сразу для всех позиций (чужие резервы
+    не списываются; свои нужно снять до вызова).
+    Строки блокируются в порядке id, поэтому одновременные заказы
+    с пересекающимися товарами не взаимоблокируются, а условие
+    проверяется по актуальному количеству, поэтому товар не продается
+    больше, чем есть.
+    Принимает словарь {id товара цвета: количество}. Если хотя бы одной
+    позиции не хватает, вызывает InsufficientStock: часть позиций при этом
+    уже списана, поэтому вызывать нужно внутри транзакции, которая
+    откатится вместе с исключением.
+    """
+    if not quantities:
+        return
+    table = ColorProductShop._meta.db_table
+    sql = f"""
+        WITH locked AS (
+            SELECT id FROM {table}
+            WHERE shop_id = %s AND colorproduct_id = ANY(%s)
+            ORDER BY id
+            FOR UPDATE
+        )
+        UPDATE {table} AS cps
+        SET quantity = cps.quantity - line.quantity
+        FROM unnest(%s::bigint[], %s::integer[])
+            AS line (colorproduct_id, quantity)
+        WHERE cps.id IN (SELECT id FROM locked)
+            AND cps.colorproduct_id = line.colorproduct_id
+            AND cps.quantity - cps.reserved >= line.quantity
+        RETURNING cps.colorproduct_id
+    """
+    colorproduct_ids = list(quantities)
+    params = [
+        shop_id,
+        colorproduct_ids,
+        colorproduct_ids,
+        list(quantities.values()),
+    ]
+    with connections[using].cursor() as cursor:
+        cursor.execute(sql, params)
+        updated = {row[0] for row in cursor.fetchall()}
+
+    missing = set(quantities) - updated
+    if missing:
+        # Строки заблокированы нами, поэтому остатки актуальны
+        available = dict(
+            ColorProductShop.objects.using(using)
+            .filter(shop_id=shop_id, colorproduct_id__in=missing)
+            .values_list("colorproduct_id", F("quantity") - F("reserved"))
+        )
+        raise InsufficientStock(
+            {pk: available.get(pk, 0) for pk in missing}
+        )
+
+
+def subtract_stock(row_quantities, using="default"):
+    """
+    Уменьшаем остатки нескольких строк ColorProductShop одним UPDATE.
+    Принимает словарь {id строки: количество}; наличие должно быть
+    проверено заранее по строкам, заблокированным в той же транзакции.
+    """
+    if not row_quantities:
+        return
+    table = ColorProductShop._meta.db_table
+    sql = f"""
+        UPDATE {table} AS cps
+        SET quantity = cps.quantity - line.quantity
+        FROM unnest(%s::bigint[], %s::integer[]) AS line (id, quantity)
+        WHERE cps.id = line.id
+    """
+    with connections[using].cursor() as cursor:
+        cursor.execute(
+            sql, [list(row_quantities), list(row_quantities.values())]
+        )
@@ -0,0 +1,23 @@
+from celery import shared_task
+
+from orders.flash_sale import flush_flash_sales
+from orders.models import IdempotencyKey
+from orders.reservations import refresh_stock, release_reservations
+
+
+@shared_task
+def expire_reservations_task():
+    """Снимаем просроченные резервы товаров одним запросом."""
+    refresh_stock(release_reservations(expired=True))
+
+
+@shared_task
+def expire_idempotency_keys_task():
+    """Удаляем ключи идемпотентности, срок хранения которых истек."""
+    IdempotencyKey.objects.expired().delete()
+
+
+@shared_task
+def flush_flash_sales_task():
+    """Записываем проданные в распродаже товары в БД."""
+    refresh_stock(flush_flash_sales())
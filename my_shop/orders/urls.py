@@ -6,4 +6,5 @@ app_name = "order"
 
 urlpatterns = [
     path("create-order/", views.create_order, name="create_order"),
+    path("reserve/", views.reserve_order, name="reserve_order"),
 ]
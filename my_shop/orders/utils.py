@@ -1,29 +1,10 @@
-from django.db.models import Sum
 from django.forms import ValidationError
 
-from main.models import ColorProductShop
+from orders.flash_sale import (decrement_flash_sale_stock,
+                               get_flash_sale_items, release_holds_on_error)
 from orders.models import OrderProduct
-
-
-def get_available_products(user, shop):
-    """
-    Метод для получения информации о товаре в магазине в формате
-    {"colorproduct_id": Product()}.
-    """
-
-    # Одним запросом получаем доступное количество
-    # товаров в выбранном магазине
-    available_products = ColorProductShop.objects.filter(
-        colorproduct__shoppingcart__user=user,
-        shop=shop,
-    ).annotate(total=Sum("quantity"))
-
-    # Формируем словарь формата {"colorproduct_id": Product()}
-    product_quantities = {}
-    for product in available_products:
-        product_quantities[product.colorproduct_id] = product
-
-    return product_quantities
+from orders.reservations import refresh_stock, release_reservations
+from orders.stock import InsufficientStock, decrement_stock
 
 
 def update_user_info(user, cleaned_data):
@@ -37,45 +18,82 @@ def update_user_info(user, cleaned_data):
     user.save()
 
 
-def validate_cart_items(carts, product_quantities):
-    """Метод для проверки наличия товаров из корзины в магазине."""
-    for item in carts:
-        product_quantity = product_quantities.get(item.colorproduct_id)
-        # Проверяем доступен ли конкретный товар в выбранном магазине
-        if not product_quantity:
-            raise ValidationError(
-                f"В выбранном магазине товар {item.product} \
-                {item.colorproduct} отсутствует. Выберите другой магазин."
-            )
-        if product_quantity.total < item.quantity:
+def get_shortage_message(item, available):
+    """Сообщение о нехватке товара из корзины в выбранном магазине."""
+    if not available:
+        return (
+            f"В выбранном магазине товар {item.product} "
+            f"{item.colorproduct} отсутствует. Выберите другой магазин."
+        )
+    return (
+        f"Недостаточное количество товаров: {item.product}: "
+        f"{item.colorproduct}. В наличии: {available}"
+    )
+
+
+def decrement_cart_stock(carts, shop, user):
+    """
+    Списываем товары из корзины в выбранном магазине.
+    Товары в режиме распродажи списываются в счетчиках Redis,
+    остальные - в БД.
+    Резервы пользователя снимаются перед списанием, поэтому
+    зарезервированный им товар доступен для заказа.
+    Если каких-то товаров не хватает, вызываем ValidationError
+    с сообщением по каждой такой позиции.
+    """
+    released = release_reservations(user_id=user.pk)
+    # Статистику товаров из корзины пересчитывают после списания
+    refresh_stock(released - {item.product_id for item in carts})
+
+    quantities = {item.colorproduct_id: item.quantity for item in carts}
+    flash_sale = {
+        pk: quantities.pop(pk)
+        for pk in get_flash_sale_items(shop.id, quantities)
+    }
+    shortages = {}
+    # Списание в БД откатится вместе с транзакцией, а счетчики Redis
+    # при нехватке или ошибке возвращаем явно
+    with release_holds_on_error() as holds:
+        try:
+            holds.append(decrement_flash_sale_stock(shop.id, flash_sale))
+        except InsufficientStock as error:
+            shortages.update(error.shortages)
+        try:
+            decrement_stock(shop.id, quantities)
+        except InsufficientStock as error:
+            shortages.update(error.shortages)
+        if shortages:
             raise ValidationError(
-                f"Недостаточное количество товаров: {item.product}: \
-                 {item.colorproduct}. В наличии: {product_quantity.total}"
+                [
+                    get_shortage_message(
+                        item, shortages[item.colorproduct_id]
+                    )
+                    for item in carts
+                    if item.colorproduct_id in shortages
+                ]
             )
 
 
-def prepare_order_products(carts, product_quantities, order):
+def get_order_totals(totals):
     """
-    Метод для формирования списка товаров в заказе
-    и списка с новым количеством товаров в магазине.
+    Итоги заказа для сохранения в Order по итогам корзины
+    (CartQueryset.totals).
     """
-    orderproduct = []
-    shop_quantity = []
-    for item in carts:
-        product_quantity = product_quantities.get(item.colorproduct.id, None)
-        orderproduct.append(
-            OrderProduct(
-                order=order,
-                product=item.product,
-                colorproduct=item.colorproduct,
-                price=item.product.actual_price,
-                quantity=item.quantity,
-            )
-        )
+    return {
+        field: totals[field]
+        for field in ("total_quantity", "total_price", "total_saving")
+    }
 
-        # Обновляем наличие товара в выбранном магазину
-        product_quantity.quantity -= item.quantity
-        # Формируем список для bulk_update
-        shop_quantity.append(product_quantity)
 
-    return orderproduct, shop_quantity
+def prepare_order_products(carts, order):
+    """Метод для формирования списка товаров в заказе."""
+    return [
+        OrderProduct(
+            order=order,
+            product=item.product,
+            colorproduct=item.colorproduct,
+            price=item.product.actual_price,
+            quantity=item.quantity,
+        )
+        for item in carts
+    ]
@@ -1,15 +1,25 @@
+import uuid
+
 from django.contrib import messages
 from django.contrib.auth.decorators import login_required
 from django.db import transaction
 from django.forms import ValidationError
-from django.shortcuts import get_object_or_404, redirect, render
+from django.http import Http404, JsonResponse
+from django.shortcuts import redirect, render
+from django.views.decorators.http import require_POST
 
-from main.models import ColorProductShop, Shop
-from orders.forms import CreateOrderForm
-from orders.models import Order, OrderProduct
-from orders.utils import (get_available_products, prepare_order_products,
-                          update_user_info, validate_cart_items)
+from main.models import ProductStats
+from main.page_cache import invalidate_product_pages
+from main.reference import get_retail_shops, get_warehouse
+from orders.forms import CreateOrderForm, ReserveOrderForm
+from orders.models import IdempotencyKey, Order, OrderProduct
+from orders.planner import plan_fulfilment
+from orders.reservations import reserve_cart
+from orders.utils import (decrement_cart_stock, get_order_totals,
+                          get_shortage_message, prepare_order_products,
+                          update_user_info)
 from shopping_cart.models import ShoppingCart
+from shopping_cart.summary import reset_cart_summary
 
 
 @login_required
@@ -26,22 +36,52 @@ def create_order(request):
         "colorproduct",
         "colorproduct__color",
     )
-    shops = Shop.objects.exclude(name__icontains="Склад")
+    lines = list(carts.with_prices())
+    # Итоги корзины одним агрегирующим запросом
+    totals = carts.totals()
+    # Магазины по наличию товаров корзины: матрица наличия
+    # загружается одним запросом
+    plan = plan_fulfilment(
+        lines, [*get_retail_shops(), get_warehouse()], request.user
+    )
     context = {
-        "carts": carts,
+        "carts": lines,
+        "totals": totals,
         "form": form,
-        "shops": shops,
+        "shop_coverage": [
+            coverage for coverage in plan["shops"] if not coverage["delivery"]
+        ],
+        "delivery_coverage": next(
+            (coverage for coverage in plan["shops"] if coverage["delivery"]),
+            None,
+        ),
+        "split": plan["split"],
+        "unavailable": plan["unavailable"],
+        "idempotency_key": uuid.uuid4(),
     }
     if request.method == "POST" and form.is_valid():
         try:
             with transaction.atomic():
                 user = request.user
 
+                # Повторная отправка формы (двойное нажатие, повтор
+                # после обрыва связи) не оформляет заказ еще раз
+                key = form.cleaned_data["idempotency_key"]
+                if key:
+                    record, created = IdempotencyKey.objects.claim(
+                        user, str(key)
+                    )
+                    if not created and record.order_id:
+                        messages.info(
+                            request, f"Заказ № {record.order_id} уже оформлен"
+                        )
+                        return redirect("main:index")
+
                 # Сохраняем данные в модель пользователя,
                 # если этих данных еще нет
                 update_user_info(user=user, cleaned_data=form.cleaned_data)
 
-                if carts.exists():
+                if totals["lines"]:
                     requires_delivery = (
                         form.cleaned_data["requires_delivery"] == "true"
                     )
@@ -49,25 +89,22 @@ def create_order(request):
                         form.cleaned_data["payment_on_get"] == "true"
                     )
                     if requires_delivery:
-                        shop = get_object_or_404(Shop, name__icontains="Склад")
+                        shop = get_warehouse()
+                        if shop is None:
+                            raise Http404(
+                                "Склад интернет-магазина не найден."
+                            )
                     else:
                         shop = form.cleaned_data["shop"]
 
-                    # Проверяем, есть ли товары из корзины пользователя
-                    # в наличии в выбранном магазине
-                    product_quantities = get_available_products(
-                        user=user, shop=shop
-                    )
-                    # Проверяем наличие каждого товара в выбранного магазине
-                    validate_cart_items(carts, product_quantities)
-
-                    # Если проверки успешно прошли, то создаем заказ
+                    # Создаем заказ
                     order_data = {
                         "user": user,
                         "phone": form.cleaned_data["phone"],
                         "requires_delivery": requires_delivery,
                         "shop": shop,
                         "payment_on_get": payment_on_get,
+                        **get_order_totals(totals),
                     }
                     if requires_delivery:
                         order_data["delivery_city"] = form.cleaned_data[
@@ -79,30 +116,71 @@ def create_order(request):
                     order = Order.objects.create(**order_data)
 
                     # Формируем список товаров для этого заказа
-                    # и список нового наличия в магазинах
-                    orderproduct, shop_quantity = prepare_order_products(
-                        carts, product_quantities, order
-                    )
+                    orderproduct = prepare_order_products(carts, order)
 
-                    # Обновляем наличие в магазинах для всех позиций в заказе
-                    ColorProductShop.objects.bulk_update(
-                        shop_quantity, ["quantity"]
-                    )
+                    # Списываем все позиции в выбранном магазине одним
+                    # условным UPDATE: при нехватке товара транзакция
+                    # откатывается
+                    decrement_cart_stock(carts, shop, user)
+                    # UPDATE не вызывает сигналы,
+                    # поэтому пересчитываем статистику товаров явно
+                    ProductStats.objects.refresh(carts.values("product_id"))
+                    invalidate_product_pages(carts.values("product_id"))
 
                     # Создаем записи в БД для всех позиций в заказе
                     OrderProduct.objects.bulk_create(orderproduct)
 
                     # Очищаем корзину пользователя
                     carts.delete()
+                    reset_cart_summary(request)
+
+                    if key:
+                        record.order = order
+                        record.save(update_fields=("order",))
 
                     messages.success(request, "Заказ оформлен")
                     return redirect("main:index")
 
         # Передаем сообщение об ошибке на страницу заказа
         except ValidationError as e:
-            messages.error(request, e.message)
+            for message in e.messages:
+                messages.error(request, message)
             return redirect("order:create_order")
 
     return render(
         request, template_name="orders/create_order.html", context=context
     )
+
+
+@login_required
+@require_POST
+def reserve_order(request):
+    """
+    Резервируем товары корзины в выбранном магазине на время
+    оформления заказа. Возвращает время окончания резерва
+    и сообщения о товарах, которые зарезервировать не удалось.
+    """
+    form = ReserveOrderForm(data=request.POST)
+    if not form.is_valid():
+        return JsonResponse({"errors": form.errors}, status=400)
+    if form.cleaned_data["requires_delivery"] == "true":
+        shop = get_warehouse()
+        if shop is None:
+            raise Http404("Склад интернет-магазина не найден.")
+    else:
+        shop = form.cleaned_data["shop"]
+
+    carts = ShoppingCart.objects.filter(user=request.user).select_related(
+        "product", "colorproduct__color"
+    )
+    expires_at, shortages = reserve_cart(request.user, shop, carts)
+    return JsonResponse(
+        {
+            "expires_at": expires_at,
+            "shortages": [
+                get_shortage_message(item, shortages[item.colorproduct_id])
+                for item in carts
+                if item.colorproduct_id in shortages
+            ],
+        }
+    )
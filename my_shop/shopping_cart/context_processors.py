@@ -0,0 +1,13 @@
+from django.utils.functional import SimpleLazyObject
+
+from shopping_cart.summary import get_cart_summary
+
+
+def cart_summary(request):
+    """
+    Сводка корзины в контексте шаблонов. Запрос выполняется только
+    при первом обращении и не более одного раза за запрос.
+    """
+    return {
+        "cart_summary": SimpleLazyObject(lambda: get_cart_summary(request))
+    }
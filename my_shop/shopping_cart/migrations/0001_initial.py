@@ -0,0 +1,36 @@
+# Generated by Django 3.2.16 on 2026-10-18 15:10
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    initial = True
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('main', '0002_sync_models'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ShoppingCart',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('quantity', models.PositiveSmallIntegerField(verbose_name='Количество')),
+                ('session_key', models.CharField(blank=True, max_length=32, null=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True, verbose_name='Дата добавления')),
+                ('colorproduct', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='shoppingcart', to='main.colorproduct', verbose_name='Товар цвета')),
+                ('product', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='shoppingcart', to='main.product', verbose_name='Товар')),
+                ('user', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='shoppingcart', to=settings.AUTH_USER_MODEL, verbose_name='Пользователь')),
+            ],
+            options={
+                'verbose_name': 'корзина',
+                'verbose_name_plural': 'Корзины',
+                'default_related_name': 'shoppingcart',
+                'unique_together': {('user', 'colorproduct')},
+            },
+        ),
+    ]
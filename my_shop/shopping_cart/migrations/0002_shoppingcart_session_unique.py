@@ -0,0 +1,46 @@
+# Generated by Django 3.2.16 on 2026-10-18 15:11
+
+from django.db import migrations, models
+
+# Повторяющиеся позиции анонимных корзин объединяем в одну,
+# иначе уникальное ограничение не создастся
+MERGE_DUPLICATES_SQL = """
+    WITH merged AS (
+        SELECT
+            MIN(id) AS id,
+            LEAST(SUM(quantity), 32767) AS quantity,
+            session_key,
+            colorproduct_id
+        FROM shopping_cart_shoppingcart
+        WHERE user_id IS NULL
+        GROUP BY session_key, colorproduct_id
+        HAVING COUNT(*) > 1
+    ),
+    updated AS (
+        UPDATE shopping_cart_shoppingcart cart
+        SET quantity = merged.quantity
+        FROM merged
+        WHERE cart.id = merged.id
+    )
+    DELETE FROM shopping_cart_shoppingcart cart
+    USING merged
+    WHERE cart.user_id IS NULL
+        AND cart.session_key = merged.session_key
+        AND cart.colorproduct_id = merged.colorproduct_id
+        AND cart.id <> merged.id
+"""
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('shopping_cart', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.RunSQL(MERGE_DUPLICATES_SQL, migrations.RunSQL.noop),
+        migrations.AddConstraint(
+            model_name='shoppingcart',
+            constraint=models.UniqueConstraint(condition=models.Q(('user__isnull', True)), fields=('session_key', 'colorproduct'), name='shoppingcart_session_colorproduct_uniq'),
+        ),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 3.2.16 on 2026-10-18 15:35
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('shopping_cart', '0002_shoppingcart_session_unique'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='shoppingcart',
+            index=models.Index(fields=['user', '-created_at', 'id'], name='cart_user_created_idx'),
+        ),
+    ]
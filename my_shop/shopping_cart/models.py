@@ -1,22 +1,237 @@
+from decimal import Decimal
+
 from django.contrib.auth import get_user_model
-from django.db import models
+from django.db import connections, models, transaction
+from django.db.models import Count, ExpressionWrapper, F, Q, Sum
+from django.db.models.functions import Coalesce
 
 from main.models import ColorProduct, Product
 
 User = get_user_model()
 
 
+# Тип результата для сумм по корзине и заказам
+MONEY_FIELD = models.DecimalField(max_digits=12, decimal_places=2)
+# Максимальное количество товара в позиции (PositiveSmallIntegerField)
+MAX_QUANTITY = 32767
+
+
 class CartQueryset(models.QuerySet):
     """Переопределяем QuerySet для ShoppingCart."""
 
+    def with_prices(self):
+        """
+        Добавляем стоимость и экономию каждой позиции,
+        посчитанные в БД: line_price и line_saving.
+        """
+        return self.annotate(
+            line_price=ExpressionWrapper(
+                F("quantity") * F("product__actual_price"),
+                output_field=MONEY_FIELD,
+            ),
+            line_saving=ExpressionWrapper(
+                F("quantity")
+                * (F("product__price") - F("product__actual_price")),
+                output_field=MONEY_FIELD,
+            ),
+        )
+
+    def totals(self):
+        """
+        Итоги корзины одним запросом: количество позиций,
+        количество товаров, общая стоимость и экономия.
+        """
+        return (
+            self.order_by()
+            .with_prices()
+            .aggregate(
+                lines=Count("id"),
+                total_quantity=Coalesce(Sum("quantity"), 0),
+                total_price=Coalesce(Sum("line_price"), Decimal(0)),
+                total_saving=Coalesce(Sum("line_saving"), Decimal(0)),
+            )
+        )
+
+    def product_totals(self):
+        """
+        Количество и стоимость по каждому товару одним запросом
+        с группировкой: product_id, product_quantity, price, full_price.
+        """
+        return (
+            self.order_by()
+            .values("product_id")
+            .annotate(
+                product_quantity=Sum("quantity"),
+                price=Sum(
+                    F("quantity") * F("product__actual_price"),
+                    output_field=MONEY_FIELD,
+                ),
+                full_price=Sum(
+                    F("quantity") * F("product__price"),
+                    output_field=MONEY_FIELD,
+                ),
+            )
+        )
+
     def total_price(self):
         """Метод для расчета общей стоимости корзины."""
-        return sum(cart.product_price() for cart in self)
+        return self.totals()["total_price"]
 
     def total_quantity(self):
         """Метод для расчета суммарного количества товаров в корзине."""
-        if self:
-            return sum(cart.quantity for cart in self)
+        return self.totals()["total_quantity"]
+
+    def for_owner(self, user=None, session_key=None):
+        """Корзина пользователя или анонимной сессии."""
+        if user is not None:
+            return self.filter(user=user)
+        return self.filter(user=None, session_key=session_key)
+
+    def add_items(self, quantities, user=None, session_key=None,
+                  replace=False):
+        """
+        Добавляем несколько товаров в корзину одним запросом
+        INSERT ... SELECT ... ON CONFLICT DO UPDATE: для позиций, которые
+        уже есть в корзине, увеличиваем количество (при replace=True -
+        заменяем его). Одновременные добавления не конфликтуют
+        на уникальном ограничении.
+        Принимает словарь {id товара цвета: количество}.
+        Возвращает список (id товара цвета, id позиции, id товара,
+        новое количество); несуществующие товары цвета пропускаются.
+        """
+        if not quantities:
+            return []
+        table = self.model._meta.db_table
+        if user is not None:
+            conflict = "(user_id, colorproduct_id)"
+        else:
+            conflict = "(session_key, colorproduct_id) WHERE user_id IS NULL"
+        if replace:
+            new_quantity = "EXCLUDED.quantity"
+        else:
+            new_quantity = "LEAST(cart.quantity + EXCLUDED.quantity, %s)"
+        sql = f"""
+            INSERT INTO {table} AS cart
+                (user_id, session_key, product_id, colorproduct_id,
+                 quantity, created_at)
+            SELECT %s, %s, cp.product_id, cp.id,
+                LEAST(line.quantity, %s), now()
+            FROM unnest(%s::bigint[], %s::integer[])
+                AS line (colorproduct_id, quantity)
+            JOIN {ColorProduct._meta.db_table} cp
+                ON cp.id = line.colorproduct_id
+            ON CONFLICT {conflict} DO UPDATE SET quantity = {new_quantity}
+            RETURNING colorproduct_id, id, product_id, quantity
+        """
+        params = [
+            user.pk if user is not None else None,
+            None if user is not None else session_key,
+            MAX_QUANTITY,
+            list(quantities),
+            list(quantities.values()),
+        ]
+        if not replace:
+            params.append(MAX_QUANTITY)
+        with connections[self.db].cursor() as cursor:
+            cursor.execute(sql, params)
+            return cursor.fetchall()
+
+    def add_item(self, colorproduct_id, quantity=1, user=None,
+                 session_key=None):
+        """
+        Добавляем один товар в корзину (см. add_items).
+        Возвращает (id позиции, id товара, новое количество)
+        или None, если товара цвета не существует.
+        """
+        rows = self.add_items(
+            {colorproduct_id: quantity}, user=user, session_key=session_key
+        )
+        return rows[0][1:] if rows else None
+
+    def set_items(self, quantities, user=None, session_key=None):
+        """
+        Устанавливаем количество нескольких товаров в корзине:
+        позиции с количеством 0 удаляются одним запросом, остальные
+        добавляются или обновляются одним запросом INSERT ... ON CONFLICT.
+        Принимает словарь {id товара цвета: количество}.
+        """
+        to_delete = [pk for pk, quantity in quantities.items() if not quantity]
+        if to_delete:
+            self.for_owner(user=user, session_key=session_key).filter(
+                colorproduct_id__in=to_delete
+            ).delete()
+        return self.add_items(
+            {pk: quantity for pk, quantity in quantities.items() if quantity},
+            user=user,
+            session_key=session_key,
+            replace=True,
+        )
+
+    def merge_session(self, session_key, user):
+        """
+        Переносим корзину анонимной сессии в корзину пользователя одним
+        запросом: анонимные позиции удаляются и вставляются с user,
+        а для товаров цвета, которые уже есть у пользователя, количество
+        складывается (ON CONFLICT (user, colorproduct) DO UPDATE).
+        Время выполнения не зависит от размера корзины в Python.
+        """
+        table = self.model._meta.db_table
+        sql = f"""
+            WITH anonymous AS (
+                DELETE FROM {table}
+                WHERE user_id IS NULL AND session_key = %s
+                RETURNING product_id, colorproduct_id, quantity
+            )
+            INSERT INTO {table} AS cart
+                (user_id, session_key, product_id, colorproduct_id,
+                 quantity, created_at)
+            SELECT %s, NULL, product_id, colorproduct_id, quantity, now()
+            FROM anonymous
+            ON CONFLICT (user_id, colorproduct_id) DO UPDATE
+                SET quantity = LEAST(cart.quantity + EXCLUDED.quantity, %s)
+        """
+        with connections[self.db].cursor() as cursor:
+            cursor.execute(sql, [session_key, user.pk, MAX_QUANTITY])
+
+    def remove_item(self, colorproduct_id, quantity=1, user=None,
+                    session_key=None):
+        """
+        Уменьшаем количество товара в корзине: UPDATE ... RETURNING
+        блокирует строку, поэтому параллельные уменьшения выполняются
+        по очереди и не теряются; если количество стало равным 0,
+        позиция удаляется вторым запросом в той же транзакции.
+        Возвращает новое количество или 0, если позиция удалена
+        (или ее не было).
+        """
+        table = self.model._meta.db_table
+        if user is not None:
+            owner, owner_param = "user_id = %s", user.pk
+        else:
+            owner = "user_id IS NULL AND session_key = %s"
+            owner_param = session_key
+        with transaction.atomic(using=self.db):
+            with connections[self.db].cursor() as cursor:
+                cursor.execute(
+                    f"""
+                    UPDATE {table}
+                    SET quantity = GREATEST(quantity - %s, 0)
+                    WHERE {owner} AND colorproduct_id = %s
+                    RETURNING quantity
+                    """,
+                    [quantity, owner_param, colorproduct_id],
+                )
+                row = cursor.fetchone()
+                if row is None:
+                    return 0
+                if row[0] > 0:
+                    return row[0]
+                cursor.execute(
+                    f"""
+                    DELETE FROM {table}
+                    WHERE {owner} AND colorproduct_id = %s AND quantity <= 0
+                    """,
+                    [owner_param, colorproduct_id],
+                )
         return 0
 
 
@@ -52,10 +267,28 @@ class ShoppingCart(models.Model):
         verbose_name_plural = "Корзины"
         default_related_name = "shoppingcart"
         unique_together = ("user", "colorproduct")
+        constraints = (
+            # Для анонимных корзин user = NULL, поэтому unique_together
+            # их не ограничивает
+            models.UniqueConstraint(
+                fields=("session_key", "colorproduct"),
+                condition=Q(user__isnull=True),
+                name="shoppingcart_session_colorproduct_uniq",
+            ),
+        )
+        indexes = (
+            # Постраничный вывод корзины пользователя от новых к старым
+            models.Index(
+                fields=("user", "-created_at", "id"),
+                name="cart_user_created_idx",
+            ),
+        )
 
     def __str__(self) -> str:
         return f"Корзина {self.user.username} | Товар {self.product}"
 
     def product_price(self):
         """Метод для возврата стоимости одной позиции в корзине."""
+        if hasattr(self, "line_price"):
+            return self.line_price
         return round(self.product.actual_price * self.quantity, 2)
@@ -0,0 +1,238 @@
+from decimal import Decimal
+
+from django.conf import settings
+
+from main.models import ColorProduct
+from main.utils import get_redis
+from shopping_cart.models import MAX_QUANTITY, ShoppingCart
+
+cart_redis_url = getattr(settings, "CART_REDIS_URL", None)
+anonymous_cart_ttl = getattr(settings, "ANONYMOUS_CART_TTL", 60 * 60 * 24)
+
+
+class DatabaseCart:
+    """Корзина в таблице ShoppingCart (пользователя или анонимной сессии)."""
+
+    def __init__(self, user=None, session_key=None):
+        self.user = user
+        self.session_key = session_key
+        if user is None and session_key is None:
+            self.queryset = ShoppingCart.objects.none()
+        else:
+            self.queryset = ShoppingCart.objects.for_owner(
+                user=user, session_key=session_key
+            )
+
+    def add(self, colorproduct_id, quantity=1):
+        """Добавляем товар, возвращаем False, если его не существует."""
+        item = ShoppingCart.objects.add_item(
+            colorproduct_id,
+            quantity,
+            user=self.user,
+            session_key=self.session_key,
+        )
+        return item is not None
+
+    def remove(self, colorproduct_id, quantity=1):
+        """Уменьшаем количество товара, при нуле удаляем позицию."""
+        ShoppingCart.objects.remove_item(
+            colorproduct_id,
+            quantity,
+            user=self.user,
+            session_key=self.session_key,
+        )
+
+    def delete(self, line_id):
+        """Удаляем позицию по id, возвращаем False, если ее нет."""
+        deleted, _ = self.queryset.filter(id=line_id).delete()
+        return bool(deleted)
+
+    def items(self):
+        """Позиции корзины со стоимостью (line_price, line_saving)."""
+        return self.queryset.with_prices().select_related(
+            "colorproduct", "colorproduct__color", "product"
+        )
+
+    def totals(self):
+        return self.queryset.totals()
+
+    def product_totals(self):
+        return self.queryset.product_totals()
+
+    def clear(self):
+        self.queryset.delete()
+
+
+class RedisCart:
+    """
+    Корзина анонимной сессии в Redis: хэш {id товара цвета: количество}
+    с TTL, который продлевается при каждом изменении. Таблица корзин
+    при этом не используется; цены и названия товаров читаются
+    из каталога одним запросом.
+    Id позиции в такой корзине - id товара цвета.
+    """
+
+    def __init__(self, session_key):
+        self.session_key = session_key
+        self.key = f"cart:{session_key}"
+        self.redis = get_redis(cart_redis_url)
+
+    def lines(self):
+        """Позиции корзины: {id товара цвета: количество}."""
+        if self.session_key is None:
+            return {}
+        return {
+            int(colorproduct_id): int(quantity)
+            for colorproduct_id, quantity in self.redis.hgetall(
+                self.key
+            ).items()
+        }
+
+    def add(self, colorproduct_id, quantity=1):
+        """Добавляем товар, возвращаем False, если его не существует."""
+        if not ColorProduct.objects.filter(id=colorproduct_id).exists():
+            return False
+        pipe = self.redis.pipeline()
+        pipe.hincrby(self.key, colorproduct_id, quantity)
+        pipe.expire(self.key, anonymous_cart_ttl)
+        new_quantity, _ = pipe.execute()
+        if new_quantity > MAX_QUANTITY:
+            self.redis.hset(self.key, colorproduct_id, MAX_QUANTITY)
+        return True
+
+    def remove(self, colorproduct_id, quantity=1):
+        """Уменьшаем количество товара, при нуле удаляем позицию."""
+        if self.session_key is None:
+            return
+
+        def decrement(pipe):
+            current = int(pipe.hget(self.key, colorproduct_id) or 0)
+            pipe.multi()
+            if current > quantity:
+                pipe.hset(self.key, colorproduct_id, current - quantity)
+            else:
+                pipe.hdel(self.key, colorproduct_id)
+            pipe.expire(self.key, anonymous_cart_ttl)
+
+        # Изменение выполняется в транзакции с WATCH ключа корзины
+        self.redis.transaction(decrement, self.key)
+
+    def delete(self, line_id):
+        """Удаляем позицию по id товара цвета."""
+        if self.session_key is None:
+            return False
+        return bool(self.redis.hdel(self.key, line_id))
+
+    def items(self):
+        """
+        Позиции корзины в виде несохраненных объектов ShoppingCart
+        со стоимостью (line_price, line_saving).
+        """
+        if hasattr(self, "_items"):
+            return self._items
+        lines = self.lines()
+        colorproducts = ColorProduct.objects.filter(
+            id__in=lines
+        ).select_related("product", "color")
+        self._items = []
+        for colorproduct in colorproducts:
+            product = colorproduct.product
+            item = ShoppingCart(
+                id=colorproduct.id,
+                product=product,
+                colorproduct=colorproduct,
+                quantity=lines[colorproduct.id],
+                session_key=self.session_key,
+            )
+            item.line_price = product.actual_price * item.quantity
+            item.line_saving = (
+                product.price - product.actual_price
+            ) * item.quantity
+            self._items.append(item)
+        self._items.sort(key=lambda item: item.product.name)
+        return self._items
+
+    def totals(self):
+        items = self.items()
+        return {
+            "lines": len(items),
+            "total_quantity": sum(item.quantity for item in items),
+            "total_price": sum(
+                (item.line_price for item in items), Decimal(0)
+            ),
+            "total_saving": sum(
+                (item.line_saving for item in items), Decimal(0)
+            ),
+        }
+
+    def product_totals(self):
+        """
+        Количество и стоимость по каждому товару
+        (в том же формате, что и CartQueryset.product_totals).
+        """
+        rows = {}
+        for item in self.items():
+            row = rows.setdefault(
+                item.product_id,
+                {
+                    "product_id": item.product_id,
+                    "product_quantity": 0,
+                    "price": Decimal(0),
+                    "full_price": Decimal(0),
+                },
+            )
+            row["product_quantity"] += item.quantity
+            row["price"] += item.line_price
+            row["full_price"] += item.product.price * item.quantity
+        return list(rows.values())
+
+    def clear(self):
+        self.redis.delete(self.key)
+
+    def merge_into(self, user):
+        """
+        Переносим корзину в корзину пользователя в БД одним запросом
+        (количество одинаковых товаров складывается) и удаляем ее из Redis.
+        """
+        lines = self.lines()
+        if lines:
+            ShoppingCart.objects.add_items(lines, user=user)
+            self.clear()
+
+
+def anonymous_carts_in_redis():
+    """Хранятся ли корзины анонимных пользователей в Redis."""
+    return bool(cart_redis_url)
+
+
+def merge_anonymous_cart(session_key, user):
+    """Переносим корзину анонимной сессии в корзину пользователя."""
+    if not session_key:
+        return
+    if anonymous_carts_in_redis():
+        RedisCart(session_key).merge_into(user)
+    else:
+        ShoppingCart.objects.merge_session(session_key, user)
+
+
+def get_cart_owner(request, create_session=False):
+    """
+    Владелец корзины для запроса: {"user": ...} или {"session_key": ...}.
+    Анонимному пользователю при необходимости создаем сессию.
+    """
+    if request.user.is_authenticated:
+        return {"user": request.user}
+    if create_session and not request.session.session_key:
+        request.session.create()
+    return {"session_key": request.session.session_key}
+
+
+def get_cart(request, create_session=False):
+    """
+    Корзина текущего запроса: авторизованного пользователя - в БД,
+    анонимного - в Redis или в БД (в зависимости от CART_REDIS_URL).
+    """
+    owner = get_cart_owner(request, create_session=create_session)
+    if "session_key" in owner and anonymous_carts_in_redis():
+        return RedisCart(owner["session_key"])
+    return DatabaseCart(**owner)
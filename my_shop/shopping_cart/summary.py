@@ -0,0 +1,107 @@
+import time
+from decimal import Decimal
+
+from django.conf import settings
+
+from shopping_cart.storage import get_cart
+
+# Время хранения сводки корзины в сессии (в секундах), 0 - не хранить
+session_cache_timeout = getattr(settings, "CART_SUMMARY_SESSION_TIMEOUT", 0)
+
+SESSION_KEY = "cart_summary"
+
+
+class CartSummary:
+    """
+    Сводка корзины текущего пользователя: количество товаров,
+    количество каждого товара и суммы. Для корзины в БД считается
+    одним запросом с группировкой по товару.
+    """
+
+    def __init__(self, quantities=None, total_price=0, total_full_price=0):
+        # {id товара: количество в корзине}
+        self.quantities = quantities or {}
+        self.total_price = Decimal(total_price)
+        self.total_full_price = Decimal(total_full_price)
+
+    @classmethod
+    def load(cls, rows):
+        """
+        Считаем сводку по количеству и стоимости товаров
+        (результат product_totals() хранилища корзины).
+        """
+        summary = cls()
+        for row in rows:
+            summary.quantities[row["product_id"]] = row["product_quantity"]
+            summary.total_price += row["price"]
+            summary.total_full_price += row["full_price"]
+        return summary
+
+    @property
+    def count(self):
+        """Общее количество товаров в корзине."""
+        return sum(self.quantities.values())
+
+    @property
+    def total_saving(self):
+        """Экономия за счет скидок."""
+        return self.total_full_price - self.total_price
+
+    def to_dict(self):
+        """Представление для хранения в сессии (JSON)."""
+        return {
+            "quantities": {
+                str(pk): quantity for pk, quantity in self.quantities.items()
+            },
+            "total_price": str(self.total_price),
+            "total_full_price": str(self.total_full_price),
+        }
+
+    @classmethod
+    def from_dict(cls, data):
+        return cls(
+            quantities={
+                int(pk): quantity
+                for pk, quantity in data["quantities"].items()
+            },
+            total_price=data["total_price"],
+            total_full_price=data["total_full_price"],
+        )
+
+
+def get_cart_summary(request):
+    """
+    Сводка корзины для запроса. Считается не более одного раза
+    за запрос, а при включенном CART_SUMMARY_SESSION_TIMEOUT
+    дополнительно хранится в сессии.
+    """
+    summary = getattr(request, "_cart_summary", None)
+    if summary is not None:
+        return summary
+
+    if session_cache_timeout and request.session.session_key:
+        cached = request.session.get(SESSION_KEY)
+        # После входа сессия сохраняет данные, поэтому сверяем пользователя
+        if (
+            cached
+            and cached["user"] == request.user.pk
+            and cached["expires"] > time.time()
+        ):
+            summary = CartSummary.from_dict(cached["summary"])
+    if summary is None:
+        summary = CartSummary.load(get_cart(request).product_totals())
+        if session_cache_timeout and request.session.session_key:
+            request.session[SESSION_KEY] = {
+                "summary": summary.to_dict(),
+                "user": request.user.pk,
+                "expires": time.time() + session_cache_timeout,
+            }
+
+    request._cart_summary = summary
+    return summary
+
+
+def reset_cart_summary(request):
+    """Сбрасываем сводку после изменения корзины."""
+    request.__dict__.pop("_cart_summary", None)
+    request.session.pop(SESSION_KEY, None)
@@ -1,6 +1,6 @@
 from django import template
 
-from shopping_cart.models import ShoppingCart
+from shopping_cart.summary import get_cart_summary
 
 register = template.Library()
 
@@ -8,18 +8,7 @@ register = template.Library()
 @register.simple_tag
 def product_count(request):
     """Метод для передачи количества товаров в корзине."""
-    if request.user.is_authenticated:
-        cart = ShoppingCart.objects.filter(user=request.user)
-    else:
-        if request.session.session_key:
-            cart = ShoppingCart.objects.filter(
-                session_key=request.session.session_key
-            )
-        else:
-            return 0
-    if cart.exists():
-        return cart.total_quantity()
-    return 0
+    return get_cart_summary(request).count
 
 
 @register.simple_tag
@@ -30,23 +19,7 @@ def products_in_user_shopping_carts(request):
     есть ли конкретный товар в корзине пользователя
     и отображения количества товара в корзине
     """
-    users_shopping_carts = ShoppingCart.objects.all().select_related(
-        "colorproduct", "product"
-    )
-    # Для авторизированного пользователя фильтруем по user
-    if request.user.is_authenticated:
-        users_shopping_carts = users_shopping_carts.filter(user=request.user)
-    # Для анонимного пользователя фильтруем по session_key
-    else:
-        users_shopping_carts = users_shopping_carts.filter(
-            session_key=request.session.session_key
-        )
-    # Формируем словарь {id_товара: количество_в_корзине, ...}
-    result = {}
-    for cart in users_shopping_carts:
-        result[cart.product.id] = cart.quantity
-
-    return result
+    return get_cart_summary(request).quantities
 
 
 @register.filter
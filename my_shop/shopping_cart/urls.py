@@ -6,6 +6,7 @@ app_name = "cart"
 
 urlpatterns = [
     path("cart/", views.show_cart, name="cart"),
+    path("cart/summary/", views.cart_summary, name="cart_summary"),
     path("cart_add/", views.cart_add, name="cart_add"),
     path(
         "cart_change/<int:colorproduct_id>/",
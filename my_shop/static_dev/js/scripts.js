@@ -52,3 +52,22 @@ document.addEventListener("DOMContentLoaded", function() {
     });
 });
 
+// Скрипт для подгрузки данных корзины на страницы из кэша
+document.addEventListener("DOMContentLoaded", function() {
+    const badge = document.getElementById('cart-count');
+    if (!badge || !badge.dataset.summaryUrl) {
+        return;
+    }
+
+    fetch(badge.dataset.summaryUrl, {credentials: 'same-origin'})
+        .then(response => response.json())
+        .then(summary => {
+            badge.textContent = summary.count;
+            // Показываем отметку "Товар уже в корзине" в карточках
+            summary.products.forEach(productId => {
+                document.querySelectorAll(`[data-in-cart="${productId}"]`).forEach(element => {
+                    element.classList.remove('d-none');
+                });
+            });
+        });
+});
@@ -0,0 +1,40 @@
+import fakeredis
+import pytest
+
+from main.models import (Category, Color, ColorProduct, ColorProductShop,
+                         Country, Manufacturer, Product, Shop)
+from orders import flash_sale
+
+
+@pytest.fixture
+def redis(monkeypatch):
+    """Redis распродажи в памяти процесса (fakeredis)."""
+    client = fakeredis.FakeRedis(decode_responses=True)
+    client.flushall()
+    monkeypatch.setattr(flash_sale, "flash_sale_redis_url", "fakeredis://")
+    monkeypatch.setattr(flash_sale, "get_flash_sale_redis", lambda: client)
+    return client
+
+
+@pytest.fixture
+def stock_row(db):
+    """Остаток товара цвета в магазине."""
+    country = Country.objects.create(name="Страна")
+    product = Product.objects.create(
+        name="Товар",
+        description="Описание",
+        price=100,
+        category=Category.objects.create(
+            name="Категория", description="Описание", slug="category"
+        ),
+        manufacturer=Manufacturer.objects.create(
+            name="Производитель", country=country, slug="manufacturer"
+        ),
+    )
+    colorproduct = ColorProduct.objects.create(
+        product=product, color=Color.objects.create(name="Цвет")
+    )
+    shop = Shop.objects.create(name="Магазин", address="Адрес")
+    return ColorProductShop.objects.create(
+        colorproduct=colorproduct, shop=shop, quantity=10
+    )
@@ -0,0 +1,77 @@
+import runpy
+
+import pytest
+from django.core.cache import caches
+from fakeredis import FakeConnection
+
+from main import utils
+from main.models import Category
+from main.reference import ReferenceData
+
+# Общий кэш Redis (соединения fakeredis с одним адресом - один сервер)
+SHARED_CACHES = {
+    "default": {
+        "BACKEND": "django_redis.cache.RedisCache",
+        "LOCATION": "redis://redis:6379/1",
+        "OPTIONS": {
+            "CONNECTION_POOL_KWARGS": {"connection_class": FakeConnection},
+        },
+    }
+}
+
+
+def test_shared_cache_is_default(monkeypatch):
+    monkeypatch.delenv("CACHE_LOCATION", raising=False)
+    config = runpy.run_module("my_shop.settings")
+    assert (
+        config["CACHES"]["default"]["BACKEND"]
+        == "django_redis.cache.RedisCache"
+    )
+    assert config["CACHE_VERSION_TIMEOUT"] is None
+
+
+def test_local_cache_versions_expire(monkeypatch):
+    monkeypatch.setenv("CACHE_LOCATION", "")
+    config = runpy.run_module("my_shop.settings")
+    assert "CACHES" not in config
+    assert config["CACHE_VERSION_TIMEOUT"]
+
+
+@pytest.fixture
+def workers(settings):
+    """Два независимых клиента общего кэша, как в разных воркерах."""
+    settings.CACHES = SHARED_CACHES
+    worker_a = caches.create_connection("default")
+    worker_b = caches.create_connection("default")
+    worker_a.clear()
+    return worker_a, worker_b
+
+
+def test_version_bump_is_seen_by_other_client(workers, monkeypatch):
+    worker_a, worker_b = workers
+    monkeypatch.setattr(utils, "cache", worker_a)
+    (version,) = utils.get_cache_versions(["test_version"])
+    utils.bump_cache_version("test_version")
+
+    monkeypatch.setattr(utils, "cache", worker_b)
+    assert utils.get_cache_versions(["test_version"]) == [version + 1]
+
+
+@pytest.mark.django_db
+def test_reference_reloads_after_change_in_other_worker(
+    workers, monkeypatch, django_capture_on_commit_callbacks
+):
+    worker_a, worker_b = workers
+    reference = ReferenceData(Category)
+    monkeypatch.setattr(utils, "cache", worker_b)
+    assert reference.all() == ()
+
+    # Справочник меняется в другом воркере (сигнал увеличивает версию)
+    monkeypatch.setattr(utils, "cache", worker_a)
+    with django_capture_on_commit_callbacks(execute=True):
+        category = Category.objects.create(
+            name="Дрели", description="Дрели", slug="drills"
+        )
+
+    monkeypatch.setattr(utils, "cache", worker_b)
+    assert reference.all() == (category,)
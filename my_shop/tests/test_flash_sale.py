@@ -0,0 +1,207 @@
+import threading
+
+import pytest
+from django.db import DatabaseError, transaction
+
+from orders import flash_sale
+from orders.stock import InsufficientStock
+
+SHOP_ID = 1
+
+
+def set_stock(redis, stock):
+    redis.hset(
+        flash_sale.STOCK_KEY,
+        mapping={
+            flash_sale.get_field(SHOP_ID, pk): quantity
+            for pk, quantity in stock.items()
+        },
+    )
+
+
+def get_stock(redis, pk):
+    return int(
+        redis.hget(flash_sale.STOCK_KEY, flash_sale.get_field(SHOP_ID, pk))
+    )
+
+
+def test_decrement_is_all_or_nothing(redis):
+    set_stock(redis, {1: 5, 2: 1})
+    with pytest.raises(InsufficientStock) as error:
+        flash_sale.decrement_flash_sale_stock(SHOP_ID, {1: 2, 2: 2})
+    assert error.value.shortages == {2: 1}
+    assert get_stock(redis, 1) == 5
+    assert get_stock(redis, 2) == 1
+    assert not redis.zcard(flash_sale.HOLDS_KEY)
+
+
+def test_decrement_never_goes_below_zero(redis):
+    set_stock(redis, {1: 5})
+    sold = []
+
+    def buy():
+        try:
+            flash_sale.FlashSaleHold(SHOP_ID, {1: 1}).acquire()
+        except InsufficientStock:
+            return
+        sold.append(1)
+
+    threads = [threading.Thread(target=buy) for _ in range(20)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert len(sold) == 5
+    assert get_stock(redis, 1) == 0
+    assert redis.zcard(flash_sale.HOLDS_KEY) == 5
+
+
+@pytest.mark.django_db
+def test_commit_records_sold(redis, django_capture_on_commit_callbacks):
+    set_stock(redis, {1: 5})
+    with django_capture_on_commit_callbacks(execute=True):
+        with transaction.atomic():
+            flash_sale.decrement_flash_sale_stock(SHOP_ID, {1: 2})
+    assert get_stock(redis, 1) == 3
+    assert redis.hgetall(flash_sale.SOLD_KEY) == {
+        flash_sale.get_field(SHOP_ID, 1): "2"
+    }
+    assert not redis.zcard(flash_sale.HOLDS_KEY)
+
+
+@pytest.mark.django_db
+def test_error_in_transaction_restores_stock(
+    redis, django_capture_on_commit_callbacks
+):
+    set_stock(redis, {1: 5})
+    with django_capture_on_commit_callbacks(execute=True):
+        with pytest.raises(DatabaseError):
+            with transaction.atomic():
+                with flash_sale.release_holds_on_error() as holds:
+                    holds.append(
+                        flash_sale.decrement_flash_sale_stock(
+                            SHOP_ID, {1: 2}
+                        )
+                    )
+                    raise DatabaseError
+    assert get_stock(redis, 1) == 5
+    assert not redis.exists(flash_sale.SOLD_KEY)
+    assert not redis.zcard(flash_sale.HOLDS_KEY)
+
+
+@pytest.mark.django_db
+def test_rolled_back_hold_is_released_after_timeout(
+    redis, monkeypatch, django_capture_on_commit_callbacks
+):
+    set_stock(redis, {1: 5})
+    monkeypatch.setattr(flash_sale, "flash_sale_hold_timeout", -1)
+    with django_capture_on_commit_callbacks(execute=True) as callbacks:
+        with pytest.raises(DatabaseError):
+            with transaction.atomic():
+                flash_sale.decrement_flash_sale_stock(SHOP_ID, {1: 2})
+                raise DatabaseError
+    assert not callbacks
+    assert get_stock(redis, 1) == 3
+    assert flash_sale.release_expired_holds() == 1
+    assert get_stock(redis, 1) == 5
+    assert not redis.exists(flash_sale.SOLD_KEY)
+
+
+def test_late_commit_decrements_released_hold_again(redis):
+    set_stock(redis, {1: 5})
+    hold = flash_sale.FlashSaleHold(SHOP_ID, {1: 2})
+    hold.acquire()
+    flash_sale.release_holds([hold.token])
+    assert get_stock(redis, 1) == 5
+    hold.commit()
+    assert get_stock(redis, 1) == 3
+    assert redis.hgetall(flash_sale.SOLD_KEY) == {
+        flash_sale.get_field(SHOP_ID, 1): "2"
+    }
+    assert not flash_sale.get_oversold()
+
+
+def test_late_commit_records_oversold_instead_of_negative_stock(redis):
+    set_stock(redis, {1: 5})
+    hold = flash_sale.FlashSaleHold(SHOP_ID, {1: 2})
+    hold.acquire()
+    flash_sale.release_holds([hold.token])
+    # Возвращенный товар успели купить другие покупатели
+    flash_sale.FlashSaleHold(SHOP_ID, {1: 4}).acquire()
+    hold.commit()
+    assert get_stock(redis, 1) == 0
+    assert redis.hgetall(flash_sale.SOLD_KEY) == {
+        flash_sale.get_field(SHOP_ID, 1): "2"
+    }
+    assert flash_sale.get_oversold() == {(SHOP_ID, 1): 1}
+
+
+def test_flush_deletes_run_key_after_commit(
+    redis, stock_row, django_capture_on_commit_callbacks
+):
+    redis.hset(
+        flash_sale.SOLD_KEY,
+        flash_sale.get_field(stock_row.shop_id, stock_row.colorproduct_id),
+        4,
+    )
+    with django_capture_on_commit_callbacks() as callbacks:
+        product_ids = flash_sale.flush_flash_sales()
+        # До фиксации проданное хранится в ключе запуска
+        assert not redis.exists(flash_sale.SOLD_KEY)
+        (key,) = redis.zrange(flash_sale.FLUSHES_KEY, 0, -1)
+        assert redis.exists(key)
+    for callback in callbacks:
+        callback()
+    stock_row.refresh_from_db()
+    assert stock_row.quantity == 6
+    assert product_ids == {stock_row.colorproduct.product_id}
+    assert not redis.exists(key)
+    assert not redis.zcard(flash_sale.FLUSHES_KEY)
+
+
+def test_failed_flush_returns_sold(redis, stock_row, monkeypatch):
+    field = flash_sale.get_field(
+        stock_row.shop_id, stock_row.colorproduct_id
+    )
+    redis.hset(flash_sale.SOLD_KEY, field, 4)
+
+    class BrokenConnections:
+        def __getitem__(self, alias):
+            raise DatabaseError
+
+    monkeypatch.setattr(flash_sale, "connections", BrokenConnections())
+    with pytest.raises(DatabaseError):
+        flash_sale.flush_flash_sales()
+    stock_row.refresh_from_db()
+    assert stock_row.quantity == 10
+    assert redis.hgetall(flash_sale.SOLD_KEY) == {field: "4"}
+    assert not redis.zcard(flash_sale.FLUSHES_KEY)
+
+
+def test_restart_keeps_active_counters(redis, stock_row):
+    shop_id, pk = stock_row.shop_id, stock_row.colorproduct_id
+    assert flash_sale.start_flash_sale(shop_id, [pk]) == 1
+    flash_sale.FlashSaleHold(shop_id, {pk: 3}).acquire()
+    # Повторный запуск не возвращает в счетчик списанный товар
+    assert flash_sale.start_flash_sale(shop_id, [pk]) == 0
+    assert flash_sale.get_flash_sale_stock([(shop_id, pk)]) == {
+        (shop_id, pk): 7
+    }
+
+
+def test_start_skips_items_waiting_for_flush(redis, stock_row):
+    shop_id, pk = stock_row.shop_id, stock_row.colorproduct_id
+    redis.hset(flash_sale.SOLD_KEY, flash_sale.get_field(shop_id, pk), 4)
+    assert flash_sale.start_flash_sale(shop_id, [pk]) == 0
+    assert not flash_sale.get_flash_sale_items(shop_id, [pk])
+
+
+def test_start_skips_items_with_pending_holds(redis, stock_row):
+    shop_id, pk = stock_row.shop_id, stock_row.colorproduct_id
+    flash_sale.start_flash_sale(shop_id, [pk])
+    hold = flash_sale.FlashSaleHold(shop_id, {pk: 3})
+    hold.acquire()
+    flash_sale.stop_flash_sale(shop_id, [pk])
+    assert flash_sale.start_flash_sale(shop_id, [pk]) == 0
+    hold.release()
+    assert flash_sale.start_flash_sale(shop_id, [pk]) == 1
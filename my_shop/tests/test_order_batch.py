@@ -0,0 +1,84 @@
+import pytest
+from django.contrib.auth import get_user_model
+from django.contrib.auth.models import Group
+from django.db import DatabaseError
+from rest_framework.test import APIClient
+
+from main.reference import shops
+from orders import batch, flash_sale
+from orders.models import Order
+
+URL = "/api/order/batch/"
+
+
+def get_client(**fields):
+    user = get_user_model().objects.create_user(
+        username="partner", password="password", **fields
+    )
+    client = APIClient()
+    client.force_authenticate(user)
+    return client, user
+
+
+def get_payload(stock_row, quantity=2):
+    return {
+        "orders": [
+            {
+                "phone": "+79990000000",
+                "requires_delivery": False,
+                "shop": stock_row.shop_id,
+                "items": [
+                    {
+                        "colorproduct": stock_row.colorproduct_id,
+                        "quantity": quantity,
+                    }
+                ],
+            }
+        ]
+    }
+
+
+@pytest.fixture
+def shop_reference(stock_row):
+    # Справочник магазинов сбрасывается после фиксации транзакции,
+    # а тест выполняется в транзакции
+    shops.invalidate()
+    return stock_row
+
+
+def test_batch_is_forbidden_for_customers(shop_reference):
+    client, _ = get_client()
+    response = client.post(URL, get_payload(shop_reference), format="json")
+    assert response.status_code == 403
+    assert not Order.objects.exists()
+
+
+def test_partner_creates_orders(shop_reference):
+    client, user = get_client()
+    user.groups.add(Group.objects.create(name="partners"))
+    response = client.post(URL, get_payload(shop_reference), format="json")
+    assert response.status_code == 200
+    assert response.data["results"][0]["status"] == "created"
+    shop_reference.refresh_from_db()
+    assert shop_reference.quantity == 8
+
+
+def test_failed_batch_restores_flash_sale_stock(
+    shop_reference, redis, monkeypatch
+):
+    client, _ = get_client(is_staff=True)
+    flash_sale.start_flash_sale(
+        shop_reference.shop_id, [shop_reference.colorproduct_id]
+    )
+
+    def subtract_stock(sold):
+        raise DatabaseError
+
+    monkeypatch.setattr(batch, "subtract_stock", subtract_stock)
+    with pytest.raises(DatabaseError):
+        client.post(URL, get_payload(shop_reference), format="json")
+    assert flash_sale.get_flash_sale_stock(
+        [(shop_reference.shop_id, shop_reference.colorproduct_id)]
+    ) == {(shop_reference.shop_id, shop_reference.colorproduct_id): 10}
+    assert not redis.zcard(flash_sale.HOLDS_KEY)
+    assert not Order.objects.exists()
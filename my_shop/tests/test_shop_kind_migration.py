@@ -0,0 +1,33 @@
+import pytest
+from django.db import connection
+from django.db.migrations.executor import MigrationExecutor
+
+BEFORE = [("main", "0005_product_stats_version")]
+AFTER = [("main", "0006_shop_kind")]
+
+
+def migrate(targets):
+    """Применяем миграции до targets и возвращаем состояние моделей."""
+    executor = MigrationExecutor(connection)
+    executor.migrate(targets)
+    return executor.loader.project_state(targets).apps
+
+
+@pytest.mark.django_db(transaction=True)
+def test_existing_warehouse_gets_warehouse_kind():
+    apps = migrate(BEFORE)
+    Shop = apps.get_model("main", "Shop")
+    warehouse = Shop.objects.create(
+        name="Склад интернет-магазина", address="ул. Складская, 1"
+    )
+    retail = Shop.objects.create(
+        name="Москва ул. Ленина", address="ул. Ленина, 1"
+    )
+    try:
+        apps = migrate(AFTER)
+        Shop = apps.get_model("main", "Shop")
+        assert Shop.objects.get(pk=warehouse.pk).kind == "warehouse"
+        assert Shop.objects.get(pk=retail.pk).kind == "retail"
+    finally:
+        executor = MigrationExecutor(connection)
+        migrate(executor.loader.graph.leaf_nodes())
@@ -0,0 +1,24 @@
+# Generated by Django 3.2.16 on 2026-10-18 15:10
+
+from django.db import migrations, models
+import users.validators
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='myuser',
+            name='city',
+            field=models.TextField(blank=True, max_length=30, null=True, verbose_name='Город'),
+        ),
+        migrations.AlterField(
+            model_name='myuser',
+            name='phone',
+            field=models.CharField(blank=True, max_length=15, null=True, validators=[users.validators.validate_phone_number], verbose_name='Телефон'),
+        ),
+    ]
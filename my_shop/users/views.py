@@ -5,7 +5,7 @@ from django.shortcuts import redirect, render
 from django.urls import reverse_lazy
 from django.views.generic import CreateView, UpdateView
 
-from shopping_cart.models import ShoppingCart
+from shopping_cart.storage import merge_anonymous_cart
 from users.forms import (CodeVerificationForm, CustomUserCreationForm,
                          CustomUserUpdateForm, EmailVerificationForm)
 from users.tasks import send_email_task
@@ -102,52 +102,9 @@ class UserLoginView(LoginView):
     """
 
     def form_valid(self, form):
-        session_key = self.request.session.session_key
-        user = form.get_user()
-        if session_key:
-            # Проверяем, нет ли в корзине залогиненного пользователя
-            # тех же товаров, что были у анонимного
-            # если есть, то увеличиваем их количество
-            anon_cart_items = ShoppingCart.objects.filter(
-                session_key=session_key
-            ).select_related("product")
-            user_cart_items = ShoppingCart.objects.filter(
-                user=user
-            ).select_related("product")
-
-            # Обрабатываем данные так, чтобы избежать
-            # множества обращений к БД в цикле
-            anonim_item_quantities = {
-                item.product: [item.quantity, item] for item in anon_cart_items
-            }
-            user_item_quantities = {
-                item.product: [item.quantity, item] for item in user_cart_items
-            }
-
-            to_update_quantity = []
-            to_update_user = []
-
-            for product, info in anonim_item_quantities.items():
-                if product in user_item_quantities:
-                    user_item = user_item_quantities[product][1]
-                    user_item.quantity += info[0]
-                    to_update_quantity.append(user_item)
-                else:
-                    info[1].user = user
-                    to_update_user.append(info[1])
-
-            if to_update_quantity:
-                ShoppingCart.objects.bulk_update(
-                    to_update_quantity, ["quantity"]
-                )
-            if to_update_user:
-                ShoppingCart.objects.bulk_update(to_update_user, ["user"])
-
-            # Удаляем корзины анонимного пользователя, которые остались
-            # после добавления quantity к корзинам
-            # залогиненного пользователя
-            ShoppingCart.objects.filter(
-                session_key=session_key, user=None
-            ).delete()
-
+        # Переносим корзину одним запросом: одинаковые товары цвета
+        # складываются, остальные позиции переходят пользователю
+        merge_anonymous_cart(
+            self.request.session.session_key, form.get_user()
+        )
         return super().form_valid(form)